@@ -2,12 +2,41 @@
 Additional API routes for expense management system
 """
 
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, request, jsonify, session, Response, stream_with_context, send_file
 from database import db
-from models import Company, User, ApprovalRule, RuleStep, ExpenseApproval, Expense
+from models import Company, User, ApprovalRule, RuleStep, ExpenseApproval, Expense, EmailOutbox, Receipt, Budget
 from werkzeug.security import generate_password_hash
+from password_hashing import hash_passwords
 from email_service import email_service
-import requests
+from email_outbox import email_outbox, job_status
+from exchange_rates import exchange_rates
+from http_client import http_client
+from fx_history import fx_rates
+from reference_data import reference_data
+from perf_monitor import perf_monitor
+from dashboard_cache import dashboard_counters
+from rule_engine import rule_engine
+from identity import get_current_user
+from org_hierarchy import org_hierarchy
+from spend_rollups import spend_rollups
+from budgets import budget_tracker, BudgetError
+from approval_workflow import approval_workflow, WorkflowError
+from approval_inbox import approval_inbox
+from event_stream import event_hub, expense_event_data, MANAGER_ROLES
+from decimal import Decimal
+import csv
+import io
+import json
+import os
+from datetime import datetime
+from sqlalchemy import select, func, or_, and_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+from receipt_storage import receipt_store, ReceiptStorageError
+from expense_import import expense_importer, ExpenseImportError
+from pagination import encode_cursor, decode_cursor, parse_limit, PaginationError
+from serializers import (expense_serializer, user_serializer, rule_serializer, rule_step_serializer,
+                         budget_serializer, json_response)
 
 api_bp = Blueprint('api', __name__, url_prefix='/api')
 
@@ -21,20 +50,9 @@ def manage_companies():
         
         data = request.get_json()
         
-        # Get currency from REST Countries API to validate
-        try:
-            response = requests.get('https://restcountries.com/v3.1/all?fields=currencies')
-            countries_data = response.json()
-            
-            valid_currencies = set()
-            for country in countries_data:
-                country_currencies = country.get('currencies', {})
-                valid_currencies.update(country_currencies.keys())
-            
-            if data['base_currency_code'] not in valid_currencies:
-                return jsonify({'error': 'Invalid currency code'}), 400
-        except:
-            pass  # Skip validation if API is down
+        # Validate against the preindexed REST Countries currency codes
+        if not reference_data.is_valid_currency(data['base_currency_code']):
+            return jsonify({'error': 'Invalid currency code'}), 400
         
         company = Company(
             name=data['name'],
@@ -83,7 +101,10 @@ def manage_users():
         )
         
         db.session.add(user)
+        db.session.flush()
+        org_hierarchy.add_users([user.id])
         db.session.commit()
+        rule_engine.invalidate_roles(user.company_id)
         
         return jsonify({
             'message': 'User created successfully',
@@ -92,22 +113,18 @@ def manage_users():
     
     else:
         # Get users based on role
-        current_user = User.query.get(session['user_id'])
+        current_user = get_current_user()
         
         if current_user.role == 'Admin':
-            users = User.query.filter_by(company_id=current_user.company_id).all()
+            condition = User.company_id == current_user.company_id
         elif current_user.role == 'Manager':
-            users = User.query.filter_by(manager_id=current_user.id).all()
-            users.append(current_user)  # Include self
+            condition = or_(User.manager_id == current_user.id, User.id == current_user.id)  # Include self
         else:
-            users = [current_user]  # Only self
+            condition = User.id == current_user.id  # Only self
         
-        return jsonify([{
-            'id': u.id,
-            'email': u.email,
-            'role': u.role,
-            'manager_id': u.manager_id
-        } for u in users])
+        serializer = user_serializer.only(('id', 'email', 'role', 'manager_id'))
+        rows = db.session.execute(select(*serializer.columns).where(condition).order_by(User.id)).all()
+        return json_response(serializer.dump_all(rows))
 
 # Approval Rules Management
 @api_bp.route('/approval-rules', methods=['GET', 'POST'])
@@ -145,6 +162,7 @@ def manage_approval_rules():
             db.session.add(step)
         
         db.session.commit()
+        rule_engine.invalidate()
         
         return jsonify({
             'message': 'Approval rule created successfully',
@@ -152,29 +170,20 @@ def manage_approval_rules():
         }), 201
     
     else:
-        rules = ApprovalRule.query.all()
-        result = []
-        
-        for rule in rules:
-            steps = [{
-                'id': s.id,
-                'user_id': s.user_id,
-                'role_type': s.role_type,
-                'is_required_approver': s.is_required_approver,
-                'sequence_order': s.sequence_order
-            } for s in rule.rule_steps]
-            
-            result.append({
-                'id': rule.id,
-                'name': rule.name,
-                'applies_to_category': rule.applies_to_category,
-                'is_manager_first': rule.is_manager_first,
-                'is_sequential': rule.is_sequential,
-                'min_approval_percentage': float(rule.min_approval_percentage),
-                'steps': steps
-            })
+        # Rules and all their steps in two column-only queries
+        serializer = rule_serializer.only((
+            'id', 'name', 'applies_to_category', 'is_manager_first', 'is_sequential', 'min_approval_percentage'
+        ))
+        step_serializer = rule_step_serializer.only(('id', 'user_id', 'role_type', 'is_required_approver', 'sequence_order'))
         
-        return result
+        result = serializer.dump_all(db.session.execute(select(*serializer.columns).order_by(ApprovalRule.id)))
+        steps = {rule['id']: [] for rule in result}
+        for row in db.session.execute(select(*step_serializer.columns, RuleStep.rule_id).order_by(RuleStep.id)):
+            steps.setdefault(row.rule_id, []).append(step_serializer.dump(row))
+        for rule in result:
+            rule['steps'] = steps[rule['id']]
+        
+        return json_response(result)
 
 # Expense Categories API
 @api_bp.route('/expense-categories', methods=['GET'])
@@ -197,78 +206,13 @@ def get_expense_categories():
 @api_bp.route('/countries', methods=['GET'])
 def get_countries_with_currencies():
     """Get list of countries with their currencies"""
-    try:
-        response = requests.get('https://restcountries.com/v3.1/all?fields=name,currencies')
-        data = response.json()
-        
-        countries = []
-        for country in data:
-            country_name = country.get('name', {}).get('common', '')
-            country_currencies = country.get('currencies', {})
-            
-            currency_list = []
-            for currency_code, currency_data in country_currencies.items():
-                currency_list.append({
-                    'code': currency_code,
-                    'name': currency_data.get('name', ''),
-                    'symbol': currency_data.get('symbol', '')
-                })
-            
-            if country_name and currency_list:
-                countries.append({
-                    'name': country_name,
-                    'currencies': currency_list
-                })
-        
-        # Sort by country name
-        countries.sort(key=lambda x: x['name'])
-        return jsonify(countries)
-    except Exception as e:
-        return jsonify({'error': f'Failed to fetch countries data: {str(e)}'}), 500
+    return reference_data.countries_response(request)
 
 # Currency API
 @api_bp.route('/currencies', methods=['GET'])
 def get_currencies():
-    """Get list of supported currencies from REST Countries API"""
-    try:
-        response = requests.get('https://restcountries.com/v3.1/all?fields=name,currencies')
-        data = response.json()
-        
-        currencies = set()
-        currency_info = []
-        
-        for country in data:
-            country_name = country.get('name', {}).get('common', '')
-            country_currencies = country.get('currencies', {})
-            
-            for currency_code, currency_data in country_currencies.items():
-                if currency_code not in currencies:
-                    currencies.add(currency_code)
-                    currency_info.append({
-                        'code': currency_code,
-                        'name': currency_data.get('name', ''),
-                        'symbol': currency_data.get('symbol', ''),
-                        'country_example': country_name
-                    })
-        
-        # Sort by currency code
-        currency_info.sort(key=lambda x: x['code'])
-        return jsonify(currency_info)
-    except Exception as e:
-        # Fallback list of common currencies with basic info
-        fallback_currencies = [
-            {'code': 'USD', 'name': 'United States Dollar', 'symbol': '$', 'country_example': 'United States'},
-            {'code': 'EUR', 'name': 'Euro', 'symbol': '€', 'country_example': 'European Union'},
-            {'code': 'GBP', 'name': 'British Pound Sterling', 'symbol': '£', 'country_example': 'United Kingdom'},
-            {'code': 'JPY', 'name': 'Japanese Yen', 'symbol': '¥', 'country_example': 'Japan'},
-            {'code': 'AUD', 'name': 'Australian Dollar', 'symbol': 'A$', 'country_example': 'Australia'},
-            {'code': 'CAD', 'name': 'Canadian Dollar', 'symbol': 'C$', 'country_example': 'Canada'},
-            {'code': 'CHF', 'name': 'Swiss Franc', 'symbol': 'Fr', 'country_example': 'Switzerland'},
-            {'code': 'CNY', 'name': 'Chinese Yuan', 'symbol': '¥', 'country_example': 'China'},
-            {'code': 'INR', 'name': 'Indian Rupee', 'symbol': '₹', 'country_example': 'India'},
-            {'code': 'SGD', 'name': 'Singapore Dollar', 'symbol': 'S$', 'country_example': 'Singapore'}
-        ]
-        return jsonify(fallback_currencies)
+    """Get list of supported currencies from REST Countries data"""
+    return reference_data.currencies_response(request)
 
 # Exchange Rate API
 @api_bp.route('/exchange-rate', methods=['GET'])
@@ -280,125 +224,383 @@ def get_exchange_rate():
     if not from_currency or not to_currency:
         return jsonify({'error': 'Missing currency parameters'}), 400
     
-    try:
-        response = requests.get(f'https://api.exchangerate-api.com/v4/latest/{from_currency}')
-        data = response.json()
-        rate = data['rates'].get(to_currency)
-        
-        if rate:
-            return jsonify({
-                'from': from_currency,
-                'to': to_currency,
-                'rate': rate,
-                'date': data['date']
-            })
-        else:
-            return jsonify({'error': 'Currency not found'}), 404
-    except:
+    table = exchange_rates.get_table(from_currency.upper())
+    if table is None:
         return jsonify({'error': 'Unable to fetch exchange rate'}), 500
+    
+    date, rates = table
+    rate = rates.get(to_currency.upper())
+    
+    if rate:
+        return jsonify({
+            'from': from_currency,
+            'to': to_currency,
+            'rate': rate,
+            'date': date
+        })
+    else:
+        return jsonify({'error': 'Currency not found'}), 404
+
+@api_bp.route('/admin/exchange-rates/stats', methods=['GET'])
+def exchange_rate_stats():
+    """Exchange rate cache hit/miss counters"""
+    if session.get('user_role') != 'Admin':
+        return jsonify({'error': 'Unauthorized - Admin access required'}), 403
+    
+    return jsonify(exchange_rates.stats())
+
+@api_bp.route('/admin/http-stats', methods=['GET'])
+def outbound_http_stats():
+    """Per-host latency, error and circuit breaker state for outbound HTTP calls"""
+    if session.get('user_role') != 'Admin':
+        return jsonify({'error': 'Unauthorized - Admin access required'}), 403
+    
+    return jsonify(http_client.stats())
 
 # Expense Reports API
+def _parse_report_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+def expense_report_conditions(current_user, args):
+    """Build the role scoping and filter conditions shared by the report endpoints"""
+    conditions = []
+    
+    if current_user.role == 'Employee':
+        conditions.append(Expense.user_id == current_user.id)
+    elif current_user.role == 'Manager':
+        # Manager can see their own expenses and those of everyone under them, at any depth
+        conditions.append(Expense.user_id.in_(org_hierarchy.descendant_ids(current_user.id)))
+    # Admin can see all expenses (no additional filter needed)
+    
+    # Apply filters
+    if args.get('start_date'):
+        conditions.append(Expense.date >= _parse_report_date(args['start_date']))
+    if args.get('end_date'):
+        conditions.append(Expense.date <= _parse_report_date(args['end_date']))
+    if args.get('status'):
+        conditions.append(Expense.status == args['status'])
+    if args.get('user_id') and current_user.role in ['Admin', 'Manager']:
+        conditions.append(Expense.user_id == int(args['user_id']))
+    
+    return conditions
+
+def list_expenses(user, args):
+    """One page of the user's expenses, newest first, keyed on (created_at, id)
+    
+    Filters: ``status`` (comma-separated), ``category``, ``start_date``/``end_date``.
+    ``fields`` limits both the response and the SQL select list; the total is
+    only counted with ``include_total=true``.
+    """
+    try:
+        fields = [f.strip() for f in args.get('fields', '').split(',') if f.strip()]
+        serializer = expense_serializer.only(fields) if fields else expense_serializer
+        
+        conditions = [Expense.user_id == user.id]
+        if args.get('status'):
+            conditions.append(Expense.status.in_(args['status'].split(',')))
+        if args.get('category'):
+            conditions.append(Expense.category == args['category'])
+        if args.get('start_date'):
+            conditions.append(Expense.date >= _parse_report_date(args['start_date']))
+        if args.get('end_date'):
+            conditions.append(Expense.date <= _parse_report_date(args['end_date']))
+        
+        limit = parse_limit(args.get('limit'))
+        cursor = args.get('cursor')
+        after = decode_cursor(cursor, 2) if cursor else None
+    except (ValueError, PaginationError) as e:
+        return jsonify({'error': f'Invalid parameter: {str(e)}'}), 400
+    
+    query = select(
+        *serializer.columns,
+        Expense.created_at.label('_created_at'),
+        Expense.id.label('_id')
+    ).where(*conditions)
+    if after:
+        after_created, after_id = after
+        query = query.where(or_(
+            Expense.created_at < after_created,
+            and_(Expense.created_at == after_created, Expense.id < after_id)
+        ))
+    
+    rows = db.session.execute(
+        query.order_by(Expense.created_at.desc(), Expense.id.desc()).limit(limit + 1)
+    ).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    
+    response = {
+        'expenses': serializer.dump_all(rows),
+        'next_cursor': encode_cursor(rows[-1]._created_at, rows[-1]._id) if has_more else None
+    }
+    if args.get('include_total', '').lower() in ('1', 'true', 'yes'):
+        response['total_count'] = db.session.execute(
+            select(func.count(Expense.id)).where(*conditions)
+        ).scalar()
+    return json_response(response)
+
+REPORT_SERIALIZER = expense_serializer.only((
+    'id', 'category', 'description', 'date', 'amount_spent', 'currency_spent', 'status', 'final_amount_base_currency'
+)).extend(user_email=User.email)
+
 @api_bp.route('/reports/expenses', methods=['GET'])
 def expense_reports():
     """Generate expense reports"""
     if 'user_id' not in session:
         return jsonify({'error': 'Unauthorized'}), 401
     
-    current_user = User.query.get(session['user_id'])
+    current_user = get_current_user()
     
-    # Parameters
-    start_date = request.args.get('start_date')
-    end_date = request.args.get('end_date')
-    status = request.args.get('status')
-    user_id = request.args.get('user_id')
-    
-    # Build query based on user role
-    query = Expense.query
+    try:
+        conditions = expense_report_conditions(current_user, request.args)
+        limit = parse_limit(request.args.get('limit'), default=500)
+        cursor = request.args.get('cursor')
+        after = decode_cursor(cursor, 2) if cursor else None
+    except (ValueError, PaginationError) as e:
+        return jsonify({'error': f'Invalid parameter: {str(e)}'}), 400
     
-    if current_user.role == 'Employee':
-        query = query.filter_by(user_id=current_user.id)
-    elif current_user.role == 'Manager':
-        # Manager can see their expenses and their subordinates'
-        subordinate_ids = [u.id for u in current_user.subordinates]
-        subordinate_ids.append(current_user.id)
-        query = query.filter(Expense.user_id.in_(subordinate_ids))
-    # Admin can see all expenses (no additional filter needed)
+    # Summary over the whole filtered set, aggregated in SQL
+    summary_rows = db.session.query(
+        Expense.status,
+        func.count(Expense.id),
+        func.coalesce(func.sum(Expense.final_amount_base_currency), 0)
+    ).filter(*conditions).group_by(Expense.status).all()
     
-    # Apply filters
-    if start_date:
-        query = query.filter(Expense.date >= start_date)
-    if end_date:
-        query = query.filter(Expense.date <= end_date)
-    if status:
-        query = query.filter(Expense.status == status)
-    if user_id and current_user.role in ['Admin', 'Manager']:
-        query = query.filter(Expense.user_id == user_id)
-    
-    expenses = query.all()
-    
-    # Calculate totals
-    total_amount = sum(float(e.final_amount_base_currency or 0) for e in expenses)
-    total_count = len(expenses)
-    
-    # Group by status
+    total_count = 0
+    total_amount = Decimal('0')
     status_summary = {}
-    for expense in expenses:
-        status = expense.status
-        if status not in status_summary:
-            status_summary[status] = {'count': 0, 'amount': 0}
-        status_summary[status]['count'] += 1
-        status_summary[status]['amount'] += float(expense.final_amount_base_currency or 0)
+    for status, count, amount in summary_rows:
+        amount = Decimal(str(amount))
+        total_count += count
+        total_amount += amount
+        status_summary[status] = {'count': count, 'amount': str(amount)}
     
-    return jsonify({
-        'expenses': [{
-            'id': e.id,
-            'user_email': e.user.email,
-            'category': e.category,
-            'description': e.description,
-            'date': e.date.isoformat(),
-            'amount_spent': float(e.amount_spent),
-            'currency_spent': e.currency_spent,
-            'status': e.status,
-            'final_amount_base_currency': float(e.final_amount_base_currency or 0)
-        } for e in expenses],
+    # One page of rows, newest first, keyed on (date, id)
+    query = db.session.query(*REPORT_SERIALIZER.columns).join(User, Expense.user_id == User.id).filter(*conditions)
+    
+    if after:
+        after_date, after_id = after
+        query = query.filter(or_(
+            Expense.date < after_date,
+            and_(Expense.date == after_date, Expense.id < after_id)
+        ))
+    
+    rows = query.order_by(Expense.date.desc(), Expense.id.desc()).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = encode_cursor(rows[-1].date, rows[-1].id) if has_more else None
+    
+    return json_response({
+        'expenses': REPORT_SERIALIZER.dump_all(rows),
         'summary': {
             'total_count': total_count,
-            'total_amount': total_amount,
+            'total_amount': str(total_amount),
             'currency': current_user.company.base_currency_code,
             'status_breakdown': status_summary
-        }
+        },
+        'next_cursor': next_cursor
+    })
+
+EXPORT_COLUMNS = ['id', 'user_email', 'category', 'description', 'date', 'amount_spent',
+                  'currency_spent', 'status', 'final_amount_base_currency']
+
+@api_bp.route('/reports/expenses/export', methods=['GET'])
+def export_expense_report():
+    """Stream the expense report as CSV or NDJSON"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    current_user = get_current_user()
+    
+    export_format = request.args.get('format', 'csv')
+    if export_format not in ['csv', 'ndjson']:
+        return jsonify({'error': 'format must be csv or ndjson'}), 400
+    
+    try:
+        conditions = expense_report_conditions(current_user, request.args)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid parameter: {str(e)}'}), 400
+    
+    # Server-side cursor: rows are fetched from the database in batches as they are sent
+    statement = select(
+        Expense.id,
+        User.email,
+        Expense.category,
+        Expense.description,
+        Expense.date,
+        Expense.amount_spent,
+        Expense.currency_spent,
+        Expense.status,
+        Expense.final_amount_base_currency
+    ).join(User, Expense.user_id == User.id).where(*conditions).order_by(
+        Expense.date.desc(), Expense.id.desc()
+    ).execution_options(stream_results=True, yield_per=1000)
+    
+    def export_values(row):
+        return [
+            row.id,
+            row.email,
+            row.category,
+            row.description or '',
+            row.date.isoformat(),
+            str(row.amount_spent),
+            row.currency_spent,
+            row.status,
+            str(row.final_amount_base_currency) if row.final_amount_base_currency is not None else ''
+        ]
+    
+    def generate_csv():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_COLUMNS)
+        yield buffer.getvalue()
+        
+        result = db.session.execute(statement)
+        try:
+            for partition in result.partitions():
+                buffer.seek(0)
+                buffer.truncate(0)
+                writer.writerows(export_values(row) for row in partition)
+                yield buffer.getvalue()
+        finally:
+            result.close()
+    
+    def generate_ndjson():
+        result = db.session.execute(statement)
+        try:
+            for partition in result.partitions():
+                yield ''.join(
+                    json.dumps(dict(zip(EXPORT_COLUMNS, export_values(row))), ensure_ascii=False) + '\n'
+                    for row in partition
+                )
+        finally:
+            result.close()
+    
+    if export_format == 'csv':
+        generator, mimetype = generate_csv, 'text/csv'
+    else:
+        generator, mimetype = generate_ndjson, 'application/x-ndjson'
+    
+    response = Response(stream_with_context(generator()), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename=expenses.{export_format}'
+    return response
+
+# Spend Analytics API
+@api_bp.route('/analytics/spend', methods=['GET'])
+def spend_analytics():
+    """Expense totals grouped by user, category, currency, status, day, month or year
+    
+    Served from the ``spend_rollups`` table, so any date range costs the
+    same few pre-aggregated rows. Scoped like the reports: employees see
+    their own spend, managers everyone under them, admins their company.
+    """
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    current_user = get_current_user()
+    args = request.args
+    
+    try:
+        group_by = [name.strip() for name in args.get('group_by', 'category').split(',') if name.strip()]
+        start_date = _parse_report_date(args['start_date']) if args.get('start_date') else None
+        end_date = _parse_report_date(args['end_date']) if args.get('end_date') else None
+        
+        user_ids = None
+        if current_user.role == 'Employee':
+            user_ids = [current_user.id]
+        elif current_user.role == 'Manager':
+            user_ids = org_hierarchy.descendant_ids(current_user.id)
+        if args.get('user_id') and current_user.role in ['Admin', 'Manager']:
+            user_id = int(args['user_id'])
+            if current_user.role == 'Manager' and not org_hierarchy.is_under(user_id, current_user.id):
+                return jsonify({'error': 'Access denied'}), 403
+            user_ids = [user_id]
+        
+        groups, totals, truncated = spend_rollups.query(
+            current_user.company_id, group_by,
+            start_date=start_date,
+            end_date=end_date,
+            user_ids=user_ids,
+            statuses=args['status'].split(',') if args.get('status') else None,
+            categories=args['category'].split(',') if args.get('category') else None
+        )
+    except ValueError as e:
+        return jsonify({'error': f'Invalid parameter: {str(e)}'}), 400
+    
+    return json_response({
+        'group_by': group_by,
+        'currency': current_user.company.base_currency_code,
+        'groups': groups,
+        'totals': totals,
+        'truncated': truncated
     })
 
 # Pending Approvals API
 @api_bp.route('/approvals/pending', methods=['GET'])
 def pending_approvals():
-    """Get pending approvals for current user"""
+    """Get pending approvals for current user
+    
+    Pages through the approver inbox with ``limit``/``cursor``. With
+    ``since`` (the ``server_time`` of a previous response) it instead returns
+    items opened or closed since then, so the page can be kept current by
+    polling; items may repeat across polls and should be keyed by expense_id.
+    """
     if 'user_id' not in session:
         return jsonify({'error': 'Unauthorized'}), 401
     
-    approvals = ExpenseApproval.query.filter_by(
-        approver_user_id=session['user_id'],
-        status='Pending'
-    ).all()
+    try:
+        limit = parse_limit(request.args.get('limit'), default=50, maximum=500)
+        cursor = request.args.get('cursor')
+        after = decode_cursor(cursor, 2) if cursor else None
+        since = request.args.get('since')
+        since = datetime.fromisoformat(since) if since else None
+    except (ValueError, PaginationError) as e:
+        return jsonify({'error': str(e)}), 400
     
-    result = []
-    for approval in approvals:
-        expense = approval.expense
-        result.append({
-            'approval_id': approval.id,
-            'expense_id': expense.id,
-            'submitter': expense.user.email,
-            'category': expense.category,
-            'description': expense.description,
-            'date': expense.date.isoformat(),
-            'amount': float(expense.final_amount_base_currency),
-            'currency': expense.user.company.base_currency_code,
-            'submitted_date': expense.created_at.isoformat()
-        })
+    server_time = datetime.utcnow()
+    if since is None:
+        items = approval_inbox.page(session['user_id'], limit, after)
+        sort_key = lambda item: (item.created_at, item.id)
+    else:
+        items = approval_inbox.changes(session['user_id'], since, limit, after)
+        sort_key = lambda item: (item.updated_at, item.id)
+    
+    has_more = len(items) > limit
+    items = items[:limit]
+    
+    return jsonify({
+        'items': [approval_inbox.serialize(item) for item in items],
+        'next_cursor': encode_cursor(*sort_key(items[-1])) if has_more else None,
+        'server_time': server_time.isoformat()
+    })
+
+# Live updates
+@api_bp.route('/events', methods=['GET'])
+def event_stream():
+    """Server-Sent Events stream of expense submit/approve/reject deltas"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    user = get_current_user()
+    if not user:
+        return jsonify({'error': 'Unauthorized'}), 401
+    user_id, company_id, role = user.id, user.company_id, user.role
+    db.session.close()  # Don't hold a pooled connection for the life of the stream
+    
+    if event_hub.at_capacity():
+        return jsonify({'error': 'Too many open event streams'}), 503
     
-    return jsonify(result)
+    response = Response(event_hub.stream(user_id, company_id, role), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Stop nginx from buffering the stream
+    return response
 
 # Approval Rules Management APIs
+ADMIN_RULE_SERIALIZER = rule_serializer.only((
+    'id', 'name', 'is_manager_first', 'is_sequential', 'min_approval_percentage', 'created_at'
+)).extend(description=ApprovalRule.name)
+RULE_APPROVER_SERIALIZER = user_serializer.only(('id', 'name', 'role')).extend(sequence=RuleStep.sequence_order)
+
 @api_bp.route('/admin/approval-rules', methods=['GET', 'POST'])
 def admin_manage_approval_rules():
     # Check admin access
@@ -439,6 +641,7 @@ def admin_manage_approval_rules():
                 db.session.add(rule_step)
             
             db.session.commit()
+            rule_engine.invalidate()
             
             return jsonify({
                 'success': True,
@@ -452,37 +655,21 @@ def admin_manage_approval_rules():
     
     else:  # GET request
         try:
-            # Get all approval rules with their steps
-            rules = db.session.query(ApprovalRule).all()
-            
-            rules_data = []
-            for rule in rules:
-                # Get approvers for this rule
-                approvers = []
-                for step in rule.rule_steps:
-                    if step.user:
-                        approvers.append({
-                            'id': step.user.id,
-                            'name': step.user.name,
-                            'role': step.user.role,
-                            'sequence': step.sequence_order
-                        })
-                
-                # Sort approvers by sequence
-                approvers.sort(key=lambda x: x['sequence'])
-                
-                rules_data.append({
-                    'id': rule.id,
-                    'name': rule.name,
-                    'description': rule.name,
-                    'is_manager_first': rule.is_manager_first,
-                    'is_sequential': rule.is_sequential,
-                    'min_approval_percentage': float(rule.min_approval_percentage),
-                    'approvers': approvers,
-                    'created_at': rule.created_at.isoformat()
-                })
+            # Get all approval rules, then every user approver joined to their step, sorted by sequence
+            rules_data = ADMIN_RULE_SERIALIZER.dump_all(
+                db.session.execute(select(*ADMIN_RULE_SERIALIZER.columns).order_by(ApprovalRule.id))
+            )
+            approvers = {rule['id']: [] for rule in rules_data}
+            for row in db.session.execute(
+                select(*RULE_APPROVER_SERIALIZER.columns, RuleStep.rule_id)
+                .join(User, RuleStep.user_id == User.id)
+                .order_by(RuleStep.sequence_order, RuleStep.id)
+            ):
+                approvers.setdefault(row.rule_id, []).append(RULE_APPROVER_SERIALIZER.dump(row))
+            for rule in rules_data:
+                rule['approvers'] = approvers[rule['id']]
             
-            return jsonify({
+            return json_response({
                 'success': True,
                 'rules': rules_data
             })
@@ -526,6 +713,7 @@ def manage_approval_rule(rule_id):
                     db.session.add(rule_step)
             
             db.session.commit()
+            rule_engine.invalidate()
             
             return jsonify({
                 'success': True,
@@ -544,6 +732,7 @@ def manage_approval_rule(rule_id):
             # Delete the rule
             db.session.delete(rule)
             db.session.commit()
+            rule_engine.invalidate()
             
             return jsonify({
                 'success': True,
@@ -554,6 +743,102 @@ def manage_approval_rule(rule_id):
             db.session.rollback()
             return jsonify({'error': f'Failed to delete approval rule: {str(e)}'}), 500
 
+@api_bp.route('/admin/budgets', methods=['GET', 'POST'])
+def admin_manage_budgets():
+    """List the company's budgets with current-period spend, or create one"""
+    if session.get('user_role') != 'Admin':
+        return jsonify({'error': 'Unauthorized - Admin access required'}), 403
+    
+    current_user = get_current_user()
+    
+    if request.method == 'POST':
+        try:
+            values = budget_tracker.validate(request.get_json() or {})
+            if values.get('user_id') and not User.query.filter_by(
+                id=values['user_id'], company_id=current_user.company_id
+            ).first():
+                return jsonify({'error': 'User not found'}), 404
+            
+            budget = Budget(company_id=current_user.company_id, **values)
+            db.session.add(budget)
+            db.session.commit()
+            budget_tracker.invalidate(current_user.company_id)
+            
+            return jsonify({
+                'success': True,
+                'message': 'Budget created successfully',
+                'budget_id': budget.id
+            }), 201
+            
+        except (BudgetError, ValueError) as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), getattr(e, 'status_code', 400)
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'error': f'Failed to create budget: {str(e)}'}), 500
+    
+    else:  # GET request
+        budgets = budget_serializer.dump_all(db.session.execute(
+            select(*budget_serializer.columns)
+            .where(Budget.company_id == current_user.company_id)
+            .order_by(Budget.id)
+        ))
+        usage = budget_tracker.usage(current_user.company_id)
+        for budget in budgets:
+            period_start, spent = usage.get(budget['id'], (None, Decimal('0')))
+            budget['period_start'] = period_start
+            budget['spent'] = spent
+        
+        return json_response({
+            'success': True,
+            'currency': current_user.company.base_currency_code,
+            'budgets': budgets
+        })
+
+@api_bp.route('/admin/budgets/<int:budget_id>', methods=['PUT', 'DELETE'])
+def manage_budget(budget_id):
+    if session.get('user_role') != 'Admin':
+        return jsonify({'error': 'Unauthorized - Admin access required'}), 403
+    
+    current_user = get_current_user()
+    budget = Budget.query.filter_by(id=budget_id, company_id=current_user.company_id).first()
+    if not budget:
+        return jsonify({'error': 'Budget not found'}), 404
+    
+    try:
+        if request.method == 'PUT':
+            values = budget_tracker.validate(request.get_json() or {}, partial=True)
+            if values.get('user_id') and not User.query.filter_by(
+                id=values['user_id'], company_id=current_user.company_id
+            ).first():
+                return jsonify({'error': 'User not found'}), 404
+            for key, value in values.items():
+                setattr(budget, key, value)
+            message = 'Budget updated successfully'
+        else:  # DELETE request
+            db.session.delete(budget)
+            message = 'Budget deleted successfully'
+        
+        db.session.commit()
+        budget_tracker.invalidate(current_user.company_id)
+        
+        return jsonify({'success': True, 'message': message})
+        
+    except (BudgetError, ValueError) as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), getattr(e, 'status_code', 400)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Failed to update budget: {str(e)}'}), 500
+
+@api_bp.route('/admin/budgets/reconcile', methods=['POST'])
+def reconcile_budgets():
+    """Re-read this process's budget counters from SQL and report any drift"""
+    if session.get('user_role') != 'Admin':
+        return jsonify({'error': 'Unauthorized - Admin access required'}), 403
+    
+    return jsonify(budget_tracker.reconcile())
+
 @api_bp.route('/admin/users/<int:user_id>/send-password', methods=['POST'])
 def send_password_reset(user_id):
     """Generate new password and send it to user's email"""
@@ -561,7 +846,7 @@ def send_password_reset(user_id):
         return jsonify({'error': 'Unauthorized'}), 401
     
     # Check if current user is admin
-    current_user = User.query.get(session['user_id'])
+    current_user = get_current_user()
     if not current_user or current_user.role != 'Admin':
         return jsonify({'error': 'Admin access required'}), 403
     
@@ -576,32 +861,210 @@ def send_password_reset(user_id):
         
         # Update user's password in database
         user.password_hash = generate_password_hash(new_password)
-        db.session.commit()
-        
-        # Send email with new password
-        success, message = email_service.send_password_reset_email(
-            user.email, 
-            user.name, 
-            new_password
-        )
         
-        if success:
-            return jsonify({
-                'success': True,
-                'message': f'New password sent to {user.email}'
-            })
-        else:
-            # If email fails, we still keep the password change but inform admin
+        if not email_service.is_configured():
+            db.session.commit()
+            print(f"⚠️ Email not configured. Password for {user.name}: {new_password}")
+            # Return password since it cannot be emailed
             return jsonify({
                 'success': True,
-                'message': f'Password updated but email failed: {message}. New password: {new_password}',
-                'password': new_password  # Return password if email fails
+                'message': f'Password updated but email is not configured. New password: {new_password}',
+                'password': new_password
             })
+        
+        # Queue the email in the same transaction as the password change
+        subject, text_content, html_content = email_service.build_password_reset_email(
+            user.email,
+            user.name,
+            new_password
+        )
+        job = email_outbox.enqueue(user.email, subject, text_content, html_content)
+        db.session.commit()
+        job_id = job.id
+        email_outbox.notify()
+        
+        return jsonify({
+            'success': True,
+            'message': f'New password email queued for {user.email}',
+            'job_id': job_id,
+            'status': 'Queued'
+        }), 202
             
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': f'Failed to reset password: {str(e)}'}), 500
 
+@api_bp.route('/admin/email-jobs/<int:job_id>', methods=['GET'])
+def email_job_status(job_id):
+    """Delivery status of a queued email"""
+    if session.get('user_role') != 'Admin':
+        return jsonify({'error': 'Unauthorized - Admin access required'}), 403
+    
+    job = db.session.get(EmailOutbox, job_id)
+    if not job:
+        return jsonify({'error': 'Email job not found'}), 404
+    
+    return jsonify(job_status(job))
+
+BULK_USER_LIMIT = 1000
+VALID_ROLES = ['Admin', 'Manager', 'Employee']
+
+def _bulk_admin():
+    """Return the current admin user, or an error response tuple"""
+    if 'user_id' not in session:
+        return None, (jsonify({'error': 'Unauthorized'}), 401)
+    current_user = get_current_user()
+    if not current_user or current_user.role != 'Admin':
+        return None, (jsonify({'error': 'Admin access required'}), 403)
+    return current_user, None
+
+@api_bp.route('/admin/users/bulk', methods=['POST'])
+def bulk_create_users():
+    """Create many users in one transaction and queue their welcome emails"""
+    current_user, error = _bulk_admin()
+    if error:
+        return error
+    
+    data = request.get_json() or {}
+    rows = data.get('users') or []
+    if not isinstance(rows, list) or not rows:
+        return jsonify({'error': 'users must be a non-empty list'}), 400
+    if len(rows) > BULK_USER_LIMIT:
+        return jsonify({'error': f'At most {BULK_USER_LIMIT} users per request'}), 400
+    
+    send_email = data.get('send_email', True) and email_service.is_configured()
+    
+    # Look up every email and manager id referenced by the batch in one query each
+    emails = [str(row.get('email') or '').strip() for row in rows]
+    existing_emails = {e for (e,) in db.session.query(User.email).filter(
+        User.email.in_([e for e in emails if e])
+    )}
+    manager_ids = {row.get('manager_id') for row in rows if row.get('manager_id')}
+    valid_manager_ids = {m for (m,) in db.session.query(User.id).filter(
+        User.id.in_(manager_ids), User.company_id == current_user.company_id
+    )} if manager_ids else set()
+    
+    results = [None] * len(rows)
+    accepted = []  # (index, row, email, password)
+    seen = set()
+    for index, (row, email) in enumerate(zip(rows, emails)):
+        if not row.get('name') or not email:
+            results[index] = {'index': index, 'success': False, 'error': 'Name and email are required'}
+        elif email in existing_emails or email in seen:
+            results[index] = {'index': index, 'email': email, 'success': False, 'error': 'Email already exists'}
+        elif row.get('role', 'Employee') not in VALID_ROLES:
+            results[index] = {'index': index, 'email': email, 'success': False, 'error': 'Invalid role'}
+        elif row.get('manager_id') and row['manager_id'] not in valid_manager_ids:
+            results[index] = {'index': index, 'email': email, 'success': False, 'error': 'Invalid manager_id'}
+        else:
+            seen.add(email)
+            password = row.get('password') or email_service.generate_random_password()
+            accepted.append((index, row, email, password))
+    
+    try:
+        password_hashes = hash_passwords(password for _, _, _, password in accepted)
+        
+        new_users = []
+        for (index, row, email, password), password_hash in zip(accepted, password_hashes):
+            new_users.append(User(
+                name=row['name'],
+                company_id=current_user.company_id,
+                email=email,
+                password_hash=password_hash,
+                role=row.get('role', 'Employee'),
+                manager_id=row.get('manager_id') or None
+            ))
+        db.session.add_all(new_users)
+        db.session.flush()  # Assign ids
+        org_hierarchy.add_users([new_user.id for new_user in new_users])
+        
+        jobs = []
+        for (index, row, email, password), new_user in zip(accepted, new_users):
+            result = {'index': index, 'email': email, 'success': True, 'user_id': new_user.id}
+            if send_email and not row.get('password'):
+                subject, text_content, html_content = email_service.build_welcome_email(email, new_user.name, password)
+                jobs.append((result, email_outbox.enqueue(email, subject, text_content, html_content)))
+            elif not row.get('password'):
+                result['password'] = password  # Cannot be emailed
+            results[index] = result
+        
+        db.session.flush()
+        for result, job in jobs:
+            result['email_job_id'] = job.id
+        db.session.commit()
+        rule_engine.invalidate_roles(current_user.company_id)
+        if jobs:
+            email_outbox.notify()
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Failed to create users: {str(e)}'}), 500
+    
+    return jsonify({
+        'success': True,
+        'created': len(accepted),
+        'failed': len(rows) - len(accepted),
+        'results': results
+    }), 201
+
+@api_bp.route('/admin/users/bulk-send-password', methods=['POST'])
+def bulk_send_password_reset():
+    """Reset passwords for many users and queue all reset emails together"""
+    current_user, error = _bulk_admin()
+    if error:
+        return error
+    
+    data = request.get_json() or {}
+    user_ids = data.get('user_ids') or []
+    if not isinstance(user_ids, list) or not user_ids:
+        return jsonify({'error': 'user_ids must be a non-empty list'}), 400
+    if len(user_ids) > BULK_USER_LIMIT:
+        return jsonify({'error': f'At most {BULK_USER_LIMIT} users per request'}), 400
+    
+    send_email = email_service.is_configured()
+    users = {u.id: u for u in User.query.filter(
+        User.id.in_(user_ids), User.company_id == current_user.company_id
+    )}
+    
+    targets = [users[user_id] for user_id in dict.fromkeys(user_ids) if user_id in users]
+    results = {user_id: {'user_id': user_id, 'success': False, 'error': 'User not found'}
+               for user_id in user_ids if user_id not in users}
+    
+    try:
+        passwords = [email_service.generate_random_password() for _ in targets]
+        password_hashes = hash_passwords(passwords)
+        
+        jobs = []
+        for user, password, password_hash in zip(targets, passwords, password_hashes):
+            user.password_hash = password_hash
+            result = {'user_id': user.id, 'email': user.email, 'success': True}
+            if send_email:
+                subject, text_content, html_content = email_service.build_password_reset_email(
+                    user.email, user.name, password
+                )
+                jobs.append((result, email_outbox.enqueue(user.email, subject, text_content, html_content)))
+            else:
+                result['password'] = password  # Cannot be emailed
+            results[user.id] = result
+        
+        db.session.flush()
+        for result, job in jobs:
+            result['email_job_id'] = job.id
+        db.session.commit()
+        if jobs:
+            email_outbox.notify()
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Failed to reset passwords: {str(e)}'}), 500
+    
+    return jsonify({
+        'success': True,
+        'reset': len(targets),
+        'failed': len(results) - len(targets),
+        'results': [results[user_id] for user_id in dict.fromkeys(user_ids)]
+    })
+
 @api_bp.route('/admin/test-email', methods=['POST'])
 def test_email_configuration():
     """Test email configuration"""
@@ -609,7 +1072,7 @@ def test_email_configuration():
         return jsonify({'error': 'Unauthorized'}), 401
     
     # Check if current user is admin
-    current_user = User.query.get(session['user_id'])
+    current_user = get_current_user()
     if not current_user or current_user.role != 'Admin':
         return jsonify({'error': 'Admin access required'}), 403
     
@@ -620,6 +1083,22 @@ def test_email_configuration():
         'message': message
     })
 
+@api_bp.route('/admin/perf', methods=['GET', 'DELETE'])
+def performance_summary():
+    """Per-endpoint query counts, DB time percentiles, slow statements and N+1 patterns"""
+    if session.get('user_role') != 'Admin':
+        return jsonify({'error': 'Unauthorized - Admin access required'}), 403
+    
+    if request.method == 'DELETE':
+        perf_monitor.reset()
+        return jsonify({'success': True, 'message': 'Performance statistics reset'})
+    
+    return jsonify({
+        'slow_query_ms': perf_monitor.slow_query_ms,
+        'n_plus_one_threshold': perf_monitor.n_plus_one_threshold,
+        'endpoints': perf_monitor.summary()
+    })
+
 # Employee Expense Management APIs
 @api_bp.route('/expenses', methods=['GET', 'POST'])
 def manage_expenses():
@@ -627,31 +1106,12 @@ def manage_expenses():
     if 'user_id' not in session:
         return jsonify({'error': 'Unauthorized'}), 401
     
-    user = User.query.get(session['user_id'])
+    user = get_current_user()
     if not user:
         return jsonify({'error': 'User not found'}), 404
     
     if request.method == 'GET':
-        # Get user's expenses
-        expenses = Expense.query.filter_by(user_id=user.id).order_by(Expense.created_at.desc()).all()
-        
-        expense_data = []
-        for expense in expenses:
-            expense_data.append({
-                'id': expense.id,
-                'category': expense.category,
-                'description': expense.description,
-                'amount_spent': float(expense.amount_spent),
-                'currency_spent': expense.currency_spent,
-                'final_amount_base_currency': float(expense.final_amount_base_currency),
-                'date': expense.date.isoformat(),
-                'status': expense.status,
-                'receipt_url': expense.receipt_url,
-                'created_at': expense.created_at.isoformat() if expense.created_at else None,
-                'comments': expense.comments
-            })
-        
-        return jsonify(expense_data)
+        return list_expenses(user, request.args)
     
     elif request.method == 'POST':
         # Create new expense
@@ -668,25 +1128,20 @@ def manage_expenses():
                 if not data.get(field):
                     return jsonify({'error': f'Missing required field: {field}'}), 400
             
-            # Get exchange rate if currency is different from base currency
-            exchange_rate = 1.0
+            # Expenses start as drafts; only the submit endpoint starts the approval workflow
+            if data.get('status', 'Draft') != 'Draft':
+                return jsonify({'error': 'New expenses are created as Draft; submit them with POST /api/expenses/<id>/submit'}), 400
+            
+            try:
+                expense_date = datetime.strptime(data['date'], '%Y-%m-%d').date()
+            except ValueError:
+                return jsonify({'error': 'Invalid date, expected YYYY-MM-DD'}), 400
+            
+            # Convert to base currency at the rate for the expense date (today's rate tables as fallback)
             base_currency = user.company.base_currency_code
             spent_currency = data['currency_spent']
-            
-            if spent_currency != base_currency:
-                try:
-                    # Use the exchange rate API
-                    rate_response = requests.get(f'https://api.exchangerate-api.com/v4/latest/{spent_currency}')
-                    if rate_response.status_code == 200:
-                        rates = rate_response.json()['rates']
-                        exchange_rate = rates.get(base_currency, 1.0)
-                except:
-                    # Fallback to 1.0 if API fails
-                    exchange_rate = 1.0
-            
-            # Calculate final amount in base currency
-            amount_spent = float(data['amount_spent'])
-            final_amount = amount_spent * exchange_rate
+            amount_spent = Decimal(str(data['amount_spent']))
+            final_amount = fx_rates.convert(amount_spent, spent_currency, base_currency, expense_date)
             
             # Create expense
             expense = Expense(
@@ -696,8 +1151,8 @@ def manage_expenses():
                 amount_spent=amount_spent,
                 currency_spent=spent_currency,
                 final_amount_base_currency=final_amount,
-                date=data['date'],
-                status=data.get('status', 'Draft')
+                date=expense_date,
+                status='Draft'
             )
             
             db.session.add(expense)
@@ -707,12 +1162,16 @@ def manage_expenses():
             if 'receipt' in request.files:
                 receipt_file = request.files['receipt']
                 if receipt_file and receipt_file.filename:
-                    # Simple file handling - in production, use proper file storage
-                    filename = f"receipt_{expense.id}_{receipt_file.filename}"
-                    receipt_path = f"/static/receipts/{filename}"
-                    # Note: In production, save to proper file storage
-                    expense.receipt_url = receipt_path
-                    db.session.commit()
+                    try:
+                        store_receipt(expense, receipt_file.stream, receipt_file.filename)
+                        db.session.commit()
+                    except ReceiptStorageError as e:
+                        return jsonify({
+                            'message': 'Expense created but receipt was rejected',
+                            'id': expense.id,
+                            'status': expense.status,
+                            'receipt_error': str(e)
+                        }), 201
             
             return jsonify({
                 'message': 'Expense created successfully',
@@ -724,13 +1183,51 @@ def manage_expenses():
             db.session.rollback()
             return jsonify({'error': f'Failed to create expense: {str(e)}'}), 500
 
+@api_bp.route('/expenses/import', methods=['POST'])
+def import_expenses():
+    """Import a CSV or OFX statement as draft expenses
+    
+    Multipart form with ``file`` plus optional ``format`` (csv/ofx),
+    ``category`` and ``currency`` defaults for rows that don't carry them.
+    """
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    user = get_current_user()
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+    
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        return jsonify({'error': 'No file uploaded'}), 400
+    
+    try:
+        rows = expense_importer.reader_for(upload.stream, upload.filename, request.form.get('format'))
+        result = expense_importer.run(
+            user, rows,
+            default_category=request.form.get('category') or 'Other',
+            default_currency=request.form.get('currency')
+        )
+        db.session.commit()
+        
+    except ExpenseImportError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), e.status_code
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Failed to import expenses: {str(e)}'}), 500
+    
+    response = result.to_dict()
+    response['message'] = f'Imported {result.imported} expenses as drafts'
+    return jsonify(response), 201 if result.imported else 200
+
 @api_bp.route('/expenses/<int:expense_id>', methods=['GET', 'PUT', 'DELETE'])
 def manage_single_expense(expense_id):
     """Get, update, or delete a specific expense"""
     if 'user_id' not in session:
         return jsonify({'error': 'Unauthorized'}), 401
     
-    user = User.query.get(session['user_id'])
+    user = get_current_user()
     expense = Expense.query.get_or_404(expense_id)
     
     # Check if user owns this expense or is admin
@@ -741,21 +1238,13 @@ def manage_single_expense(expense_id):
         # Get latest approval for this expense
         latest_approval = ExpenseApproval.query.filter_by(expense_id=expense.id).order_by(ExpenseApproval.created_at.desc()).first()
         
-        return jsonify({
-            'id': expense.id,
-            'category': expense.category,
-            'description': expense.description,
-            'amount_spent': float(expense.amount_spent),
-            'currency_spent': expense.currency_spent,
-            'final_amount_base_currency': float(expense.final_amount_base_currency),
-            'date': expense.date.isoformat(),
-            'status': expense.status,
-            'receipt_url': expense.receipt_url,
-            'created_at': expense.created_at.isoformat() if expense.created_at else None,
+        data = expense_serializer.dump_object(expense)
+        data.update({
             'comments': latest_approval.comments if latest_approval else None,
             'approver_name': latest_approval.approver.name if latest_approval else None,
             'approved_at': latest_approval.created_at.isoformat() if latest_approval else None
         })
+        return json_response(data)
     
     elif request.method == 'PUT':
         # Update expense (only if draft)
@@ -771,27 +1260,22 @@ def manage_single_expense(expense_id):
             if 'description' in data:
                 expense.description = data['description']
             if 'amount_spent' in data:
-                expense.amount_spent = float(data['amount_spent'])
+                expense.amount_spent = Decimal(str(data['amount_spent']))
             if 'date' in data:
-                expense.date = data['date']
+                try:
+                    expense.date = datetime.strptime(data['date'], '%Y-%m-%d').date()
+                except ValueError:
+                    return jsonify({'error': 'Invalid date, expected YYYY-MM-DD'}), 400
             
-            # Recalculate exchange rate if needed
-            if 'currency_spent' in data or 'amount_spent' in data:
+            # Recalculate the base amount at the rate for the expense date if needed
+            if 'currency_spent' in data or 'amount_spent' in data or 'date' in data:
                 base_currency = user.company.base_currency_code
                 spent_currency = data.get('currency_spent', expense.currency_spent)
                 
-                exchange_rate = 1.0
-                if spent_currency != base_currency:
-                    try:
-                        rate_response = requests.get(f'https://api.exchangerate-api.com/v4/latest/{spent_currency}')
-                        if rate_response.status_code == 200:
-                            rates = rate_response.json()['rates']
-                            exchange_rate = rates.get(base_currency, 1.0)
-                    except:
-                        exchange_rate = 1.0
-                
                 expense.currency_spent = spent_currency
-                expense.final_amount_base_currency = expense.amount_spent * exchange_rate
+                expense.final_amount_base_currency = fx_rates.convert(
+                    expense.amount_spent, spent_currency, base_currency, expense.date
+                )
             
             db.session.commit()
             
@@ -816,13 +1300,161 @@ def manage_single_expense(expense_id):
             db.session.rollback()
             return jsonify({'error': f'Failed to delete expense: {str(e)}'}), 500
 
+# Receipt APIs
+def store_receipt(expense, stream, filename=None):
+    """Stream a file into the receipt store and attach it to ``expense`` (caller commits)"""
+    stored = receipt_store.save(stream)
+    receipt = Receipt.query.filter_by(sha256=stored.sha256).first()
+    if receipt is None:
+        receipt = Receipt(
+            sha256=stored.sha256,
+            size_bytes=stored.size_bytes,
+            content_type=stored.content_type,
+            original_filename=(filename or '')[:255] or None,
+            storage_key=stored.storage_key
+        )
+        try:
+            with db.session.begin_nested():
+                db.session.add(receipt)
+        except IntegrityError:
+            # Same file stored concurrently by another request
+            receipt = Receipt.query.filter_by(sha256=stored.sha256).one()
+    expense.receipt_id = receipt.id
+    return receipt
+
+def _receipt_upload_target(expense_id):
+    """Load an expense the current user may attach a receipt to, or return an error response"""
+    expense = db.session.get(Expense, expense_id) if expense_id else None
+    if not expense:
+        return None, (jsonify({'error': 'Expense not found'}), 404)
+    if expense.user_id != session['user_id']:
+        return None, (jsonify({'error': 'Access denied'}), 403)
+    if expense.status not in ['Draft', 'Submitted']:
+        return None, (jsonify({'error': 'Cannot change the receipt of a processed expense'}), 400)
+    return expense, None
+
+def _receipt_response(expense, receipt):
+    return jsonify({
+        'message': 'Receipt uploaded successfully',
+        'expense_id': expense.id,
+        'receipt_id': receipt.id,
+        'receipt_url': expense.receipt_url,
+        'sha256': receipt.sha256,
+        'size_bytes': receipt.size_bytes,
+        'content_type': receipt.content_type
+    })
+
+@api_bp.route('/expenses/upload-receipt', methods=['POST'])
+def upload_receipt():
+    """Attach a receipt to an expense from a multipart form (expense_id + receipt_file)"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    expense, error = _receipt_upload_target(request.form.get('expense_id', type=int))
+    if error:
+        return error
+    
+    receipt_file = request.files.get('receipt_file') or request.files.get('receipt')
+    if not receipt_file or not receipt_file.filename:
+        return jsonify({'error': 'No receipt file provided'}), 400
+    
+    try:
+        receipt = store_receipt(expense, receipt_file.stream, receipt_file.filename)
+        db.session.commit()
+    except ReceiptStorageError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), e.status_code
+    
+    return _receipt_response(expense, receipt)
+
+@api_bp.route('/expenses/<int:expense_id>/receipt', methods=['PUT'])
+def put_receipt(expense_id):
+    """Attach a receipt sent as the raw request body, streamed straight to storage"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    expense, error = _receipt_upload_target(expense_id)
+    if error:
+        return error
+    
+    try:
+        receipt = store_receipt(expense, request.stream, request.headers.get('X-Filename'))
+        db.session.commit()
+    except ReceiptStorageError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), e.status_code
+    
+    return _receipt_response(expense, receipt)
+
+def _viewable_receipt(receipt_id):
+    """Load a receipt the current user may view: their own, or their company's for Managers/Admins"""
+    receipt = db.session.get(Receipt, receipt_id)
+    if not receipt:
+        return None
+    
+    user = get_current_user()
+    condition = Expense.user_id == user.id
+    if user.role in ['Manager', 'Admin']:
+        condition = or_(condition, User.company_id == user.company_id)
+    allowed = db.session.query(Expense.id).join(User, Expense.user_id == User.id).filter(
+        Expense.receipt_id == receipt_id, condition
+    ).first()
+    return receipt if allowed else None
+
+@api_bp.route('/receipts/<int:receipt_id>', methods=['GET'])
+def download_receipt(receipt_id):
+    """Download a receipt; supports Range requests, ETags and X-Sendfile"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    receipt = _viewable_receipt(receipt_id)
+    if not receipt:
+        return jsonify({'error': 'Receipt not found'}), 404
+    
+    backend = receipt_store.backend
+    path = backend.local_path(receipt.storage_key)
+    source = path if path else backend.open(receipt.storage_key)
+    response = send_file(
+        source,
+        mimetype=receipt.content_type,
+        download_name=receipt.original_filename or os.path.basename(receipt.storage_key),
+        conditional=True,
+        etag=receipt.sha256,
+        max_age=86400
+    )
+    response.headers['Cache-Control'] = 'private, max-age=86400'
+    return response
+
+@api_bp.route('/receipts/<int:receipt_id>/thumbnail', methods=['GET'])
+def receipt_thumbnail(receipt_id):
+    """Image thumbnail of a receipt, generated on first request and cached"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    size = request.args.get('size', 256, type=int)
+    if size not in receipt_store.thumbnail_sizes:
+        return jsonify({'error': f'size must be one of {list(receipt_store.thumbnail_sizes)}'}), 400
+    
+    receipt = _viewable_receipt(receipt_id)
+    if not receipt:
+        return jsonify({'error': 'Receipt not found'}), 404
+    
+    thumb_path = receipt_store.backend.thumbnail(receipt.storage_key, receipt.content_type, size)
+    if not thumb_path:
+        return jsonify({'error': 'No thumbnail available for this receipt'}), 404
+    
+    response = send_file(thumb_path, mimetype='image/jpeg', conditional=True,
+                         etag=f'{receipt.sha256}-{size}', max_age=86400)
+    response.headers['Cache-Control'] = 'private, max-age=86400'
+    return response
+
 @api_bp.route('/expenses/<int:expense_id>/submit', methods=['POST'])
 def submit_expense(expense_id):
     """Submit expense for approval"""
     if 'user_id' not in session:
         return jsonify({'error': 'Unauthorized'}), 401
     
-    user = User.query.get(session['user_id'])
+    user = get_current_user()
     expense = Expense.query.get_or_404(expense_id)
     
     # Check if user owns this expense
@@ -833,52 +1465,147 @@ def submit_expense(expense_id):
     if expense.status != 'Draft':
         return jsonify({'error': 'Can only submit draft expenses'}), 400
     
+    # Budgets covering this expense, from the in-process spend counters
+    budget = budget_tracker.check(user, expense.category, expense.date, expense.final_amount_base_currency)
+    if budget.blocked:
+        return jsonify({'error': 'Expense would exceed a budget', 'budget': budget.to_dict()}), 409
+    
     try:
-        # Update status to submitted
+        # Update status to submitted and record the approver chain from the rules
         expense.status = 'Submitted'
+        extra_approvers = rule_engine.users_with_role(user.company_id, 'Admin') if budget.requires_approval else ()
+        plan = approval_workflow.start(expense, user, extra_approvers)
+        event = expense_event_data(expense, user, user.company.base_currency_code)
+        company_id = user.company_id
         db.session.commit()
+        dashboard_counters.invalidate(company_id)
+        event_hub.publish('expense.submitted', event, company_id, user_ids=[event['user_id']], roles=MANAGER_ROLES)
         
-        return jsonify({'message': 'Expense submitted for approval'})
+        return jsonify({
+            'message': 'Expense submitted for approval',
+            'approval_plan': plan.to_dict(),
+            'budget': budget.to_dict()
+        })
         
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': f'Failed to submit expense: {str(e)}'}), 500
 
+BATCH_APPROVAL_LIMIT = 500
+
+@api_bp.route('/expenses/approve-batch', methods=['POST'])
+def approve_expense_batch():
+    """Approve or reject many expenses in one transaction (for managers)"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    data = request.get_json() or {}
+    expense_ids = data.get('expense_ids') or []
+    action = data.get('action')  # 'Approved' or 'Rejected'
+    comments = data.get('comments', '')
+    
+    if not isinstance(expense_ids, list) or not expense_ids:
+        return jsonify({'error': 'expense_ids must be a non-empty list'}), 400
+    if len(expense_ids) > BATCH_APPROVAL_LIMIT:
+        return jsonify({'error': f'At most {BATCH_APPROVAL_LIMIT} expenses per request'}), 400
+    try:
+        expense_ids = list(dict.fromkeys(int(expense_id) for expense_id in expense_ids))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'expense_ids must be integers'}), 400
+    
+    user = get_current_user()
+    
+    try:
+        expenses = Expense.query.options(joinedload(Expense.user)).filter(Expense.id.in_(expense_ids)).all()
+        outcomes = approval_workflow.act_many(expenses, user, action, comments)
+        
+        # Build event payloads before commit expires the loaded rows
+        currency = user.company.base_currency_code
+        events = []
+        for expense in expenses:
+            result = outcomes.get(expense.id)
+            if isinstance(result, WorkflowError) or result is None:
+                continue
+            event_type = f'expense.{result.expense_status.lower()}' if result.is_final else 'expense.progress'
+            events.append((event_type, expense_event_data(
+                expense, expense.user, currency, action=action, actor_id=user.id,
+                workflow=approval_workflow.state(result.workflow)
+            )))
+        statuses = {expense_id: result.expense_status for expense_id, result in outcomes.items()
+                    if not isinstance(result, WorkflowError)}
+        company_id = user.company_id
+        db.session.commit()
+        
+    except WorkflowError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), e.status_code
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Failed to process approvals: {str(e)}'}), 500
+    
+    if events:
+        dashboard_counters.invalidate(company_id)
+        for event_type, event in events:
+            event_hub.publish(event_type, event, company_id, user_ids=[event['user_id']], roles=MANAGER_ROLES)
+    
+    results = []
+    for expense_id in expense_ids:
+        result = outcomes.get(expense_id)
+        if result is None:
+            results.append({'expense_id': expense_id, 'success': False, 'error': 'Expense not found'})
+        elif isinstance(result, WorkflowError):
+            results.append({'expense_id': expense_id, 'success': False, 'error': str(result)})
+        else:
+            results.append({'expense_id': expense_id, 'success': True, 'status': statuses[expense_id]})
+    
+    processed = sum(1 for r in results if r['success'])
+    return jsonify({
+        'success': True,
+        'processed': processed,
+        'failed': len(results) - processed,
+        'results': results
+    })
+
 @api_bp.route('/expenses/<int:expense_id>/approve', methods=['POST'])
 def approve_expense(expense_id):
     """Approve or reject expense (for managers)"""
     if 'user_id' not in session:
         return jsonify({'error': 'Unauthorized'}), 401
     
-    user = User.query.get(session['user_id'])
+    user = get_current_user()
     expense = Expense.query.get_or_404(expense_id)
     
-    # Check if user is manager or admin
-    if user.role not in ['Manager', 'Admin']:
-        return jsonify({'error': 'Insufficient permissions'}), 403
-    
     try:
         data = request.get_json()
         action = data.get('action')  # 'Approved' or 'Rejected'
         comments = data.get('comments', '')
         
-        if action not in ['Approved', 'Rejected']:
-            return jsonify({'error': 'Invalid action'}), 400
-        
-        # Update expense
-        expense.status = action
-        # Create approval record
-        approval = ExpenseApproval(
-            expense_id=expense.id,
-            approver_user_id=user.id,
-            action=action,
-            comments=comments
-        )
-        db.session.add(approval)
+        # Record the action against the workflow state; the expense only
+        # changes status once the rule's quorum is met or it is rejected
+        result = approval_workflow.act(expense, user, action, comments)
+        workflow_state = approval_workflow.state(result.workflow)
+        submitter = expense.user
+        company_id = submitter.company_id
+        event = expense_event_data(expense, submitter, submitter.company.base_currency_code,
+                                   action=action, actor_id=user.id, workflow=workflow_state)
         db.session.commit()
+        dashboard_counters.invalidate(company_id)
+        event_type = f'expense.{result.expense_status.lower()}' if result.is_final else 'expense.progress'
+        event_hub.publish(event_type, event, company_id, user_ids=[event['user_id']], roles=MANAGER_ROLES)
         
-        return jsonify({'message': f'Expense {action.lower()} successfully'})
+        if result.is_final:
+            message = f'Expense {result.expense_status.lower()} successfully'
+        else:
+            message = f'Expense {action.lower()}; waiting for other approvers'
+        return jsonify({
+            'message': message,
+            'status': result.expense_status,
+            'workflow': workflow_state
+        })
         
+    except WorkflowError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), e.status_code
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': f'Failed to process approval: {str(e)}'}), 500
\ No newline at end of file
@@ -0,0 +1,118 @@
+"""
+Approval Inbox for Expense Management System
+Per-approver list of expenses waiting on them, kept current by the approval workflow
+"""
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update, delete, or_, and_
+
+from database import db
+from models import ApprovalInboxItem
+
+# Polls re-send changes from this far before the last poll so rows committed
+# by transactions still in flight at poll time aren't missed
+POLL_OVERLAP = timedelta(seconds=5)
+
+
+class ApprovalInbox:
+    """Writes and reads the ``approval_inbox`` table
+
+    The workflow opens a row for every approver an expense is currently
+    waiting on and closes it when they act or the expense is decided, so a
+    page of an approver's inbox is one indexed query with no joins.
+    """
+
+    def open(self, expense, submitter, currency, approver_ids, step_order=None):
+        """Add ``expense`` to each approver's inbox; the caller commits"""
+        now = datetime.utcnow()
+        db.session.add_all([
+            ApprovalInboxItem(
+                approver_user_id=approver_id,
+                expense_id=expense.id,
+                submitter_user_id=submitter.id,
+                submitter_name=submitter.name,
+                submitter_email=submitter.email,
+                category=expense.category,
+                description=expense.description,
+                expense_date=expense.date,
+                amount=expense.final_amount_base_currency,
+                currency=currency,
+                amount_spent=expense.amount_spent,
+                currency_spent=expense.currency_spent,
+                step_order=step_order,
+                status='Pending',
+                submitted_at=now,
+                created_at=now,
+                updated_at=now
+            ) for approver_id in approver_ids
+        ])
+
+    def close_many(self, expense_ids, approver_id=None):
+        """Close open rows for the expenses, for one approver or for everyone"""
+        statement = update(ApprovalInboxItem).where(
+            ApprovalInboxItem.expense_id.in_(expense_ids),
+            ApprovalInboxItem.status == 'Pending'
+        )
+        if approver_id is not None:
+            statement = statement.where(ApprovalInboxItem.approver_user_id == approver_id)
+        db.session.execute(statement.values(status='Closed', updated_at=datetime.utcnow()),
+                           execution_options={'synchronize_session': False})
+
+    def clear(self, expense_id):
+        """Remove every row for the expense, before a resubmission opens new ones"""
+        db.session.execute(delete(ApprovalInboxItem).where(ApprovalInboxItem.expense_id == expense_id),
+                           execution_options={'synchronize_session': False})
+
+    def page(self, approver_id, limit, after=None):
+        """Open items, oldest first, keyset-paginated on ``(created_at, id)``"""
+        query = select(ApprovalInboxItem).where(
+            ApprovalInboxItem.approver_user_id == approver_id,
+            ApprovalInboxItem.status == 'Pending'
+        )
+        if after is not None:
+            query = query.where(or_(
+                ApprovalInboxItem.created_at > after[0],
+                and_(ApprovalInboxItem.created_at == after[0], ApprovalInboxItem.id > after[1])
+            ))
+        query = query.order_by(ApprovalInboxItem.created_at, ApprovalInboxItem.id).limit(limit + 1)
+        return db.session.execute(query).scalars().all()
+
+    def changes(self, approver_id, since, limit, after=None):
+        """Items opened or closed after ``since``, keyset-paginated on ``(updated_at, id)``"""
+        query = select(ApprovalInboxItem).where(
+            ApprovalInboxItem.approver_user_id == approver_id,
+            ApprovalInboxItem.updated_at > since - POLL_OVERLAP
+        )
+        if after is not None:
+            query = query.where(or_(
+                ApprovalInboxItem.updated_at > after[0],
+                and_(ApprovalInboxItem.updated_at == after[0], ApprovalInboxItem.id > after[1])
+            ))
+        query = query.order_by(ApprovalInboxItem.updated_at, ApprovalInboxItem.id).limit(limit + 1)
+        return db.session.execute(query).scalars().all()
+
+    @staticmethod
+    def serialize(item):
+        return {
+            'expense_id': item.expense_id,
+            'status': item.status,
+            'submitter_id': item.submitter_user_id,
+            'submitter': item.submitter_email,
+            'submitter_name': item.submitter_name,
+            'category': item.category,
+            'description': item.description,
+            'date': item.expense_date.isoformat() if item.expense_date else None,
+            'amount': str(item.amount) if item.amount is not None else None,
+            'currency': item.currency,
+            'amount_spent': str(item.amount_spent) if item.amount_spent is not None else None,
+            'currency_spent': item.currency_spent,
+            'step_order': item.step_order,
+            'submitted_date': item.submitted_at.isoformat() if item.submitted_at else None,
+            'received_date': item.created_at.isoformat() if item.created_at else None,
+            'updated_at': item.updated_at.isoformat() if item.updated_at else None
+        }
+
+
+# Initialize global approval inbox
+approval_inbox = ApprovalInbox()
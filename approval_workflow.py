@@ -0,0 +1,289 @@
+"""
+Approval Workflow for Expense Management System
+Per-expense approval state with constant-time quorum and sequence checks
+"""
+
+from datetime import datetime
+from decimal import Decimal
+
+from sqlalchemy import select, func, insert, update
+
+from database import db
+from models import Expense, ExpenseApproval, ExpenseApprovalStep, ExpenseWorkflow
+from rule_engine import rule_engine
+from approval_inbox import approval_inbox
+
+
+class WorkflowError(Exception):
+    """Raised when an approval action isn't allowed; ``status_code`` is the HTTP status to return"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class ActionResult:
+    """Outcome of one approve/reject action"""
+
+    def __init__(self, expense_status, workflow):
+        self.expense_status = expense_status
+        self.workflow = workflow
+
+    @property
+    def is_final(self):
+        return self.expense_status in ('Approved', 'Rejected')
+
+
+class ApprovalWorkflow:
+    """Applies approval actions against the ``expense_workflows`` state row
+
+    Submission resolves the approver chain once and stores the tallies the
+    decision needs: approvals and rejections so far, how many required
+    approvers have signed off and which step is current. Each action locks
+    the state row, updates the acting approver's step and the tallies, and
+    decides the outcome from the tallies alone. Single and batch actions
+    share the same path (``act_many``).
+
+    Expenses without a resolved chain (no rules and no manager, or submitted
+    before workflows existed) keep the original behaviour: any Manager or
+    Admin in the company decides with one action, and they land in the
+    company admins' inboxes. Admins can always decide an expense outright.
+
+    The approver inbox is updated in the same transaction: rows open for the
+    approvers an expense is currently waiting on and close as they act.
+    """
+
+    def start(self, expense, submitter, extra_approver_ids=()):
+        """Resolve the approver chain and create the workflow state; the caller commits
+
+        ``extra_approver_ids`` are added as a final required step, e.g. when
+        the expense exceeds a budget that asks for extra approval.
+        """
+        plan = rule_engine.resolve(expense, submitter)
+        extra_approver_ids = [user_id for user_id in extra_approver_ids if user_id != submitter.id]
+        if extra_approver_ids:
+            plan.add_final_step(extra_approver_ids)
+        ExpenseApprovalStep.query.filter_by(expense_id=expense.id).delete(synchronize_session=False)
+        ExpenseWorkflow.query.filter_by(expense_id=expense.id).delete(synchronize_session=False)
+
+        db.session.add_all([
+            ExpenseApprovalStep(
+                expense_id=expense.id,
+                approver_user_id=slot.user_id,
+                rule_id=slot.rule_id,
+                step_order=slot.step_order,
+                is_required=slot.is_required,
+                status='Pending'
+            ) for slot in plan.slots
+        ])
+
+        first_step = plan.slots[0].step_order if plan.slots else None
+        if plan.slots:
+            waiting_on = [slot.user_id for slot in plan.slots
+                          if not plan.is_sequential or slot.step_order == first_step]
+        else:
+            waiting_on = [user_id for user_id in rule_engine.users_with_role(submitter.company_id, 'Admin')
+                          if user_id != submitter.id]
+        approval_inbox.clear(expense.id)
+        approval_inbox.open(expense, submitter, submitter.company.base_currency_code, waiting_on, first_step)
+
+        db.session.add(ExpenseWorkflow(
+            expense_id=expense.id,
+            status='Pending',
+            is_sequential=plan.is_sequential,
+            min_approval_percentage=plan.min_approval_percentage,
+            current_step=first_step,
+            current_step_pending=sum(1 for slot in plan.slots if slot.step_order == first_step),
+            total_approvers=len(plan.slots),
+            required_total=sum(1 for slot in plan.slots if slot.is_required)
+        ))
+        return plan
+
+    def _quorum_met(self, workflow):
+        if workflow.required_approved < workflow.required_total:
+            return False
+        needed = Decimal(str(workflow.min_approval_percentage or 100)) * workflow.total_approvers
+        return workflow.approved_count * 100 >= needed
+
+    def _quorum_possible(self, workflow):
+        undecided = workflow.total_approvers - workflow.approved_count - workflow.rejected_count
+        needed = Decimal(str(workflow.min_approval_percentage or 100)) * workflow.total_approvers
+        return (workflow.approved_count + undecided) * 100 >= needed
+
+    def _advance_step(self, expense, workflow):
+        """Move ``current_step`` to the next step that still has pending approvers"""
+        next_step = select(func.min(ExpenseApprovalStep.step_order)).where(
+            ExpenseApprovalStep.expense_id == workflow.expense_id,
+            ExpenseApprovalStep.status == 'Pending'
+        ).scalar_subquery()
+        rows = db.session.execute(
+            select(ExpenseApprovalStep.approver_user_id, ExpenseApprovalStep.step_order).where(
+                ExpenseApprovalStep.expense_id == workflow.expense_id,
+                ExpenseApprovalStep.status == 'Pending',
+                ExpenseApprovalStep.step_order == next_step
+            )
+        ).all()
+        previous_step = workflow.current_step
+        workflow.current_step = rows[0].step_order if rows else None
+        workflow.current_step_pending = len(rows)
+        if rows and workflow.is_sequential and workflow.current_step != previous_step:
+            submitter = expense.user
+            approval_inbox.open(expense, submitter, submitter.company.base_currency_code,
+                                [row.approver_user_id for row in rows], workflow.current_step)
+
+    def _finish(self, expense, workflow, status, finished):
+        if workflow is not None:
+            workflow.status = status
+        expense.status = status
+        finished.append(expense.id)
+
+    def _apply(self, expense, workflow, step, approver, action, finished):
+        """Update one expense's state for the action; returns True if its step is complete"""
+        if expense.status != 'Submitted' or (workflow is not None and workflow.status != 'Pending'):
+            raise WorkflowError('Expense is not awaiting approval', 409)
+
+        if step is None:
+            # No chain to follow, or an Admin deciding outright
+            if workflow is not None and workflow.total_approvers and approver.role != 'Admin':
+                raise WorkflowError('You are not an approver for this expense', 403)
+            self._finish(expense, workflow, action, finished)
+            return False
+
+        if step.status != 'Pending':
+            raise WorkflowError('You have already acted on this expense', 409)
+        if workflow.is_sequential and step.step_order != workflow.current_step:
+            raise WorkflowError('Waiting for earlier approvers', 409)
+
+        step.status = action
+        if action == 'Approved':
+            workflow.approved_count += 1
+            if step.is_required:
+                workflow.required_approved += 1
+        else:
+            workflow.rejected_count += 1
+
+        if step.step_order == workflow.current_step:
+            workflow.current_step_pending -= 1
+
+        if action == 'Rejected' and (step.is_required or not self._quorum_possible(workflow)):
+            self._finish(expense, workflow, 'Rejected', finished)
+        elif self._quorum_met(workflow):
+            self._finish(expense, workflow, 'Approved', finished)
+        else:
+            return workflow.current_step_pending <= 0
+        return False
+
+    def act_many(self, expenses, approver, action, comments=''):
+        """Record ``approver``'s action on each of ``expenses``; the caller commits
+
+        Expenses should be loaded with their ``user``. Workflow rows and the
+        approver's steps are locked with one query each, the approval
+        history is written with one bulk insert, and inbox and step cleanup
+        run as set-based updates, however many expenses are passed.
+
+        Returns ``{expense_id: ActionResult or WorkflowError}``. Raises
+        ``WorkflowError`` if the action or approver is invalid for all of them.
+        """
+        if action not in ('Approved', 'Rejected'):
+            raise WorkflowError('Invalid action')
+        if approver.role not in ('Manager', 'Admin'):
+            raise WorkflowError('Insufficient permissions', 403)
+
+        results = {}
+        candidates = []
+        for expense in expenses:
+            if expense.user.company_id != approver.company_id:
+                results[expense.id] = WorkflowError('Access denied', 403)
+            elif expense.user_id == approver.id and approver.role != 'Admin':
+                results[expense.id] = WorkflowError('Cannot approve your own expense', 403)
+            else:
+                candidates.append(expense)
+        if not candidates:
+            return results
+
+        ids = [expense.id for expense in candidates]
+        workflows = {workflow.expense_id: workflow for workflow in ExpenseWorkflow.query.filter(
+            ExpenseWorkflow.expense_id.in_(ids)
+        ).with_for_update()}
+        legacy_ids = [expense_id for expense_id in ids if expense_id not in workflows]
+        if legacy_ids:
+            # Expenses without workflow state: lock the rows and re-read their status
+            Expense.query.filter(Expense.id.in_(legacy_ids)).with_for_update().populate_existing().all()
+        chain_ids = [expense_id for expense_id, workflow in workflows.items() if workflow.total_approvers]
+        steps = {}
+        if chain_ids:
+            steps = {step.expense_id: step for step in ExpenseApprovalStep.query.filter(
+                ExpenseApprovalStep.expense_id.in_(chain_ids),
+                ExpenseApprovalStep.approver_user_id == approver.id
+            ).with_for_update()}
+
+        now = datetime.utcnow()
+        approvals = []
+        finished = []
+        to_advance = []
+        for expense in candidates:
+            workflow = workflows.get(expense.id)
+            try:
+                step_complete = self._apply(expense, workflow, steps.get(expense.id), approver, action, finished)
+            except WorkflowError as e:
+                results[expense.id] = e
+                continue
+            if workflow is not None:
+                workflow.updated_at = now
+            if step_complete:
+                to_advance.append((expense, workflow))
+            approvals.append({
+                'expense_id': expense.id,
+                'approver_user_id': approver.id,
+                'action': action,
+                'comments': comments,
+                'approval_date': now,
+                'created_at': now
+            })
+            results[expense.id] = ActionResult(expense.status, workflow)
+
+        if approvals:
+            db.session.execute(insert(ExpenseApproval), approvals)
+            acted = [approval['expense_id'] for approval in approvals]
+            approval_inbox.close_many(acted, approver.id)
+        if finished:
+            approval_inbox.close_many(finished)
+            db.session.execute(
+                update(ExpenseApprovalStep)
+                .where(ExpenseApprovalStep.expense_id.in_(finished), ExpenseApprovalStep.status == 'Pending')
+                .values(status='Skipped'),
+                execution_options={'synchronize_session': False}
+            )
+        for expense, workflow in to_advance:
+            self._advance_step(expense, workflow)
+        return results
+
+    def act(self, expense, approver, action, comments=''):
+        """Record ``approver``'s action on ``expense``; the caller commits
+
+        Raises ``WorkflowError`` when the approver may not act now.
+        """
+        result = self.act_many([expense], approver, action, comments)[expense.id]
+        if isinstance(result, WorkflowError):
+            raise result
+        return result
+
+    def state(self, workflow):
+        """Serialize a workflow row for API responses"""
+        if workflow is None:
+            return None
+        return {
+            'status': workflow.status,
+            'is_sequential': workflow.is_sequential,
+            'min_approval_percentage': str(workflow.min_approval_percentage),
+            'current_step': workflow.current_step,
+            'total_approvers': workflow.total_approvers,
+            'approved_count': workflow.approved_count,
+            'rejected_count': workflow.rejected_count,
+            'required_total': workflow.required_total,
+            'required_approved': workflow.required_approved
+        }
+
+
+# Initialize global approval workflow
+approval_workflow = ApprovalWorkflow()
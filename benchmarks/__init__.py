@@ -0,0 +1,3 @@
+"""
+Benchmark tooling for the expense management system
+"""
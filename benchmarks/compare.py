@@ -0,0 +1,51 @@
+"""
+Compare two load benchmark reports
+
+Usage:
+    python -m benchmarks.compare before.json after.json
+"""
+
+import argparse
+import json
+
+METRICS = ['p50_ms', 'p95_ms', 'p99_ms', 'queries_per_request_p50', 'throughput_rps']
+
+
+def _change(before, after):
+    if before in (None, 0) or after is None:
+        return ''
+    return f'{(after - before) / before * 100:+.1f}%'
+
+
+def compare(before, after):
+    lines = []
+    for mode in ('sequential', 'concurrent'):
+        names = [n for n in before.get(mode, {}) if n in after.get(mode, {})]
+        if not names:
+            continue
+        lines.append(f'== {mode} ==')
+        lines.append(f"{'endpoint':22} {'metric':26} {'before':>10} {'after':>10} {'change':>9}")
+        for name in names:
+            for metric in METRICS:
+                b = before[mode][name].get(metric)
+                a = after[mode][name].get(metric)
+                lines.append(f'{name:22} {metric:26} {str(b):>10} {str(a):>10} {_change(b, a):>9}')
+        lines.append('')
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('before')
+    parser.add_argument('after')
+    args = parser.parse_args()
+
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+    print(compare(before, after))
+
+
+if __name__ == '__main__':
+    main()
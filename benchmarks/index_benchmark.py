@@ -0,0 +1,140 @@
+"""
+Index benchmark
+Seeds a synthetic dataset, times the hot query predicates without the
+declared secondary indexes, then creates them and times the queries again.
+
+Usage:
+    python -m benchmarks.index_benchmark --database-url sqlite:///bench.db --users 2000 --expenses 100
+"""
+
+import argparse
+import json
+import os
+import statistics
+import time
+from datetime import datetime
+
+
+def hot_queries(company_id, employee_id, manager_id, expense_id):
+    """The query shapes behind the dashboards and list endpoints"""
+    from models import User, Expense, ExpenseApproval, ApprovalRule
+
+    month_start = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    return {
+        'expenses_by_user_recent': lambda: Expense.query.filter_by(user_id=employee_id)
+            .order_by(Expense.created_at.desc()).limit(50).all(),
+        'submitted_queue': lambda: Expense.query.filter_by(status='Submitted')
+            .order_by(Expense.created_at.desc()).limit(50).all(),
+        'approved_this_month': lambda: ExpenseApproval.query.filter(
+            ExpenseApproval.created_at >= month_start, ExpenseApproval.action == 'Approved').count(),
+        'recent_approvals': lambda: ExpenseApproval.query.order_by(
+            ExpenseApproval.created_at.desc()).limit(10).all(),
+        'approvals_by_approver': lambda: ExpenseApproval.query.filter_by(approver_user_id=manager_id)
+            .order_by(ExpenseApproval.created_at.desc()).limit(50).all(),
+        'approvals_for_expense': lambda: ExpenseApproval.query.filter_by(expense_id=expense_id).all(),
+        'company_managers': lambda: User.query.filter_by(company_id=company_id)
+            .filter(User.role.in_(['Admin', 'Manager'])).all(),
+        'direct_reports': lambda: User.query.filter_by(manager_id=manager_id).all(),
+        'rules_for_category': lambda: ApprovalRule.query.filter_by(applies_to_category='Travel').all(),
+    }
+
+
+def time_queries(queries, repeat):
+    from database import db
+
+    results = {}
+    for name, run in queries.items():
+        run()  # Warm up
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run()
+            samples.append((time.perf_counter() - start) * 1000)
+            db.session.expunge_all()
+        samples.sort()
+        results[name] = {
+            'median_ms': round(statistics.median(samples), 3),
+            'p95_ms': round(samples[int(len(samples) * 0.95) - 1], 3),
+        }
+    return results
+
+
+def drop_declared_indexes():
+    from sqlalchemy import inspect
+    from database import db
+
+    inspector = inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        existing = {ix['name'] for ix in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing and not index.unique:
+                index.drop(db.engine)
+
+
+def analyze():
+    from sqlalchemy import text
+    from database import db
+
+    db.session.execute(text('ANALYZE'))
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', default='sqlite:///index_benchmark.db')
+    parser.add_argument('--companies', type=int, default=1)
+    parser.add_argument('--users', type=int, default=1000, help='Users per company')
+    parser.add_argument('--expenses', type=int, default=100, help='Expenses per employee')
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--no-seed', action='store_true', help='Reuse the data already in the database')
+    parser.add_argument('--output', help='Write the JSON report to this file')
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = args.database_url
+    from app import app
+    from database import db
+    from models import User, Expense, ExpenseApproval, create_indexes
+    from benchmarks.seed import seed
+
+    with app.app_context():
+        db.create_all()
+        report = {'database': db.engine.dialect.name}
+
+        if not args.no_seed:
+            start = time.perf_counter()
+            report['seeded'] = seed(args.companies, args.users, args.expenses)
+            report['seed_seconds'] = round(time.perf_counter() - start, 2)
+
+        # The seeded hierarchy has managers of managers, so start from an employee
+        employee = User.query.filter(User.role == 'Employee', User.manager_id.isnot(None)).first()
+        manager = db.session.get(User, employee.manager_id)
+        # An expense of this employee that has approvals, so the lookup finds rows
+        expense_id = db.session.query(ExpenseApproval.expense_id).join(
+            Expense, ExpenseApproval.expense_id == Expense.id
+        ).filter(Expense.user_id == employee.id).limit(1).scalar()
+        if expense_id is None:
+            expense_id = db.session.query(Expense.id).filter_by(user_id=employee.id).limit(1).scalar()
+        queries = hot_queries(manager.company_id, employee.id, manager.id, expense_id)
+
+        drop_declared_indexes()
+        analyze()
+        report['without_indexes'] = time_queries(queries, args.repeat)
+
+        report['created_indexes'] = create_indexes()
+        analyze()
+        report['with_indexes'] = time_queries(queries, args.repeat)
+
+        report['speedup'] = {
+            name: round(report['without_indexes'][name]['median_ms'] / max(result['median_ms'], 0.001), 1)
+            for name, result in report['with_indexes'].items()
+        }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+"""
+Load benchmark
+Drives the real endpoints through the Flask test client, sequentially and
+concurrently, and reports latency percentiles, SQL queries per request and
+throughput as JSON that can be compared between runs (see benchmarks.compare).
+
+Usage:
+    python -m benchmarks.load --database-url sqlite:///bench.db --seed --users 500 --expenses 40
+    python -m benchmarks.load --database-url postgresql://localhost/bench --requests 500 --concurrency 16 --output run.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+# (name, path, role of the user making the request)
+ENDPOINTS = [
+    ('dashboard_employee', '/dashboard', 'Employee'),
+    ('dashboard_manager', '/dashboard', 'Manager'),
+    ('expenses', '/api/expenses', 'Employee'),
+    ('reports_manager', '/api/reports/expenses', 'Manager'),
+    ('reports_admin', '/api/reports/expenses', 'Admin'),
+    ('approvals_pending', '/api/approvals/pending', 'Manager'),
+    ('admin_users', '/api/admin/users', 'Admin'),
+]
+
+
+class QueryCounter:
+    """Counts SQL statements per thread via SQLAlchemy engine events"""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+
+        self._local = threading.local()
+        event.listen(engine, 'before_cursor_execute', self._on_execute)
+
+    def _on_execute(self, *args, **kwargs):
+        self._local.count = getattr(self._local, 'count', 0) + 1
+
+    def reset(self):
+        self._local.count = 0
+
+    @property
+    def count(self):
+        return getattr(self._local, 'count', 0)
+
+
+def percentile(sorted_samples, pct):
+    if not sorted_samples:
+        return None
+    index = min(len(sorted_samples) - 1, max(0, int(round(pct / 100 * len(sorted_samples))) - 1))
+    return sorted_samples[index]
+
+
+def summarize(samples, elapsed):
+    latencies = sorted(s['ms'] for s in samples)
+    queries = sorted(s['queries'] for s in samples)
+    statuses = {}
+    for s in samples:
+        statuses[str(s['status'])] = statuses.get(str(s['status']), 0) + 1
+    return {
+        'requests': len(samples),
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'max_ms': round(latencies[-1], 3),
+        'queries_per_request_p50': percentile(queries, 50),
+        'queries_per_request_max': queries[-1],
+        'throughput_rps': round(len(samples) / elapsed, 1) if elapsed else None,
+        'status_codes': statuses,
+    }
+
+
+def pick_users(company_id):
+    """One user per role with data behind them: the busiest manager and one of their reports"""
+    from sqlalchemy import func
+    from database import db
+    from models import User
+
+    admin = User.query.filter_by(company_id=company_id, role='Admin').first()
+    manager_id = db.session.query(User.manager_id).filter(
+        User.company_id == company_id, User.role == 'Employee'
+    ).group_by(User.manager_id).order_by(func.count(User.id).desc()).limit(1).scalar()
+    employee = User.query.filter_by(manager_id=manager_id, role='Employee').first()
+    return {'Admin': admin.email, 'Manager': db.session.get(User, manager_id).email, 'Employee': employee.email}
+
+
+def login(app, email, password):
+    client = app.test_client()
+    response = client.post('/login', data={'username': email, 'password': password})
+    if response.status_code != 302:
+        raise RuntimeError(f'Login failed for {email}')
+    return client
+
+
+def run_endpoint(app, counter, emails, password, path, role, count, concurrency):
+    """Issue ``count`` GETs to ``path``; returns per-request samples and wall time"""
+    local = threading.local()
+
+    def one(_):
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = login(app, emails[role], password)
+        counter.reset()
+        start = time.perf_counter()
+        response = client.get(path)
+        response.get_data()
+        ms = (time.perf_counter() - start) * 1000
+        return {'ms': ms, 'queries': counter.count, 'status': response.status_code}
+
+    start = time.perf_counter()
+    if concurrency <= 1:
+        samples = [one(i) for i in range(count)]
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            samples = list(pool.map(one, range(count)))
+    return samples, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', default='sqlite:///load_benchmark.db')
+    parser.add_argument('--seed', action='store_true', help='Create tables and seed synthetic data first')
+    parser.add_argument('--companies', type=int, default=1)
+    parser.add_argument('--users', type=int, default=500, help='Users per company when seeding')
+    parser.add_argument('--expenses', type=int, default=40, help='Expenses per employee when seeding')
+    parser.add_argument('--manager-span', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint per mode')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--endpoints', help='Comma-separated subset of endpoint names')
+    parser.add_argument('--label', default='', help='Free-form label stored in the report')
+    parser.add_argument('--output', help='Write the JSON report to this file')
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = args.database_url
+    from app import app
+    from database import db
+    from models import Company
+    from benchmarks.seed import seed, BENCH_PASSWORD
+
+    selected = set(args.endpoints.split(',')) if args.endpoints else None
+    endpoints = [e for e in ENDPOINTS if selected is None or e[0] in selected]
+
+    report = {
+        'label': args.label,
+        'started_at': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'settings': {k: v for k, v in vars(args).items() if k not in ('output', 'label')},
+        'sequential': {},
+        'concurrent': {},
+    }
+
+    with app.app_context():
+        report['database'] = db.engine.dialect.name
+        if args.seed:
+            db.create_all()
+            start = time.perf_counter()
+            report['seeded'] = seed(args.companies, args.users, args.expenses, manager_span=args.manager_span)
+            report['seed_seconds'] = round(time.perf_counter() - start, 2)
+
+        company_id = Company.query.filter(Company.name.like('Bench Company %')).order_by(Company.id).first().id
+        emails = pick_users(company_id)
+        counter = QueryCounter(db.engine)
+
+    for name, path, role in endpoints:
+        samples, elapsed = run_endpoint(app, counter, emails, BENCH_PASSWORD, path, role, args.requests, 1)
+        report['sequential'][name] = summarize(samples, elapsed)
+        if args.concurrency > 1:
+            samples, elapsed = run_endpoint(app, counter, emails, BENCH_PASSWORD, path, role,
+                                            args.requests, args.concurrency)
+            report['concurrent'][name] = summarize(samples, elapsed)
+        print(f"{name:22} p50={report['sequential'][name]['p50_ms']:>9}ms "
+              f"queries={report['sequential'][name]['queries_per_request_p50']:>5} "
+              f"codes={report['sequential'][name]['status_codes']}")
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
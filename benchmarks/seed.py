@@ -0,0 +1,152 @@
+"""
+Synthetic data for benchmarks
+Bulk-inserts companies, users, expenses and approvals into the configured database
+"""
+
+import random
+from datetime import datetime, date, timedelta
+from decimal import Decimal
+
+from sqlalchemy import insert, func, text
+from werkzeug.security import generate_password_hash
+
+from database import db
+from models import Company, User, Expense, ExpenseApproval, ApprovalRule, RuleStep
+from org_hierarchy import org_hierarchy
+from spend_rollups import spend_rollups
+
+CATEGORIES = ['Travel', 'Meals & Entertainment', 'Office Supplies', 'Equipment',
+              'Software & Subscriptions', 'Training & Development', 'Marketing', 'Utilities', 'Other']
+CURRENCIES = ['USD', 'EUR', 'GBP', 'INR', 'JPY']
+STATUSES = ['Draft', 'Submitted', 'Approved', 'Rejected']
+STATUS_WEIGHTS = [10, 20, 55, 15]
+
+# Every seeded user shares this password so the load runner can log in
+BENCH_PASSWORD = 'bench-password'
+
+
+def _bulk_insert(model, rows, batch_size=5000):
+    for start in range(0, len(rows), batch_size):
+        db.session.execute(insert(model.__table__), rows[start:start + batch_size])
+
+
+def _sync_sequences():
+    """Move PostgreSQL id sequences past the explicitly inserted ids"""
+    if db.engine.dialect.name != 'postgresql':
+        return
+    for model in (Company, User, Expense, ExpenseApproval):
+        table = model.__tablename__
+        db.session.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE(MAX(id), 1)) FROM {table}"
+        ))
+
+
+def _next_id(model):
+    return (db.session.query(func.max(model.id)).scalar() or 0) + 1
+
+
+def _user_row(uid, role, company_id, manager_id, password_hash, now):
+    prefix = role.lower()
+    return {'id': uid, 'name': f'{role} {uid}', 'company_id': company_id,
+            'email': f'{prefix}{uid}@bench.example', 'password_hash': password_hash,
+            'role': role, 'manager_id': manager_id, 'created_at': now}
+
+
+def seed(companies=1, users_per_company=100, expenses_per_user=50, days=365,
+         manager_span=8, random_seed=42):
+    """Insert a synthetic dataset and return row counts
+
+    Each company gets one Admin at the top of a manager tree in which every
+    manager has about ``manager_span`` direct reports, so larger companies
+    get deeper hierarchies (Admin -> Director-level Managers -> Managers ->
+    Employees). Employees file expenses spread over the last ``days`` days;
+    Approved/Rejected expenses get one approval row from the employee's
+    manager, and a share of the Submitted ones already have a partial
+    approval from a second-level manager.
+    """
+    rng = random.Random(random_seed)
+    password_hash = generate_password_hash(BENCH_PASSWORD)
+    now = datetime.utcnow()
+    today = date.today()
+
+    company_id = _next_id(Company)
+    user_id = _next_id(User)
+    expense_id = _next_id(Expense)
+
+    company_rows, user_rows, expense_rows, approval_rows = [], [], [], []
+
+    for c in range(companies):
+        cid = company_id + c
+        currency = CURRENCIES[c % len(CURRENCIES)]
+        company_rows.append({'id': cid, 'name': f'Bench Company {cid}',
+                             'base_currency_code': currency, 'created_at': now})
+
+        admin_id = user_id
+        user_id += 1
+        user_rows.append(_user_row(admin_id, 'Admin', cid, None, password_hash, now))
+
+        # Grow the manager tree level by level until it can hold the employees
+        remaining = users_per_company - 1
+        manager_count = max(1, remaining // (manager_span + 1))
+        levels = [[admin_id]]
+        managers_left = manager_count
+        while managers_left > 0:
+            parents = levels[-1]
+            level = []
+            for _ in range(min(managers_left, len(parents) * manager_span)):
+                level.append(user_id)
+                user_rows.append(_user_row(user_id, 'Manager', cid, rng.choice(parents), password_hash, now))
+                user_id += 1
+            managers_left -= len(level)
+            levels.append(level)
+        manager_of = {row['id']: row['manager_id'] for row in user_rows if row['company_id'] == cid}
+        leaf_managers = levels[-1]
+
+        for _ in range(max(0, remaining - manager_count)):
+            manager = rng.choice(leaf_managers)
+            uid = user_id
+            user_id += 1
+            user_rows.append(_user_row(uid, 'Employee', cid, manager, password_hash, now))
+
+            for _ in range(expenses_per_user):
+                spent_currency = currency if rng.random() < 0.8 else rng.choice(CURRENCIES)
+                amount = Decimal(rng.randint(100, 500000)) / 100
+                status = rng.choices(STATUSES, STATUS_WEIGHTS)[0]
+                created = now - timedelta(days=rng.randint(0, days), seconds=rng.randint(0, 86399))
+                expense_rows.append({
+                    'id': expense_id, 'user_id': uid, 'category': rng.choice(CATEGORIES),
+                    'description': f'Synthetic expense {expense_id}',
+                    'date': min(created.date(), today), 'amount_spent': amount,
+                    'currency_spent': spent_currency, 'status': status,
+                    'final_amount_base_currency': amount, 'created_at': created, 'updated_at': created
+                })
+                acted = created + timedelta(hours=rng.randint(1, 72))
+                if status in ('Approved', 'Rejected'):
+                    approval_rows.append({
+                        'expense_id': expense_id, 'approver_user_id': manager, 'action': status,
+                        'comments': None, 'approval_date': acted, 'created_at': acted
+                    })
+                elif status == 'Submitted' and rng.random() < 0.3 and manager_of.get(manager):
+                    approval_rows.append({
+                        'expense_id': expense_id, 'approver_user_id': manager_of[manager], 'action': 'Approved',
+                        'comments': None, 'approval_date': acted, 'created_at': acted
+                    })
+                expense_id += 1
+
+    _bulk_insert(Company, company_rows)
+    _bulk_insert(User, user_rows)
+    _bulk_insert(Expense, expense_rows)
+    _bulk_insert(ExpenseApproval, approval_rows)
+    _sync_sequences()
+
+    rule = ApprovalRule(name='Bench Travel Rule', applies_to_category='Travel',
+                        is_manager_first=True, is_sequential=True, min_approval_percentage=100)
+    db.session.add(rule)
+    db.session.flush()
+    db.session.add(RuleStep(rule_id=rule.id, role_type='Finance', sequence_order=1))
+    org_hierarchy.rebuild()
+    spend_rollups.rebuild()
+    db.session.commit()
+
+    return {'companies': len(company_rows), 'users': len(user_rows),
+            'expenses': len(expense_rows), 'approvals': len(approval_rows)}
@@ -0,0 +1,118 @@
+"""
+Serialization benchmark
+Compares the hand-built dict + jsonify path against the declared serializers
+on column-only selects, with the stdlib encoder and with orjson (if installed).
+
+Usage:
+    python -m benchmarks.serialization_benchmark --database-url sqlite:///bench.db --rows 1000
+"""
+
+import argparse
+import json
+import os
+import statistics
+import time
+
+
+def handbuilt(expenses):
+    """The per-endpoint dict building the list endpoints used before ``serializers``"""
+    return [{
+        'id': e.id,
+        'category': e.category,
+        'description': e.description,
+        'amount_spent': float(e.amount_spent),
+        'currency_spent': e.currency_spent,
+        'final_amount_base_currency': float(e.final_amount_base_currency),
+        'date': e.date.isoformat(),
+        'status': e.status,
+        'receipt_url': e.receipt_url,
+        'created_at': e.created_at.isoformat() if e.created_at else None,
+        'updated_at': e.updated_at.isoformat() if e.updated_at else None
+    } for e in expenses]
+
+
+def time_run(run, repeat):
+    from database import db
+
+    run()  # Warm up
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        samples.append((time.perf_counter() - start) * 1000)
+        db.session.expunge_all()
+    samples.sort()
+    return {
+        'median_ms': round(statistics.median(samples), 3),
+        'p95_ms': round(samples[int(len(samples) * 0.95) - 1], 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', default='sqlite:///serialization_benchmark.db')
+    parser.add_argument('--users', type=int, default=50, help='Users to seed')
+    parser.add_argument('--expenses', type=int, default=100, help='Expenses per employee to seed')
+    parser.add_argument('--rows', type=int, default=1000, help='Rows per response')
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--no-seed', action='store_true', help='Reuse the data already in the database')
+    parser.add_argument('--output', help='Write the JSON report to this file')
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = args.database_url
+    from flask import jsonify
+    from sqlalchemy import select
+    from app import app
+    from database import db
+    from models import Expense
+    from benchmarks.seed import seed
+    import serializers
+    from serializers import expense_serializer
+
+    with app.app_context(), app.test_request_context():
+        db.create_all()
+        report = {'database': db.engine.dialect.name, 'rows': args.rows, 'orjson': serializers.orjson is not None}
+        if not args.no_seed:
+            report['seeded'] = seed(1, args.users, args.expenses)
+
+        orm_query = lambda: Expense.query.order_by(Expense.id).limit(args.rows).all()
+        column_query = lambda: db.session.execute(
+            select(*expense_serializer.columns).order_by(Expense.id).limit(args.rows)
+        ).all()
+
+        def stdlib_dumps(payload):
+            return json.dumps(payload, separators=(',', ':')).encode('utf-8')
+
+        # Serialization and encoding only, on rows fetched once
+        objects = orm_query()
+        rows = column_query()
+        encode_only = {
+            'handbuilt_jsonify': lambda: jsonify(handbuilt(objects)).get_data(),
+            'serializer_stdlib': lambda: stdlib_dumps(expense_serializer.dump_all(rows)),
+        }
+        if serializers.orjson is not None:
+            encode_only['serializer_orjson'] = lambda: serializers.orjson.dumps(expense_serializer.dump_all(rows))
+        report['serialize_only'] = {name: time_run(run, args.repeat) for name, run in encode_only.items()}
+
+        # Query, serialize and encode, as an endpoint does
+        end_to_end = {
+            'orm_handbuilt_jsonify': lambda: jsonify(handbuilt(orm_query())).get_data(),
+            'columns_serializer': lambda: serializers.dumps(expense_serializer.dump_all(column_query())),
+        }
+        report['end_to_end'] = {name: time_run(run, args.repeat) for name, run in end_to_end.items()}
+
+        baseline = report['serialize_only']['handbuilt_jsonify']['median_ms']
+        report['serialize_speedup'] = {
+            name: round(baseline / max(result['median_ms'], 0.001), 1)
+            for name, result in report['serialize_only'].items()
+        }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
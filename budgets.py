@@ -0,0 +1,346 @@
+"""
+Budgets for Expense Management System
+Per-company spend limits checked against in-process running counters
+"""
+
+import os
+import threading
+import time
+from datetime import date, datetime
+from decimal import Decimal
+
+from sqlalchemy import select, func
+
+from database import db
+from models import Budget, SpendRollup
+from spend_rollups import spend_rollups
+
+PERIODS = {'monthly': 1, 'quarterly': 3, 'yearly': 12}
+ACTIONS = ('block', 'require_approval')
+
+# Expenses that count against a budget: awaiting a decision or approved
+COUNTED_STATUSES = ('Submitted', 'Approved')
+
+# Counter differences below this are rounding, not drift
+DRIFT_TOLERANCE = Decimal('0.005')
+
+
+class BudgetError(Exception):
+    """Raised for an invalid budget definition; ``status_code`` is the HTTP status to return"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _month(day):
+    return f'{day.year:04d}-{day.month:02d}'
+
+
+def _counter_keys(user_id, category, month):
+    """Every counter an expense adds to: by user and category, by either alone, and company-wide"""
+    return ((user_id, category, month), (user_id, None, month), (None, category, month), (None, None, month))
+
+
+class CompiledBudget:
+    __slots__ = ('id', 'name', 'user_id', 'category', 'period', 'limit', 'action')
+
+    def __init__(self, budget):
+        self.id = budget.id
+        self.name = budget.name
+        self.user_id = budget.user_id
+        self.category = budget.category
+        self.period = budget.period
+        self.limit = Decimal(str(budget.limit_amount))
+        self.action = budget.action
+
+    def applies_to(self, user_id, category):
+        return (self.user_id is None or self.user_id == user_id) and \
+            (self.category is None or self.category == category)
+
+    def period_months(self, day):
+        """First day of the period containing ``day`` and its months as 'YYYY-MM'"""
+        length = PERIODS[self.period]
+        first_month = (day.month - 1) // length * length + 1
+        start = date(day.year, first_month, 1)
+        return start, [f'{day.year:04d}-{month:02d}' for month in range(first_month, first_month + length)]
+
+
+class BudgetDecision:
+    """Outcome of checking one expense against the budgets that cover it"""
+
+    def __init__(self, checks):
+        self.checks = checks
+        exceeded = {check['action'] for check in checks if check['exceeded']}
+        if 'block' in exceeded:
+            self.outcome = 'over_budget'
+        elif 'require_approval' in exceeded:
+            self.outcome = 'requires_approval'
+        else:
+            self.outcome = 'ok'
+
+    @property
+    def blocked(self):
+        return self.outcome == 'over_budget'
+
+    @property
+    def requires_approval(self):
+        return self.outcome == 'requires_approval'
+
+    def to_dict(self):
+        return {'decision': self.outcome, 'budgets': self.checks}
+
+
+class BudgetTracker:
+    """Checks expenses against budgets without querying expenses
+
+    Budget definitions are compiled per company and reused for
+    ``BUDGET_CACHE_TTL`` seconds or until ``invalidate``. Spend is kept in
+    per-company counters of the base-currency amount of submitted and
+    approved expenses, by user and category and month (plus the
+    all-users/all-categories roll-ups), so a check reads at most twelve
+    counters per budget whatever the data volume.
+
+    When the app starts serving, a background thread seeds the counters of
+    every company with budgets from ``spend_rollups``; from then on they are
+    moved by the rollup deltas of each committed transaction, so
+    submissions, decisions, edits and deletes apply only once they commit.
+    Writes made by other worker processes are not seen here; the same
+    thread re-reads the counters from SQL every
+    ``BUDGET_RECONCILE_INTERVAL`` seconds, reports any drift and corrects
+    it, and seeds companies that have gained budgets since. A check that
+    finds its company unseeded (first budget, or before the startup seed
+    finishes) seeds it in line.
+    """
+
+    def __init__(self, ttl=None, reconcile_interval=None):
+        self.ttl = ttl if ttl is not None else float(os.getenv('BUDGET_CACHE_TTL', '300'))
+        self.reconcile_interval = reconcile_interval if reconcile_interval is not None else float(
+            os.getenv('BUDGET_RECONCILE_INTERVAL', '300'))
+        self.app = None
+        self._budgets = {}  # company_id -> (loaded_at, [CompiledBudget])
+        self._counters = {}  # company_id -> {(user_id, category, 'YYYY-MM'): Decimal}
+        self._versions = {}  # company_id -> counter updates seen, to detect changes during a read
+        self._lock = threading.Lock()
+        self._worker = None
+        self.last_reconcile = None
+        spend_rollups.subscribe(self._on_commit)
+
+    def init_app(self, app):
+        self.app = app
+        # Start with the first request, once the tables exist; CLI commands don't start it
+        app.before_request(self._start_worker)
+
+    # Budget definitions
+    def budgets_for(self, company_id):
+        now = time.time()
+        with self._lock:
+            entry = self._budgets.get(company_id)
+        if entry is not None and now - entry[0] < self.ttl:
+            return entry[1]
+
+        budgets = [CompiledBudget(budget) for budget in
+                   Budget.query.filter_by(company_id=company_id).order_by(Budget.id)]
+        with self._lock:
+            self._budgets[company_id] = (now, budgets)
+        return budgets
+
+    def invalidate(self, company_id):
+        """Drop a company's compiled budgets; call after committing a budget change"""
+        with self._lock:
+            self._budgets.pop(company_id, None)
+
+    def validate(self, data, partial=False):
+        """Check budget fields from a request body; returns the cleaned values or raises ``BudgetError``"""
+        values = {}
+        if 'name' in data or not partial:
+            if not (data.get('name') or '').strip():
+                raise BudgetError('Budget name is required')
+            values['name'] = data['name'].strip()[:255]
+        if 'limit_amount' in data or not partial:
+            try:
+                values['limit_amount'] = Decimal(str(data['limit_amount']))
+            except (KeyError, ArithmeticError, ValueError):
+                raise BudgetError('limit_amount must be a number')
+            if values['limit_amount'] < 0:
+                raise BudgetError('limit_amount cannot be negative')
+        if 'period' in data or not partial:
+            values['period'] = data.get('period') or 'monthly'
+            if values['period'] not in PERIODS:
+                raise BudgetError(f'period must be one of {", ".join(PERIODS)}')
+        if 'action' in data or not partial:
+            values['action'] = data.get('action') or 'block'
+            if values['action'] not in ACTIONS:
+                raise BudgetError(f'action must be one of {", ".join(ACTIONS)}')
+        if 'user_id' in data:
+            values['user_id'] = int(data['user_id']) if data['user_id'] not in (None, '') else None
+        if 'category' in data:
+            values['category'] = data['category'] or None
+        return values
+
+    # Counters
+    def _read(self, company_id):
+        """Counters for one company computed from the rollup table"""
+        month = spend_rollups.period_label('month')
+        rows = db.session.execute(
+            select(SpendRollup.user_id, SpendRollup.category, month, func.sum(SpendRollup.amount_base))
+            .where(SpendRollup.company_id == company_id, SpendRollup.status.in_(COUNTED_STATUSES))
+            .group_by(SpendRollup.user_id, SpendRollup.category, month)
+        )
+        counters = {}
+        for user_id, category, period, amount in rows:
+            amount = Decimal(str(amount or 0)).quantize(Decimal('0.01'))
+            for key in _counter_keys(user_id, category, period):
+                counters[key] = counters.get(key, Decimal('0')) + amount
+        return counters
+
+    def _company_counters(self, company_id):
+        with self._lock:
+            counters = self._counters.get(company_id)
+            version = self._versions.get(company_id, 0)
+        if counters is not None:
+            return counters
+
+        counters = self._read(company_id)
+        with self._lock:
+            # Keep the seed only if no commit moved this company's spend during the read
+            if self._versions.get(company_id, 0) == version:
+                self._counters.setdefault(company_id, counters)
+                counters = self._counters[company_id]
+        return counters
+
+    def seed(self):
+        """Load the counters of every company that has budgets; returns the number of companies"""
+        company_ids = db.session.execute(select(Budget.company_id).distinct()).scalars().all()
+        for company_id in company_ids:
+            self._company_counters(company_id)
+        return len(company_ids)
+
+    def _on_commit(self, deltas, rebuilt):
+        """Apply committed rollup deltas to the counters of seeded companies"""
+        with self._lock:
+            if None in rebuilt:
+                self._counters.clear()
+            for company_id in rebuilt:
+                self._counters.pop(company_id, None)
+                self._versions[company_id] = self._versions.get(company_id, 0) + 1
+            for changes in deltas:
+                for (company_id, user_id, category, _, day, status), (_, _, amount) in changes.items():
+                    self._versions[company_id] = self._versions.get(company_id, 0) + 1
+                    counters = self._counters.get(company_id)
+                    if counters is None or status not in COUNTED_STATUSES or not amount:
+                        continue
+                    for key in _counter_keys(user_id, category, _month(day)):
+                        counters[key] = counters.get(key, Decimal('0')) + amount
+
+    def _spent(self, counters, budget, day):
+        start, months = budget.period_months(day)
+        return start, sum((counters.get((budget.user_id, budget.category, month), Decimal('0'))
+                           for month in months), Decimal('0.00'))
+
+    # Checks
+    def check(self, user, category, day, amount):
+        """Decide whether ``amount`` (base currency) on ``day`` fits ``user``'s budgets
+
+        Returns a ``BudgetDecision``; blocking budgets make it ``over_budget``
+        and the rest ``requires_approval`` when the amount would exceed them.
+        """
+        budgets = [budget for budget in self.budgets_for(user.company_id) if budget.applies_to(user.id, category)]
+        if not budgets:
+            return BudgetDecision([])
+
+        counters = self._company_counters(user.company_id)
+        amount = Decimal(str(amount or 0))
+        checks = []
+        for budget in budgets:
+            start, spent = self._spent(counters, budget, day)
+            checks.append({
+                'budget_id': budget.id,
+                'name': budget.name,
+                'period': budget.period,
+                'period_start': start.isoformat(),
+                'limit': str(budget.limit),
+                'spent': str(spent),
+                'projected': str(spent + amount),
+                'action': budget.action,
+                'exceeded': spent + amount > budget.limit
+            })
+        return BudgetDecision(checks)
+
+    def usage(self, company_id, day=None):
+        """``{budget_id: (period_start, spent)}`` for the period containing ``day`` (default today)"""
+        day = day or date.today()
+        budgets = self.budgets_for(company_id)
+        if not budgets:
+            return {}
+        counters = self._company_counters(company_id)
+        return {budget.id: self._spent(counters, budget, day) for budget in budgets}
+
+    # Reconciliation
+    def reconcile(self):
+        """Compare every seeded company's counters with SQL and replace drifted ones
+
+        Returns a report of the differences found. A company whose spend
+        changes while it is being read is skipped until the next run.
+        """
+        with self._lock:
+            seeded = [(company_id, self._versions.get(company_id, 0)) for company_id in self._counters]
+
+        drifted = []
+        skipped = []
+        for company_id, version in seeded:
+            actual = self._read(company_id)
+            with self._lock:
+                counters = self._counters.get(company_id)
+                if counters is None or self._versions.get(company_id, 0) != version:
+                    skipped.append(company_id)
+                    continue
+                for key in set(counters) | set(actual):
+                    counter = counters.get(key, Decimal('0'))
+                    expected = actual.get(key, Decimal('0'))
+                    if abs(counter - expected) > DRIFT_TOLERANCE:
+                        user_id, category, month = key
+                        drifted.append({
+                            'company_id': company_id, 'user_id': user_id, 'category': category,
+                            'month': month, 'counter': str(counter), 'actual': str(expected)
+                        })
+                self._counters[company_id] = actual
+
+        if drifted:
+            print(f"⚠️ Budget counters drifted on {len(drifted)} key(s); reset from SQL")
+        self.last_reconcile = {
+            'checked_at': datetime.utcnow().isoformat(),
+            'companies': len(seeded) - len(skipped),
+            'skipped': skipped,
+            'drifted': drifted
+        }
+        return self.last_reconcile
+
+    def _start_worker(self):
+        if self._worker is not None:
+            return
+
+        def run():
+            try:
+                with self.app.app_context():
+                    self.seed()
+            except Exception as e:
+                print(f"❌ Budget counter seeding error: {e}")
+            while self.reconcile_interval > 0:
+                time.sleep(self.reconcile_interval)
+                try:
+                    with self.app.app_context():
+                        self.seed()
+                        self.reconcile()
+                except Exception as e:
+                    print(f"❌ Budget reconciliation error: {e}")
+
+        with self._lock:
+            if self._worker is not None:
+                return
+            self._worker = threading.Thread(target=run, name='budget-counters', daemon=True)
+        self._worker.start()
+
+
+# Initialize global budget tracker
+budget_tracker = BudgetTracker()
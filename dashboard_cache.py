@@ -0,0 +1,99 @@
+"""
+Dashboard Counters for Expense Management System
+Per-company manager dashboard counters computed in one aggregate query and cached
+"""
+
+import os
+import threading
+import time
+from datetime import datetime
+from decimal import Decimal
+
+from sqlalchemy import select, func, case, true
+
+from database import db
+from models import User, Expense, ExpenseApproval
+
+
+class DashboardCounters:
+    """Caches manager dashboard counters per company
+
+    Entries are dropped explicitly when an expense in the company is
+    submitted, approved or rejected. The TTL bounds staleness when several
+    worker processes each hold their own cache.
+    """
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl if ttl is not None else float(os.getenv('DASHBOARD_CACHE_TTL', '300'))
+        self._entries = {}
+        self._generations = {}
+        self._epoch = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _month_start():
+        return datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+    def _compute(self, company_id, month_start):
+        company_users = select(User.id).where(User.company_id == company_id).scalar_subquery()
+        is_pending = Expense.status == 'Submitted'
+
+        pending = select(
+            func.count(case((is_pending, 1))),
+            func.coalesce(func.sum(case((is_pending, Expense.final_amount_base_currency))), 0)
+        ).where(Expense.user_id.in_(company_users)).subquery()
+
+        actions = select(
+            func.count(case((ExpenseApproval.action == 'Approved', 1))).label('approved'),
+            func.count(case((ExpenseApproval.action == 'Rejected', 1))).label('rejected')
+        ).join(Expense, ExpenseApproval.expense_id == Expense.id).where(
+            ExpenseApproval.created_at >= month_start,
+            Expense.user_id.in_(company_users)
+        ).subquery()
+
+        team_count = select(func.count(User.id)).where(
+            User.company_id == company_id, User.role == 'Employee'
+        ).scalar_subquery()
+
+        # Both aggregates are single rows; join them explicitly so the statement has no implicit cross join
+        row = db.session.execute(select(
+            *pending.c, actions.c.approved, actions.c.rejected, team_count
+        ).select_from(pending.join(actions, true()))).one()
+
+        return {
+            'pending_count': row[0],
+            'total_amount_pending': Decimal(str(row[1] or 0)),
+            'approved_this_month': row[2],
+            'rejected_this_month': row[3],
+            'team_count': row[4],
+        }
+
+    def get(self, company_id):
+        month_start = self._month_start()
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(company_id)
+            generation = (self._epoch, self._generations.get(company_id, 0))
+        if entry is not None and entry[0] == month_start and now - entry[1] < self.ttl:
+            return entry[2]
+
+        counters = self._compute(company_id, month_start)
+        with self._lock:
+            # Skip caching if the company was invalidated while we were computing
+            if (self._epoch, self._generations.get(company_id, 0)) == generation:
+                self._entries[company_id] = (month_start, now, counters)
+        return counters
+
+    def invalidate(self, company_id=None):
+        """Drop cached counters for one company, or for all companies"""
+        with self._lock:
+            if company_id is None:
+                self._entries.clear()
+                self._epoch += 1
+            else:
+                self._entries.pop(company_id, None)
+                self._generations[company_id] = self._generations.get(company_id, 0) + 1
+
+
+# Initialize global dashboard counters
+dashboard_counters = DashboardCounters()
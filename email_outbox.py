@@ -0,0 +1,213 @@
+"""
+Email Outbox for Expense Management System
+Queues emails in the database and sends them from a background worker over a
+reused SMTP connection, with retry and exponential backoff
+"""
+
+import os
+import random
+import smtplib
+import threading
+import time
+from datetime import datetime, timedelta
+
+from database import db
+from models import EmailOutbox
+from email_service import email_service
+
+
+class EmailOutboxWorker:
+    """Drains the ``email_outbox`` table in batches
+
+    Requests only insert rows (``enqueue``) and return. The worker claims due
+    rows, sends them over one SMTP session that is kept open between batches
+    for up to ``keepalive`` seconds, and records the outcome. Failed sends are
+    retried with exponential backoff until ``max_attempts`` is reached. Bodies
+    are cleared once a job is Sent or Failed.
+
+    Set ``EMAIL_OUTBOX_WORKER=off`` when running ``flask email-worker`` as a
+    separate process instead of the in-process thread.
+    """
+
+    def __init__(self, service=None):
+        self.service = service or email_service
+        self.mode = os.getenv('EMAIL_OUTBOX_WORKER', 'thread').lower()
+        self.batch_size = int(os.getenv('EMAIL_OUTBOX_BATCH_SIZE', '50'))
+        self.max_attempts = int(os.getenv('EMAIL_OUTBOX_MAX_ATTEMPTS', '5'))
+        self.backoff_seconds = float(os.getenv('EMAIL_OUTBOX_BACKOFF', '30'))
+        self.poll_seconds = float(os.getenv('EMAIL_OUTBOX_POLL', '5'))
+        self.keepalive_seconds = float(os.getenv('SMTP_KEEPALIVE', '60'))
+        self.sending_timeout = timedelta(minutes=10)
+        self.app = None
+        self._server = None
+        self._server_used_at = 0.0
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+    def init_app(self, app):
+        self.app = app
+        if self.mode == 'thread':
+            # Start on the first request so jobs left from before a restart
+            # are drained without waiting for new mail; CLI commands don't start it
+            app.before_request(self._ensure_thread)
+
+    # Producer side
+    def enqueue(self, recipient, subject, text_body, html_body=None):
+        """Add an email to the outbox; it is sent after the caller's transaction commits"""
+        job = EmailOutbox(recipient=recipient, subject=subject, text_body=text_body,
+                          html_body=html_body, status='Queued', next_attempt_at=datetime.utcnow())
+        db.session.add(job)
+        return job
+
+    def notify(self):
+        """Wake the worker after committing new jobs, starting it on first use"""
+        if self.mode == 'thread':
+            self._ensure_thread()
+        self._wakeup.set()
+
+    # Worker side
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self.run_forever, name='email-outbox', daemon=True)
+                self._thread.start()
+
+    def run_forever(self):
+        while True:
+            try:
+                sent = self.process_batch()
+            except Exception as e:
+                print(f"❌ Email outbox worker error: {e}")
+                sent = 0
+            if not sent:
+                self._close_idle_connection()
+                self._wakeup.wait(self.poll_seconds)
+                self._wakeup.clear()
+
+    def process_batch(self):
+        """Claim and send one batch of due emails; returns the number of jobs processed"""
+        with self.app.app_context():
+            jobs = self._claim()
+            if not jobs:
+                return 0
+            results = self._send(jobs)
+            self._record(results)
+            return len(jobs)
+
+    def _claim(self):
+        now = datetime.utcnow()
+
+        # Recover jobs left in Sending by a worker that died mid-batch
+        EmailOutbox.query.filter(
+            EmailOutbox.status == 'Sending',
+            EmailOutbox.next_attempt_at < now - self.sending_timeout
+        ).update({'status': 'Queued'}, synchronize_session=False)
+
+        query = EmailOutbox.query.filter(
+            EmailOutbox.status == 'Queued',
+            EmailOutbox.next_attempt_at <= now
+        ).order_by(EmailOutbox.next_attempt_at, EmailOutbox.id).limit(self.batch_size)
+        if db.engine.dialect.name == 'postgresql':
+            query = query.with_for_update(skip_locked=True)
+
+        jobs = query.all()
+        for job in jobs:
+            job.status = 'Sending'
+            job.next_attempt_at = now
+        claimed = [(job.id, job.recipient, job.subject, job.text_body, job.html_body) for job in jobs]
+        db.session.commit()
+        return claimed
+
+    def _connection(self):
+        if self._server is not None:
+            try:
+                if self._server.noop()[0] == 250:
+                    return self._server
+            except smtplib.SMTPException:
+                pass
+            self._drop_connection()
+        self._server = self.service.connect()
+        return self._server
+
+    def _drop_connection(self):
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._server = None
+
+    def _close_idle_connection(self):
+        if self._server is not None and time.time() - self._server_used_at > self.keepalive_seconds:
+            self._drop_connection()
+
+    def _send(self, jobs):
+        results = []
+        if not self.service.is_configured():
+            return [(job[0], 'Email not configured') for job in jobs]
+
+        for job_id, recipient, subject, text_body, html_body in jobs:
+            error = None
+            for attempt in range(2):  # Reconnect once if the kept-alive session was dropped
+                try:
+                    server = self._connection()
+                    self.service.send_message(server, recipient, subject, text_body or '', html_body)
+                    self._server_used_at = time.time()
+                    error = None
+                    break
+                except smtplib.SMTPServerDisconnected as e:
+                    self._server = None
+                    error = str(e)
+                except (smtplib.SMTPException, OSError) as e:
+                    error = str(e)
+                    if not isinstance(e, smtplib.SMTPRecipientsRefused):
+                        self._drop_connection()
+                    break
+            results.append((job_id, error))
+        return results
+
+    def _record(self, results):
+        now = datetime.utcnow()
+        jobs = {job.id: job for job in EmailOutbox.query.filter(
+            EmailOutbox.id.in_([job_id for job_id, _ in results])
+        )}
+        for job_id, error in results:
+            job = jobs[job_id]
+            job.attempts += 1
+            if error is None:
+                job.status = 'Sent'
+                job.sent_at = now
+                job.last_error = None
+            else:
+                job.last_error = error
+                if job.attempts < self.max_attempts:
+                    delay = self.backoff_seconds * (2 ** (job.attempts - 1))
+                    job.status = 'Queued'
+                    job.next_attempt_at = now + timedelta(seconds=delay * random.uniform(0.8, 1.2))
+                    continue
+                job.status = 'Failed'
+            # Finished either way: drop the bodies so temporary passwords don't linger
+            job.text_body = None
+            job.html_body = None
+        db.session.commit()
+
+
+def job_status(job):
+    """Serialize an outbox row for the status endpoint"""
+    return {
+        'job_id': job.id,
+        'recipient': job.recipient,
+        'status': job.status,
+        'attempts': job.attempts,
+        'last_error': job.last_error,
+        'next_attempt_at': job.next_attempt_at.isoformat() if job.status == 'Queued' else None,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'sent_at': job.sent_at.isoformat() if job.sent_at else None
+    }
+
+
+# Initialize global email outbox worker
+email_outbox = EmailOutboxWorker()
@@ -20,6 +20,45 @@ class EmailService:
         self.sender_email = os.getenv('SENDER_EMAIL', 'admin@company.com')
         self.sender_password = os.getenv('SENDER_PASSWORD', '')
         self.sender_name = os.getenv('SENDER_NAME', 'Expense Management System')
+        # Set both to false to talk to a local debugging SMTP server (e.g. aiosmtpd)
+        self.use_tls = os.getenv('SMTP_USE_TLS', 'true').lower() == 'true'
+        self.use_auth = os.getenv('SMTP_USE_AUTH', 'true').lower() == 'true'
+        self.timeout = float(os.getenv('SMTP_TIMEOUT', '10'))
+    
+    def is_configured(self):
+        """Check whether outgoing email can be sent"""
+        if not self.use_auth:
+            return True
+        return bool(self.sender_password) and self.sender_password != 'your-app-password'
+    
+    def connect(self):
+        """Open an SMTP connection, upgraded to TLS and logged in as configured"""
+        server = smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=self.timeout)
+        try:
+            if self.use_tls:
+                server.starttls(context=ssl.create_default_context())
+            if self.use_auth and self.sender_password:
+                server.login(self.sender_email, self.sender_password)
+        except Exception:
+            server.close()
+            raise
+        return server
+    
+    def create_message(self, recipient, subject, text_content, html_content=None):
+        """Build a multipart message from the sender settings"""
+        message = MIMEMultipart("alternative")
+        message["Subject"] = subject
+        message["From"] = f"{self.sender_name} <{self.sender_email}>"
+        message["To"] = recipient
+        message.attach(MIMEText(text_content, "plain"))
+        if html_content:
+            message.attach(MIMEText(html_content, "html"))
+        return message
+    
+    def send_message(self, server, recipient, subject, text_content, html_content=None):
+        """Send one message over an already open connection"""
+        message = self.create_message(recipient, subject, text_content, html_content)
+        server.sendmail(self.sender_email, recipient, message.as_string())
         
     def generate_random_password(self, length=12):
         """Generate a secure random password"""
@@ -27,128 +66,153 @@ class EmailService:
         password = ''.join(secrets.choice(characters) for _ in range(length))
         return password
     
+    def build_password_reset_email(self, user_email, user_name, new_password):
+        """Build the subject, plain text and HTML bodies of a password reset email"""
+        subject = "Password Reset - Expense Management System"
+        
+        # Create the HTML content
+        html_content = f"""
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <style>
+                body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; }}
+                .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
+                .header {{ background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); 
+                         color: white; padding: 20px; text-align: center; border-radius: 10px 10px 0 0; }}
+                .content {{ background: #f9f9f9; padding: 30px; border-radius: 0 0 10px 10px; }}
+                .password-box {{ background: #fff; border: 2px solid #667eea; padding: 15px; 
+                               margin: 20px 0; text-align: center; border-radius: 8px; }}
+                .password {{ font-family: 'Courier New', monospace; font-size: 18px; 
+                           font-weight: bold; color: #667eea; letter-spacing: 2px; }}
+                .footer {{ margin-top: 30px; padding-top: 20px; border-top: 1px solid #ddd; 
+                         font-size: 12px; color: #666; }}
+                .warning {{ background: #fff3cd; border: 1px solid #ffeaa7; padding: 15px; 
+                          border-radius: 5px; margin: 20px 0; }}
+            </style>
+        </head>
+        <body>
+            <div class="container">
+                <div class="header">
+                    <h1>🔐 Password Reset</h1>
+                    <p>Expense Management System</p>
+                </div>
+                <div class="content">
+                    <h2>Hello {user_name},</h2>
+                    <p>Your password has been reset by a system administrator. Below is your new temporary password:</p>
+                    
+                    <div class="password-box">
+                        <p><strong>Your New Password:</strong></p>
+                        <div class="password">{new_password}</div>
+                    </div>
+                    
+                    <div class="warning">
+                        <strong>⚠️ Important Security Notice:</strong>
+                        <ul>
+                            <li>Please change this password immediately after logging in</li>
+                            <li>Do not share this password with anyone</li>
+                            <li>Use a strong, unique password for your account</li>
+                        </ul>
+                    </div>
+                    
+                    <p><strong>How to log in:</strong></p>
+                    <ol>
+                        <li>Go to the expense management system login page</li>
+                        <li>Use your email address: <strong>{user_email}</strong></li>
+                        <li>Use the temporary password provided above</li>
+                        <li>Change your password in your profile settings</li>
+                    </ol>
+                    
+                    <p>If you did not request this password reset or have any concerns, please contact your system administrator immediately.</p>
+                    
+                    <div class="footer">
+                        <p>This email was sent on {datetime.now().strftime('%B %d, %Y at %I:%M %p')}</p>
+                        <p>© 2025 Expense Management System. This is an automated message, please do not reply.</p>
+                    </div>
+                </div>
+            </div>
+        </body>
+        </html>
+        """
+        
+        # Create plain text version
+        text_content = f"""
+        Password Reset - Expense Management System
+        
+        Hello {user_name},
+        
+        Your password has been reset by a system administrator.
+        
+        Your new temporary password is: {new_password}
+        
+        IMPORTANT SECURITY NOTICE:
+        - Please change this password immediately after logging in
+        - Do not share this password with anyone
+        - Use a strong, unique password for your account
+        
+        How to log in:
+        1. Go to the expense management system login page
+        2. Use your email address: {user_email}
+        3. Use the temporary password provided above
+        4. Change your password in your profile settings
+        
+        If you did not request this password reset, please contact your system administrator.
+        
+        This email was sent on {datetime.now().strftime('%B %d, %Y at %I:%M %p')}
+        """
+        
+        return subject, text_content, html_content
+    
+    def build_welcome_email(self, user_email, user_name, password):
+        """Build the subject, plain text and HTML bodies of a new account email"""
+        subject = "Welcome - Expense Management System"
+        
+        html_content = f"""
+        <!DOCTYPE html>
+        <html>
+        <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
+            <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
+                <h2>Hello {user_name},</h2>
+                <p>An account has been created for you in the Expense Management System.</p>
+                <p><strong>Email:</strong> {user_email}<br>
+                   <strong>Temporary password:</strong> <code>{password}</code></p>
+                <p>Please change this password immediately after logging in.</p>
+            </div>
+        </body>
+        </html>
+        """
+        
+        text_content = f"""
+        Welcome - Expense Management System
+        
+        Hello {user_name},
+        
+        An account has been created for you in the Expense Management System.
+        
+        Email: {user_email}
+        Temporary password: {password}
+        
+        Please change this password immediately after logging in.
+        """
+        
+        return subject, text_content, html_content
+    
     def send_password_reset_email(self, user_email, user_name, new_password):
         """Send password reset email to user"""
         
         # Check if email is properly configured
-        if not self.sender_password or self.sender_password == 'your-app-password':
+        if not self.is_configured():
             print(f"⚠️ Email not configured. Password for {user_name}: {new_password}")
             return False, f"Email not configured. Password is: {new_password}"
         
         try:
-            # Create message
-            message = MIMEMultipart("alternative")
-            message["Subject"] = "Password Reset - Expense Management System"
-            message["From"] = f"{self.sender_name} <{self.sender_email}>"
-            message["To"] = user_email
-            
-            # Create the HTML content
-            html_content = f"""
-            <!DOCTYPE html>
-            <html>
-            <head>
-                <style>
-                    body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; }}
-                    .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
-                    .header {{ background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); 
-                             color: white; padding: 20px; text-align: center; border-radius: 10px 10px 0 0; }}
-                    .content {{ background: #f9f9f9; padding: 30px; border-radius: 0 0 10px 10px; }}
-                    .password-box {{ background: #fff; border: 2px solid #667eea; padding: 15px; 
-                                   margin: 20px 0; text-align: center; border-radius: 8px; }}
-                    .password {{ font-family: 'Courier New', monospace; font-size: 18px; 
-                               font-weight: bold; color: #667eea; letter-spacing: 2px; }}
-                    .footer {{ margin-top: 30px; padding-top: 20px; border-top: 1px solid #ddd; 
-                             font-size: 12px; color: #666; }}
-                    .warning {{ background: #fff3cd; border: 1px solid #ffeaa7; padding: 15px; 
-                              border-radius: 5px; margin: 20px 0; }}
-                </style>
-            </head>
-            <body>
-                <div class="container">
-                    <div class="header">
-                        <h1>🔐 Password Reset</h1>
-                        <p>Expense Management System</p>
-                    </div>
-                    <div class="content">
-                        <h2>Hello {user_name},</h2>
-                        <p>Your password has been reset by a system administrator. Below is your new temporary password:</p>
-                        
-                        <div class="password-box">
-                            <p><strong>Your New Password:</strong></p>
-                            <div class="password">{new_password}</div>
-                        </div>
-                        
-                        <div class="warning">
-                            <strong>⚠️ Important Security Notice:</strong>
-                            <ul>
-                                <li>Please change this password immediately after logging in</li>
-                                <li>Do not share this password with anyone</li>
-                                <li>Use a strong, unique password for your account</li>
-                            </ul>
-                        </div>
-                        
-                        <p><strong>How to log in:</strong></p>
-                        <ol>
-                            <li>Go to the expense management system login page</li>
-                            <li>Use your email address: <strong>{user_email}</strong></li>
-                            <li>Use the temporary password provided above</li>
-                            <li>Change your password in your profile settings</li>
-                        </ol>
-                        
-                        <p>If you did not request this password reset or have any concerns, please contact your system administrator immediately.</p>
-                        
-                        <div class="footer">
-                            <p>This email was sent on {datetime.now().strftime('%B %d, %Y at %I:%M %p')}</p>
-                            <p>© 2025 Expense Management System. This is an automated message, please do not reply.</p>
-                        </div>
-                    </div>
-                </div>
-            </body>
-            </html>
-            """
-            
-            # Create plain text version
-            text_content = f"""
-            Password Reset - Expense Management System
-            
-            Hello {user_name},
-            
-            Your password has been reset by a system administrator.
-            
-            Your new temporary password is: {new_password}
-            
-            IMPORTANT SECURITY NOTICE:
-            - Please change this password immediately after logging in
-            - Do not share this password with anyone
-            - Use a strong, unique password for your account
-            
-            How to log in:
-            1. Go to the expense management system login page
-            2. Use your email address: {user_email}
-            3. Use the temporary password provided above
-            4. Change your password in your profile settings
-            
-            If you did not request this password reset, please contact your system administrator.
-            
-            This email was sent on {datetime.now().strftime('%B %d, %Y at %I:%M %p')}
-            """
-            
-            # Attach parts
-            part1 = MIMEText(text_content, "plain")
-            part2 = MIMEText(html_content, "html")
-            message.attach(part1)
-            message.attach(part2)
+            subject, text_content, html_content = self.build_password_reset_email(
+                user_email, user_name, new_password
+            )
             
             # Send email
-            context = ssl.create_default_context()
-            
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                server.starttls(context=context)
-                if self.sender_password:
-                    server.login(self.sender_email, self.sender_password)
-                
-                text = message.as_string()
-                server.sendmail(self.sender_email, user_email, text)
+            with self.connect() as server:
+                self.send_message(server, user_email, subject, text_content, html_content)
             
             return True, "Email sent successfully"
             
@@ -166,11 +230,8 @@ class EmailService:
     def test_email_connection(self):
         """Test email server connection"""
         try:
-            context = ssl.create_default_context()
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                server.starttls(context=context)
-                if self.sender_password:
-                    server.login(self.sender_email, self.sender_password)
+            with self.connect():
+                pass
             return True, "Email connection successful"
         except Exception as e:
             return False, f"Email connection failed: {str(e)}"
@@ -0,0 +1,198 @@
+"""
+Event Stream for Expense Management System
+Pushes expense submit/approve/reject deltas to open dashboards over Server-Sent Events
+"""
+
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+from abc import ABC, abstractmethod
+
+MANAGER_ROLES = ('Manager', 'Admin')
+
+
+class EventBroker(ABC):
+    """Carries published events to the hub in every web process
+
+    ``LocalBroker`` is enough for a single process. Deployments running
+    several processes plug in a broker backed by a shared channel (Redis
+    pub/sub, PostgreSQL LISTEN/NOTIFY, ...) whose ``start`` runs a listener
+    that calls ``deliver`` for each event received.
+    """
+
+    @abstractmethod
+    def start(self, deliver):
+        """Begin passing every published event to ``deliver(event)``"""
+
+    @abstractmethod
+    def publish(self, event):
+        """Send ``event`` (a JSON-serializable dict) to all processes"""
+
+
+class LocalBroker(EventBroker):
+    """Delivers events to subscribers in this process only"""
+
+    def __init__(self):
+        self._deliver = None
+
+    def start(self, deliver):
+        self._deliver = deliver
+
+    def publish(self, event):
+        if self._deliver is not None:
+            self._deliver(event)
+
+
+class Subscription:
+    """One open event stream"""
+
+    def __init__(self, user_id, company_id, role, max_queued):
+        self.user_id = user_id
+        self.company_id = company_id
+        self.role = role
+        self.queue = queue.Queue(max_queued)
+        self.overflowed = False
+
+    def matches(self, event):
+        return self.user_id in event['user_ids'] or self.role in event['roles']
+
+    def put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            # A stalled client; tell it to reload rather than buffering without limit
+            self.overflowed = True
+
+
+def format_event(event_type, data, event_id=None):
+    """Encode one Server-Sent Events message"""
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event_type}')
+    lines.append(f'data: {json.dumps(data, separators=(",", ":"))}')
+    return '\n'.join(lines) + '\n\n'
+
+
+class EventHub:
+    """Fans published events out to the open streams that should see them
+
+    Subscriptions are grouped by company, so delivering an event touches
+    only that company's streams. Each stream has a bounded queue; a client
+    that falls behind gets a ``resync`` event and is expected to reload.
+    Each open stream holds one server thread while idle, so run the app
+    with a threaded or async worker and cap streams with
+    ``EVENT_STREAM_MAX_CONNECTIONS``.
+    """
+
+    def __init__(self, broker=None):
+        self.heartbeat_seconds = float(os.getenv('EVENT_STREAM_HEARTBEAT', '15'))
+        self.max_queued = int(os.getenv('EVENT_STREAM_QUEUE', '100'))
+        self.max_connections = int(os.getenv('EVENT_STREAM_MAX_CONNECTIONS', '500'))
+        self.retry_ms = 5000
+        self._subscribers = {}  # company_id -> set of Subscription
+        self._count = 0
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.set_broker(broker or LocalBroker())
+
+    def set_broker(self, broker):
+        self.broker = broker
+        broker.start(self._deliver)
+
+    # Publishing
+    def publish(self, event_type, data, company_id, user_ids=(), roles=()):
+        """Send an event to the given users and to every user with one of ``roles`` in the company"""
+        event = {
+            'id': f'{int(time.time() * 1000)}-{next(self._ids)}',
+            'type': event_type,
+            'data': data,
+            'company_id': company_id,
+            'user_ids': list(user_ids),
+            'roles': list(roles)
+        }
+        try:
+            self.broker.publish(event)
+        except Exception as e:
+            # Live updates are best-effort; never fail the request that changed the data
+            print(f"❌ Event publish failed: {e}")
+
+    def _deliver(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(event['company_id'], ()))
+        for subscription in subscribers:
+            if subscription.matches(event):
+                subscription.put(event)
+
+    # Subscribing
+    def at_capacity(self):
+        with self._lock:
+            return self._count >= self.max_connections
+
+    def _subscribe(self, user_id, company_id, role):
+        subscription = Subscription(user_id, company_id, role, self.max_queued)
+        with self._lock:
+            self._subscribers.setdefault(company_id, set()).add(subscription)
+            self._count += 1
+        return subscription
+
+    def _unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.company_id)
+            if subscribers is not None and subscription in subscribers:
+                subscribers.discard(subscription)
+                self._count -= 1
+                if not subscribers:
+                    del self._subscribers[subscription.company_id]
+
+    def stream(self, user_id, company_id, role):
+        """Generator of SSE text for one client; subscribes on first iteration"""
+        subscription = self._subscribe(user_id, company_id, role)
+        try:
+            yield f'retry: {self.retry_ms}\n\n'
+            yield format_event('ready', {'user_id': user_id})
+            while not subscription.overflowed:
+                try:
+                    event = subscription.queue.get(timeout=self.heartbeat_seconds)
+                except queue.Empty:
+                    yield ': keepalive\n\n'  # Also detects disconnected clients
+                    continue
+                yield format_event(event['type'], event['data'], event['id'])
+            yield format_event('resync', {})
+        finally:
+            self._unsubscribe(subscription)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'connections': self._count,
+                'companies': len(self._subscribers),
+                'broker': type(self.broker).__name__
+            }
+
+
+def expense_event_data(expense, submitter, currency, **extra):
+    """Payload describing an expense; build it before commit, while attributes are loaded"""
+    data = {
+        'expense_id': expense.id,
+        'status': expense.status,
+        'user_id': submitter.id,
+        'submitter_name': submitter.name,
+        'submitter_email': submitter.email,
+        'category': expense.category,
+        'description': expense.description,
+        'date': expense.date.isoformat() if expense.date else None,
+        'amount': str(expense.final_amount_base_currency) if expense.final_amount_base_currency is not None else None,
+        'currency': currency,
+        'amount_spent': str(expense.amount_spent) if expense.amount_spent is not None else None,
+        'currency_spent': expense.currency_spent
+    }
+    data.update(extra)
+    return data
+
+
+# Initialize global event hub
+event_hub = EventHub()
@@ -0,0 +1,239 @@
+"""
+Exchange Rate Service for Expense Management System
+Caches per-base-currency rate tables with TTL, single-flight refresh and offline snapshots
+"""
+
+import json
+import os
+import threading
+import time
+from decimal import Decimal, ROUND_HALF_UP
+
+import requests
+
+from http_client import http_client
+
+
+class RateProviderError(Exception):
+    """Raised when a provider cannot return a rate table"""
+
+
+class HTTPRateProvider:
+    """Fetch rate tables from the ExchangeRate API"""
+
+    def __init__(self, base_url=None, timeout=None):
+        self.base_url = base_url or os.getenv('EXCHANGE_RATE_API_URL', 'https://api.exchangerate-api.com/v4/latest')
+        self.timeout = timeout or float(os.getenv('EXCHANGE_RATE_TIMEOUT', '5'))
+
+    def fetch(self, base_currency):
+        try:
+            response = http_client.get(f'{self.base_url}/{base_currency}', timeout=self.timeout)
+            response.raise_for_status()
+            data = response.json()
+            return {'date': data.get('date'), 'rates': data['rates']}
+        except (requests.exceptions.RequestException, KeyError, ValueError) as e:
+            raise RateProviderError(f'Error fetching exchange rates for {base_currency}: {e}')
+
+
+class JSONFileRateProvider:
+    """Serve rate tables from a local JSON file (used for tests and offline setups)
+
+    The file maps base currency codes to ``{"date": ..., "rates": {...}}``.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def fetch(self, base_currency):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                tables = json.load(f)
+            table = tables[base_currency]
+            return {'date': table.get('date'), 'rates': table['rates']}
+        except (OSError, KeyError, ValueError) as e:
+            raise RateProviderError(f'No local rate table for {base_currency}: {e}')
+
+
+class _Entry:
+    __slots__ = ('date', 'rates', 'fetched_at')
+
+    def __init__(self, date, rates, fetched_at):
+        self.date = date
+        self.rates = rates
+        self.fetched_at = fetched_at
+
+
+class ExchangeRateService:
+    """In-process cache of whole rate tables keyed by base currency
+
+    - Fresh entries (younger than ``ttl``) are served directly.
+    - Stale entries (younger than ``max_stale``) are served while a single
+      background refresh runs.
+    - Misses block on one fetch per base currency; concurrent callers wait
+      for that fetch instead of issuing their own.
+    - When ``cache_dir`` is set, every table is snapshotted to disk and the
+      snapshot is used when the provider is unreachable.
+    """
+
+    def __init__(self, provider=None, ttl=None, max_stale=None, cache_dir=None):
+        self.provider = provider or HTTPRateProvider()
+        self.ttl = ttl if ttl is not None else float(os.getenv('EXCHANGE_RATE_TTL', '3600'))
+        self.max_stale = max_stale if max_stale is not None else float(os.getenv('EXCHANGE_RATE_MAX_STALE', '86400'))
+        self.cache_dir = cache_dir if cache_dir is not None else os.getenv('EXCHANGE_RATE_CACHE_DIR')
+        self._entries = {}
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self._stats = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'fetches': 0,
+                           'fetch_errors': 0, 'snapshot_loads': 0}
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['cached_bases'] = sorted(self._entries.keys())
+        return stats
+
+    def clear(self):
+        self._entries.clear()
+
+    def set_provider(self, provider):
+        """Swap the upstream provider and drop cached tables"""
+        self.provider = provider
+        self.clear()
+
+    def _count(self, key):
+        with self._stats_lock:
+            self._stats[key] += 1
+
+    def _lock_for(self, base_currency):
+        with self._locks_guard:
+            lock = self._locks.get(base_currency)
+            if lock is None:
+                lock = self._locks[base_currency] = threading.Lock()
+            return lock
+
+    # Disk snapshots
+    def _snapshot_path(self, base_currency):
+        return os.path.join(self.cache_dir, f'{base_currency}.json')
+
+    def _load_snapshot(self, base_currency):
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._snapshot_path(base_currency), 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self._count('snapshot_loads')
+            return _Entry(data.get('date'), data['rates'], data['fetched_at'])
+        except (OSError, KeyError, ValueError):
+            return None
+
+    def _save_snapshot(self, base_currency, entry):
+        if not self.cache_dir:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = self._snapshot_path(base_currency) + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'date': entry.date, 'rates': entry.rates, 'fetched_at': entry.fetched_at}, f)
+            os.replace(tmp_path, self._snapshot_path(base_currency))
+        except OSError as e:
+            print(f"Warning: could not write rate snapshot for {base_currency}: {e}")
+
+    # Fetching
+    def _fetch(self, base_currency):
+        self._count('fetches')
+        try:
+            table = self.provider.fetch(base_currency)
+        except RateProviderError as e:
+            self._count('fetch_errors')
+            print(e)
+            return None
+        entry = _Entry(table.get('date'), table['rates'], time.time())
+        self._entries[base_currency] = entry
+        self._save_snapshot(base_currency, entry)
+        return entry
+
+    def _refresh_in_background(self, base_currency):
+        lock = self._lock_for(base_currency)
+        if not lock.acquire(blocking=False):
+            return  # A refresh is already running
+
+        def run():
+            try:
+                self._fetch(base_currency)
+            finally:
+                lock.release()
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def get_table(self, base_currency):
+        """Return ``(date, rates)`` for a base currency, or None if unavailable"""
+        base_currency = base_currency.upper()
+        entry = self._entries.get(base_currency)
+        if entry is None:
+            entry = self._load_snapshot(base_currency)
+            if entry is not None:
+                self._entries[base_currency] = entry
+
+        now = time.time()
+        if entry is not None:
+            age = now - entry.fetched_at
+            if age < self.ttl:
+                self._count('hits')
+                return entry.date, entry.rates
+            if age < self.max_stale:
+                self._count('stale_hits')
+                self._refresh_in_background(base_currency)
+                return entry.date, entry.rates
+
+        self._count('misses')
+        with self._lock_for(base_currency):
+            current = self._entries.get(base_currency)
+            if current is not None and current is not entry and time.time() - current.fetched_at < self.ttl:
+                return current.date, current.rates  # Filled by a concurrent caller
+            fetched = self._fetch(base_currency)
+
+        if fetched is not None:
+            return fetched.date, fetched.rates
+        if entry is not None:
+            # Upstream is down - fall back to the last known table however old
+            return entry.date, entry.rates
+        return None
+
+    def get_rate(self, from_currency, to_currency):
+        """Return ``(Decimal rate, date)`` or None if the pair is unknown"""
+        if from_currency == to_currency:
+            return Decimal('1'), None
+        table = self.get_table(from_currency)
+        if table is None:
+            return None
+        date, rates = table
+        rate = rates.get(to_currency)
+        if rate is None:
+            return None
+        return Decimal(str(rate)), date
+
+    def convert(self, amount, from_currency, to_currency):
+        """Convert an amount to ``to_currency``, falling back to 1:1 if no rate is available"""
+        amount = Decimal(str(amount))
+        result = self.get_rate(from_currency, to_currency)
+        if result is None:
+            print(f"Warning: no exchange rate for {from_currency}->{to_currency}, using 1:1")
+            return amount
+        rate, _ = result
+        return (amount * rate).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+
+def _default_provider():
+    path = os.getenv('EXCHANGE_RATE_PROVIDER_FILE')
+    if path:
+        return JSONFileRateProvider(path)
+    return HTTPRateProvider()
+
+
+# Initialize global exchange rate service
+exchange_rates = ExchangeRateService(provider=_default_provider())
@@ -0,0 +1,286 @@
+"""
+Expense Import for Expense Management System
+Streams CSV/OFX card statements into draft expenses in chunks
+"""
+
+import csv
+import io
+import os
+import re
+from datetime import date, datetime
+from functools import lru_cache
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP, localcontext
+
+from sqlalchemy import insert
+
+from database import db
+from models import Expense
+from exchange_rates import exchange_rates
+from fx_history import fx_rates
+from reference_data import reference_data
+from spend_rollups import spend_rollups
+
+CENT = Decimal('0.01')
+MAX_AMOUNT = Decimal('99999999.99')  # Numeric(10, 2)
+DATE_FORMATS = ('%m/%d/%Y', '%d.%m.%Y', '%Y%m%d')  # Tried after ISO 8601
+
+# Accepted CSV header spellings, normalized to lower case
+COLUMN_ALIASES = {
+    'date': ('date', 'transaction date', 'posted date', 'posting date'),
+    'description': ('description', 'memo', 'payee', 'name', 'merchant'),
+    'amount': ('amount', 'amount_spent', 'amount spent', 'debit'),
+    'credit': ('credit',),
+    'currency': ('currency', 'currency_spent', 'currency spent', 'currency code'),
+    'category': ('category',),
+}
+
+
+class ExpenseImportError(Exception):
+    """Raised when the file as a whole can't be imported; ``status_code`` is the HTTP status to return"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+@lru_cache(maxsize=4096)
+def parse_date(value):
+    """Parse a statement date; cached because statements repeat the same few dates"""
+    value = (value or '').strip()
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        pass
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format).date()
+        except ValueError:
+            continue
+    raise ValueError(f'Unrecognized date: {value!r}')
+
+
+# Readers yield (line_number, {'date', 'description', 'amount', 'currency', 'category'}) with raw strings;
+# spending is a positive amount and credits (refunds, reversals, payments) a negative one
+def iter_csv_rows(stream):
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    reader = csv.reader(text)
+    header = next(reader, None)
+    if not header:
+        raise ExpenseImportError('The file is empty')
+
+    normalized = [h.strip().lower() for h in header]
+    columns = {}
+    for field, aliases in COLUMN_ALIASES.items():
+        for alias in aliases:
+            if alias in normalized:
+                columns[field] = normalized.index(alias)
+                break
+    missing = [field for field in ('date', 'amount') if field not in columns]
+    if missing:
+        raise ExpenseImportError(f'Missing required column(s): {", ".join(missing)}')
+
+    for row in reader:
+        if not any(cell.strip() for cell in row):
+            continue
+        raw = {field: row[index] if index < len(row) else '' for field, index in columns.items()}
+        credit = raw.pop('credit', '').strip()
+        if credit and not raw['amount'].strip():
+            raw['amount'] = f'-{credit}'  # Separate debit/credit columns
+        yield reader.line_num, raw
+
+
+_OFX_TAG = re.compile(r'<(/?)([A-Za-z0-9.]+)>([^<]*)')
+
+
+def iter_ofx_rows(stream, chunk_size=64 * 1024):
+    """Yield ``STMTTRN`` records from an OFX 1.x (SGML) or 2.x (XML) statement"""
+    default_currency = None
+    transaction = None
+    number = 0
+    buffer = ''
+    text = io.TextIOWrapper(stream, encoding='utf-8', errors='replace')
+
+    while True:
+        chunk = text.read(chunk_size)
+        buffer += chunk
+        # Keep a possibly incomplete trailing tag for the next read
+        cut = buffer.rfind('<') if chunk else len(buffer)
+        complete, buffer = buffer[:cut], buffer[cut:]
+
+        for closing, tag, value in _OFX_TAG.findall(complete):
+            tag = tag.upper()
+            value = value.strip()
+            if tag == 'CURDEF' and not closing:
+                default_currency = value
+            elif tag == 'STMTTRN':
+                if closing and transaction is not None:
+                    number += 1
+                    transaction.setdefault('currency', default_currency or '')
+                    yield number, transaction
+                    transaction = None
+                elif not closing:
+                    transaction = {}
+            elif transaction is not None and not closing and value:
+                if tag == 'DTPOSTED':
+                    transaction['date'] = value[:8]
+                elif tag == 'TRNAMT':
+                    # OFX signs debits negative; flip so spending is positive like CSV amounts
+                    transaction['amount'] = value[1:] if value.startswith('-') else f"-{value.lstrip('+')}"
+                elif tag == 'NAME':
+                    transaction.setdefault('description', value)
+                elif tag == 'MEMO':
+                    transaction['description'] = f"{transaction['description']} - {value}" \
+                        if transaction.get('description') else value
+                elif tag == 'CURSYM':  # Inside <CURRENCY>/<ORIGCURRENCY>
+                    transaction['currency'] = value
+
+        if not chunk:
+            break
+
+
+class ImportResult:
+    def __init__(self, max_errors):
+        self.imported = 0
+        self.skipped = 0  # Credits
+        self.failed = 0
+        self.errors = []
+        self.max_errors = max_errors
+        self.rates = {}
+        self.dated_rates = {}
+
+    def error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'line': line, 'error': message})
+
+    def to_dict(self):
+        return {
+            'imported': self.imported,
+            'skipped_credits': self.skipped,
+            'failed': self.failed,
+            'errors': self.errors,
+            'errors_truncated': self.failed > len(self.errors),
+            'rates': {currency: str(rate) if rate is not None else None for currency, rate in self.rates.items()}
+        }
+
+
+class ExpenseImporter:
+    """Validates, converts and bulk-inserts statement rows as draft expenses
+
+    Rows are processed ``chunk_size`` at a time so memory stays bounded
+    regardless of file size. Rows are converted at the stored rate for
+    their own date (``fx_rates``), falling back to today's rate table when
+    none is stored; each (currency, date) rate is looked up once per
+    import. Every chunk is written with one bulk INSERT, and the whole
+    import commits once, so a failure part way leaves no partial import
+    behind.
+    """
+
+    def __init__(self):
+        self.chunk_size = int(os.getenv('EXPENSE_IMPORT_CHUNK_SIZE', '1000'))
+        self.max_rows = int(os.getenv('EXPENSE_IMPORT_MAX_ROWS', '100000'))
+        self.max_errors = 1000
+
+    def _validate(self, line, raw, default_category, default_currency, result):
+        try:
+            expense_date = parse_date(raw.get('date'))
+        except ValueError as e:
+            result.error(line, str(e))
+            return None
+
+        try:
+            amount = Decimal((raw.get('amount') or '').replace(',', '').strip())
+        except InvalidOperation:
+            result.error(line, f"Invalid amount: {raw.get('amount')!r}")
+            return None
+        if amount.is_finite() and amount < 0:
+            result.skipped += 1  # Refunds and payments aren't expenses
+            return None
+        if not amount.is_finite() or amount == 0 or amount > MAX_AMOUNT:
+            result.error(line, f"Invalid amount: {raw.get('amount')!r}")
+            return None
+
+        currency = (raw.get('currency') or '').strip().upper() or default_currency
+        if not currency:
+            result.error(line, 'Missing currency')
+            return None
+        if not reference_data.is_valid_currency(currency):
+            result.error(line, f'Unknown currency: {currency}')
+            return None
+
+        description = (raw.get('description') or '').strip() or 'Imported transaction'
+        category = (raw.get('category') or '').strip() or default_category
+        return line, expense_date, description[:1000], category[:100], amount.quantize(CENT, ROUND_HALF_UP), currency
+
+    def _rate(self, currency, base_currency, expense_date, result):
+        key = (currency, expense_date)
+        if key not in result.dated_rates:
+            rate = fx_rates.rate_on(currency, base_currency, expense_date)
+            if rate is None:
+                if currency not in result.rates:
+                    found = exchange_rates.get_rate(currency, base_currency)
+                    result.rates[currency] = found[0] if found is not None else None
+                rate = result.rates[currency]
+            result.dated_rates[key] = rate
+        return result.dated_rates[key]
+
+    def _flush(self, rows, user, base_currency, result):
+        values = []
+        with localcontext() as ctx:
+            ctx.prec = 28
+            for line, expense_date, description, category, amount, currency in rows:
+                rate = self._rate(currency, base_currency, expense_date, result)
+                # 1:1 without any rate, same fallback as single expense creation
+                final_amount = amount if rate is None else (amount * rate).quantize(CENT, ROUND_HALF_UP)
+                values.append({
+                    'user_id': user.id,
+                    'category': category,
+                    'description': description,
+                    'date': expense_date,
+                    'amount_spent': amount,
+                    'currency_spent': currency,
+                    'final_amount_base_currency': final_amount,
+                    'status': 'Draft'
+                })
+
+        if values:
+            db.session.execute(insert(Expense), values)
+            spend_rollups.add_rows(user.company_id, values)
+            result.imported += len(values)
+
+    def run(self, user, rows, default_category='Other', default_currency=None):
+        """Import ``(line, raw)`` pairs for ``user``; the caller commits
+
+        Rows without a currency use ``default_currency``, or the company's
+        base currency if that isn't given.
+        """
+        base_currency = user.company.base_currency_code
+        default_currency = (default_currency or base_currency).upper()
+        result = ImportResult(self.max_errors)
+        chunk = []
+        seen = 0
+
+        for line, raw in rows:
+            seen += 1
+            if seen > self.max_rows:
+                raise ExpenseImportError(f'Files are limited to {self.max_rows} rows', 413)
+            row = self._validate(line, raw, default_category, default_currency, result)
+            if row is not None:
+                chunk.append(row)
+            if len(chunk) >= self.chunk_size:
+                self._flush(chunk, user, base_currency, result)
+                chunk = []
+        self._flush(chunk, user, base_currency, result)
+        return result
+
+    def reader_for(self, stream, filename=None, file_format=None):
+        file_format = (file_format or os.path.splitext(filename or '')[1].lstrip('.')).lower()
+        if file_format in ('csv', 'txt'):
+            return iter_csv_rows(stream)
+        if file_format in ('ofx', 'qfx'):
+            return iter_ofx_rows(stream)
+        raise ExpenseImportError('Unsupported file format; upload a .csv or .ofx file', 415)
+
+
+# Initialize global expense importer
+expense_importer = ExpenseImporter()
@@ -0,0 +1,265 @@
+"""
+Historical FX Rates for Expense Management System
+Date-accurate exchange rates stored in ``fx_rates``, with batched backfill and bulk re-valuation
+"""
+
+import json
+import os
+import threading
+import time
+from bisect import bisect_right
+from datetime import date, datetime, timedelta
+from decimal import Decimal, ROUND_HALF_UP, localcontext
+
+import requests
+from sqlalchemy import select, update, insert, func, or_
+
+from database import db
+from models import Company, User, Expense, FxRate, ApprovalInboxItem
+from exchange_rates import exchange_rates, RateProviderError
+from http_client import http_client
+from spend_rollups import spend_rollups
+
+CENT = Decimal('0.01')
+
+
+class HTTPHistoricalRateProvider:
+    """Fetch daily rate series from a Frankfurter-compatible API (ECB reference rates)"""
+
+    name = 'frankfurter'
+
+    def __init__(self, base_url=None, timeout=None):
+        self.base_url = base_url or os.getenv('FX_HISTORY_API_URL', 'https://api.frankfurter.app')
+        self.timeout = timeout or float(os.getenv('EXCHANGE_RATE_TIMEOUT', '5'))
+
+    def fetch_range(self, base_currency, start, end):
+        """Return ``{date: {quote: rate}}`` for the days in ``start..end`` that have rates"""
+        try:
+            response = http_client.get(f'{self.base_url}/{start.isoformat()}..{end.isoformat()}',
+                                       params={'from': base_currency}, timeout=self.timeout)
+            response.raise_for_status()
+            rates = response.json()['rates']
+            return {date.fromisoformat(day): table for day, table in rates.items()}
+        except (requests.exceptions.RequestException, KeyError, ValueError) as e:
+            raise RateProviderError(f'Error fetching {base_currency} rates for {start}..{end}: {e}')
+
+
+class JSONFileHistoricalRateProvider:
+    """Serve rate series from a local JSON file (used for tests and offline setups)
+
+    The file maps base currency codes to ``{"YYYY-MM-DD": {"EUR": 0.9, ...}}``.
+    """
+
+    name = 'file'
+
+    def __init__(self, path):
+        self.path = path
+
+    def fetch_range(self, base_currency, start, end):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                series = json.load(f).get(base_currency, {})
+        except (OSError, ValueError) as e:
+            raise RateProviderError(f'Cannot read {self.path}: {e}')
+        result = {}
+        for day, table in series.items():
+            day = date.fromisoformat(day)
+            if start <= day <= end:
+                result[day] = table
+        return result
+
+
+class FxRateService:
+    """Looks up the rate in effect on a given date
+
+    Each currency pair's series is loaded from ``fx_rates`` once and kept as
+    sorted parallel lists, so a lookup is a binary search for the latest
+    rate on or before the date (weekends and holidays use the previous
+    business day). Rates are stored per base currency; the reverse
+    direction is derived from the inverse. A stored rate more than
+    ``FX_HISTORY_MAX_AGE_DAYS`` older than the date is not used, so dates
+    past the last backfill fall back to the live rate tables.
+    """
+
+    def __init__(self, provider=None, ttl=None):
+        self.provider = provider or _default_provider()
+        self.ttl = ttl if ttl is not None else float(os.getenv('FX_RATE_INDEX_TTL', '3600'))
+        self.batch_days = int(os.getenv('FX_BACKFILL_BATCH_DAYS', '90'))
+        self.max_age_days = int(os.getenv('FX_HISTORY_MAX_AGE_DAYS', '7'))
+        self._series = {}  # (base, quote) -> (loaded_at, dates, rates)
+        self._lock = threading.Lock()
+
+    # Lookups
+    def _load_series(self, base_currency, quote_currency):
+        key = (base_currency, quote_currency)
+        with self._lock:
+            entry = self._series.get(key)
+        if entry is not None and time.time() - entry[0] < self.ttl:
+            return entry
+
+        rows = db.session.execute(
+            select(FxRate.rate_date, FxRate.rate)
+            .where(FxRate.base_currency == base_currency, FxRate.quote_currency == quote_currency)
+            .order_by(FxRate.rate_date)
+        ).all()
+        entry = (time.time(), [row[0] for row in rows], [Decimal(str(row[1])) for row in rows])
+        with self._lock:
+            self._series[key] = entry
+        return entry
+
+    def _lookup(self, base_currency, quote_currency, on_date):
+        _, dates, rates = self._load_series(base_currency, quote_currency)
+        index = bisect_right(dates, on_date) - 1
+        if index < 0 or (on_date - dates[index]).days > self.max_age_days:
+            return None
+        return rates[index]
+
+    def rate_on(self, from_currency, to_currency, on_date):
+        """Rate converting ``from_currency`` into ``to_currency`` on ``on_date``, or None"""
+        if from_currency == to_currency:
+            return Decimal('1')
+        rate = self._lookup(from_currency, to_currency, on_date)
+        if rate is not None:
+            return rate
+        inverse = self._lookup(to_currency, from_currency, on_date)
+        if inverse:
+            with localcontext() as ctx:
+                ctx.prec = 28
+                return Decimal('1') / inverse
+        return None
+
+    def convert(self, amount, from_currency, to_currency, on_date):
+        """Convert at the rate for ``on_date``, falling back to today's rate table"""
+        amount = Decimal(str(amount))
+        rate = self.rate_on(from_currency, to_currency, on_date) if on_date else None
+        if rate is None:
+            return exchange_rates.convert(amount, from_currency, to_currency)
+        return (amount * rate).quantize(CENT, rounding=ROUND_HALF_UP)
+
+    def invalidate(self, base_currency=None):
+        with self._lock:
+            if base_currency is None:
+                self._series.clear()
+            else:
+                for key in [k for k in self._series if base_currency in k]:
+                    del self._series[key]
+
+    # Backfill
+    def missing_dates(self, base_currency, start, end):
+        stored = set(db.session.execute(
+            select(FxRate.rate_date).distinct()
+            .where(FxRate.base_currency == base_currency, FxRate.rate_date.between(start, end))
+        ).scalars())
+        days = (end - start).days + 1
+        return [start + timedelta(days=i) for i in range(days) if start + timedelta(days=i) not in stored]
+
+    def _batches(self, days):
+        """Group sorted dates into ranges of at most ``batch_days`` days"""
+        batch = []
+        for day in days:
+            if batch and (day - batch[0]).days >= self.batch_days:
+                yield batch[0], batch[-1], set(batch)
+                batch = []
+            batch.append(day)
+        if batch:
+            yield batch[0], batch[-1], set(batch)
+
+    def backfill(self, base_currency, start, end):
+        """Fetch and store rates for the dates in ``start..end`` not yet stored
+
+        Each batch is one provider request and one bulk INSERT, committed on
+        its own so a failure part way keeps what was already fetched. Days
+        the provider has no rates for (weekends, holidays) are requested
+        again on the next run; they cost nothing extra inside a batch.
+        """
+        base_currency = base_currency.upper()
+        inserted = 0
+        for batch_start, batch_end, wanted in self._batches(self.missing_dates(base_currency, start, end)):
+            series = self.provider.fetch_range(base_currency, batch_start, batch_end)
+            now = datetime.utcnow()
+            rows = [
+                {'rate_date': day, 'base_currency': base_currency, 'quote_currency': quote,
+                 'rate': Decimal(str(rate)), 'source': self.provider.name, 'fetched_at': now}
+                for day, table in series.items() if day in wanted
+                for quote, rate in table.items() if quote != base_currency
+            ]
+            if rows:
+                db.session.execute(insert(FxRate), rows)
+                db.session.commit()
+                inserted += len(rows)
+            print(f"💱 Stored {len(rows)} {base_currency} rates for {batch_start}..{batch_end}")
+        self.invalidate(base_currency)
+        return inserted
+
+    # Re-valuation
+    def revalue(self, company_id=None, start=None, end=None, statuses=('Draft', 'Submitted')):
+        """Recompute ``final_amount_base_currency`` at each expense's own date; the caller commits
+
+        One UPDATE covers every matching expense: correlated subqueries pick
+        the latest stored rate on or before ``Expense.date`` for the pair,
+        directly or through the inverse, and no more than ``max_age_days``
+        older. Expenses with no such rate keep their amount. Decided
+        expenses are left alone unless ``statuses`` includes them. Returns
+        the number of expenses updated.
+        """
+        base_code = select(Company.base_currency_code).join(User, User.company_id == Company.id).where(
+            User.id == Expense.user_id
+        ).scalar_subquery()
+
+        if db.engine.dialect.name == 'postgresql':
+            oldest = Expense.date - self.max_age_days
+        else:  # SQLite
+            oldest = func.date(Expense.date, f'-{self.max_age_days} days')
+
+        def latest(base, quote):
+            return select(FxRate.rate).where(
+                FxRate.base_currency == base,
+                FxRate.quote_currency == quote,
+                FxRate.rate_date <= Expense.date,
+                FxRate.rate_date >= oldest
+            ).order_by(FxRate.rate_date.desc()).limit(1).scalar_subquery()
+
+        direct = latest(Expense.currency_spent, base_code)
+        inverse = latest(base_code, Expense.currency_spent)
+
+        statement = update(Expense).where(
+            Expense.status.in_(statuses),
+            Expense.currency_spent != base_code,
+            or_(direct.isnot(None), inverse.isnot(None))
+        )
+        if company_id is not None:
+            statement = statement.where(Expense.user_id.in_(select(User.id).where(User.company_id == company_id)))
+        if start is not None:
+            statement = statement.where(Expense.date >= start)
+        if end is not None:
+            statement = statement.where(Expense.date <= end)
+
+        statement = statement.values(final_amount_base_currency=func.round(
+            func.coalesce(Expense.amount_spent * direct, Expense.amount_spent / inverse), 2
+        ))
+        result = db.session.execute(statement, execution_options={'synchronize_session': False})
+        # Base amounts moved under the rollups; re-aggregate rather than diff row by row
+        spend_rollups.rebuild(company_id)
+
+        # Keep the denormalized approver inbox in step; touching updated_at lets pollers pick it up
+        current_amount = select(Expense.final_amount_base_currency).where(
+            Expense.id == ApprovalInboxItem.expense_id
+        ).scalar_subquery()
+        db.session.execute(
+            update(ApprovalInboxItem)
+            .where(ApprovalInboxItem.status == 'Pending', ApprovalInboxItem.amount != current_amount)
+            .values(amount=current_amount, updated_at=datetime.utcnow()),
+            execution_options={'synchronize_session': False}
+        )
+        return result.rowcount
+
+
+def _default_provider():
+    path = os.getenv('FX_HISTORY_PROVIDER_FILE')
+    if path:
+        return JSONFileHistoricalRateProvider(path)
+    return HTTPHistoricalRateProvider()
+
+
+# Initialize global historical rate service
+fx_rates = FxRateService()
@@ -0,0 +1,198 @@
+"""
+Outbound HTTP for Expense Management System
+Pooled keep-alive session with timeouts, jittered retries, per-host circuit breakers and metrics
+"""
+
+import os
+import random
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+RETRY_STATUSES = (429, 502, 503, 504)
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised without a network call while a host's circuit is open
+
+    A ``RequestException`` subclass, so callers' existing handlers fall back
+    to their cached data the same way they do for a failed request.
+    """
+
+
+class _Host:
+    """Breaker state and metrics for one upstream host"""
+
+    def __init__(self, max_connections):
+        self.slots = threading.BoundedSemaphore(max_connections)
+        self.lock = threading.Lock()
+        self.state = 'closed'  # closed -> open -> half_open -> closed
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.short_circuited = 0
+        self.latencies_ms = deque(maxlen=500)
+        self.last_error = None
+
+
+class HTTPClient:
+    """One shared ``requests.Session`` for every outbound call
+
+    Connections are kept alive and reused per host, and at most
+    ``HTTP_MAX_CONNECTIONS_PER_HOST`` requests run against a host at once.
+    Every request has connect and read timeouts. Idempotent requests are
+    retried a bounded number of times on connection errors, timeouts and
+    429/502/503/504, after exponential backoff with full jitter.
+
+    A host that fails ``HTTP_BREAKER_THRESHOLD`` calls in a row has its
+    circuit opened: calls fail immediately with ``CircuitOpenError``, so
+    callers go straight to their cached or fallback data, until
+    ``HTTP_BREAKER_RESET`` seconds pass and one trial call decides whether
+    it closes again.
+    """
+
+    def __init__(self):
+        self.connect_timeout = float(os.getenv('HTTP_CONNECT_TIMEOUT', '3'))
+        self.read_timeout = float(os.getenv('HTTP_READ_TIMEOUT', '10'))
+        self.max_connections = int(os.getenv('HTTP_MAX_CONNECTIONS_PER_HOST', '10'))
+        self.retries = int(os.getenv('HTTP_RETRIES', '2'))
+        self.backoff = float(os.getenv('HTTP_RETRY_BACKOFF', '0.2'))
+        self.breaker_threshold = int(os.getenv('HTTP_BREAKER_THRESHOLD', '5'))
+        self.breaker_reset = float(os.getenv('HTTP_BREAKER_RESET', '30'))
+        self._hosts = {}
+        self._lock = threading.Lock()
+        self.session = self._build_session()
+
+    def _build_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=20, pool_maxsize=self.max_connections, max_retries=0)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def _host(self, url):
+        name = urlsplit(url).netloc
+        with self._lock:
+            host = self._hosts.get(name)
+            if host is None:
+                host = self._hosts[name] = _Host(self.max_connections)
+            return name, host
+
+    # Circuit breaker
+    def _admit(self, name, host):
+        with host.lock:
+            if host.state == 'closed':
+                return
+            if host.state == 'open' and time.monotonic() - host.opened_at >= self.breaker_reset:
+                host.state = 'half_open'  # This caller makes the trial call
+                return
+            host.short_circuited += 1
+        raise CircuitOpenError(f'Circuit open for {name}')
+
+    def _record(self, host, elapsed_ms, error=None):
+        with host.lock:
+            host.requests += 1
+            host.latencies_ms.append(elapsed_ms)
+            if error is None:
+                host.consecutive_failures = 0
+                host.state = 'closed'
+                return
+            host.errors += 1
+            host.last_error = error
+            host.consecutive_failures += 1
+            if host.state == 'half_open' or host.consecutive_failures >= self.breaker_threshold:
+                if host.state != 'open':
+                    print(f"⚡ Circuit opened for upstream after {host.consecutive_failures} failure(s): {error}")
+                host.state = 'open'
+                host.opened_at = time.monotonic()
+
+    def _sleep_before_retry(self, attempt):
+        time.sleep(random.uniform(0, self.backoff * (2 ** attempt)))
+
+    # Requests
+    def request(self, method, url, timeout=None, retries=None, **kwargs):
+        """Send a request through the shared session; returns the final ``Response``
+
+        ``timeout`` overrides the read timeout. Raises ``requests``
+        exceptions (including ``CircuitOpenError``) when no response is
+        received; HTTP error statuses are returned for the caller to check.
+        """
+        name, host = self._host(url)
+        method = method.upper()
+        retries = self.retries if retries is None else retries
+        if method not in IDEMPOTENT_METHODS:
+            retries = 0
+        timeouts = (self.connect_timeout, timeout or self.read_timeout)
+
+        attempt = 0
+        while True:
+            if not host.slots.acquire(timeout=self.connect_timeout):
+                raise requests.exceptions.ConnectTimeout(f'All {self.max_connections} connections to {name} are busy')
+            try:
+                # Admitted only once a slot is held, so a half-open trial always records an outcome
+                self._admit(name, host)
+                start = time.perf_counter()
+                try:
+                    response = self.session.request(method, url, timeout=timeouts, **kwargs)
+                except Exception as e:
+                    self._record(host, (time.perf_counter() - start) * 1000, f'{type(e).__name__}: {e}')
+                    retryable = isinstance(e, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+                    if not retryable or attempt >= retries or host.state == 'open':
+                        raise
+                    response = None
+            finally:
+                host.slots.release()
+
+            if response is not None:
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                if response.status_code >= 500 or response.status_code == 429:
+                    self._record(host, elapsed_ms, f'HTTP {response.status_code}')
+                else:
+                    self._record(host, elapsed_ms)
+                if response.status_code not in RETRY_STATUSES or attempt >= retries or host.state == 'open':
+                    return response
+                response.close()
+
+            with host.lock:
+                host.retries += 1
+            self._sleep_before_retry(attempt)
+            attempt += 1
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    # Metrics
+    def stats(self):
+        with self._lock:
+            hosts = list(self._hosts.items())
+        result = {}
+        for name, host in hosts:
+            with host.lock:
+                latencies = sorted(host.latencies_ms)
+                result[name] = {
+                    'state': host.state,
+                    'requests': host.requests,
+                    'errors': host.errors,
+                    'retries': host.retries,
+                    'short_circuited': host.short_circuited,
+                    'p50_ms': round(latencies[len(latencies) // 2], 2) if latencies else None,
+                    'p95_ms': round(latencies[int(len(latencies) * 0.95) - 1], 2) if latencies else None,
+                    'last_error': host.last_error
+                }
+        return result
+
+    def reset(self):
+        """Forget breaker state and metrics (keeps pooled connections)"""
+        with self._lock:
+            self._hosts.clear()
+
+
+# Initialize global HTTP client
+http_client = HTTPClient()
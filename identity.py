@@ -0,0 +1,98 @@
+"""
+Request Identity for Expense Management System
+Loads the signed-in user and their company once per request, with an optional short-TTL cache
+"""
+
+import os
+import threading
+import time
+
+from flask import g, session
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload, make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+
+from database import db
+from models import User, Company
+
+_MISSING = object()
+
+# Columns kept in the cross-request cache; anything else (the password hash) loads on access
+_USER_COLUMNS = tuple(attr.key for attr in User.__mapper__.column_attrs if attr.key != 'password_hash')
+_COMPANY_COLUMNS = tuple(attr.key for attr in Company.__mapper__.column_attrs)
+
+
+class IdentityCache:
+    """Resolves the session user to a ``User`` with ``company`` loaded
+
+    Within a request the user is loaded once, with its company in the same
+    query, and kept on ``flask.g``, so decorators, hooks and views share one
+    instance. With ``IDENTITY_CACHE_TTL`` > 0, column snapshots are also kept
+    across requests and merged into the session without a query; entries
+    are dropped when the user changes. The TTL bounds staleness when
+    several worker processes each hold their own cache, and for company
+    fields, which the app never edits.
+    """
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl if ttl is not None else float(os.getenv('IDENTITY_CACHE_TTL', '0'))
+        self._entries = {}  # user_id -> (loaded_at, user columns, company columns)
+        self._lock = threading.Lock()
+
+    def _load(self, user_id):
+        return db.session.execute(
+            select(User).options(joinedload(User.company)).where(User.id == user_id)
+        ).scalar_one_or_none()
+
+    def _from_snapshot(self, user_values, company_values):
+        company = Company(**company_values)
+        user = User(**user_values)
+        make_transient_to_detached(company)
+        make_transient_to_detached(user)
+        set_committed_value(user, 'company', company)  # No history or backref events
+        return db.session.merge(user, load=False)
+
+    def get(self, user_id):
+        if self.ttl <= 0:
+            return self._load(user_id)
+
+        with self._lock:
+            entry = self._entries.get(user_id)
+        if entry is not None and time.time() - entry[0] < self.ttl:
+            return self._from_snapshot(entry[1], entry[2])
+
+        user = self._load(user_id)
+        if user is not None:
+            snapshot = (
+                time.time(),
+                {key: getattr(user, key) for key in _USER_COLUMNS},
+                {key: getattr(user.company, key) for key in _COMPANY_COLUMNS}
+            )
+            with self._lock:
+                self._entries[user_id] = snapshot
+        return user
+
+    def invalidate(self, user_id=None):
+        """Drop one user's entry, or every entry"""
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+
+
+def get_current_user():
+    """The signed-in ``User`` (with ``company`` loaded) for this request, or None"""
+    user_id = session.get('user_id')
+    if user_id is None:
+        return None
+    cached = g.get('current_user', _MISSING)
+    if cached is not _MISSING and cached[0] == user_id:
+        return cached[1]
+    user = identity_cache.get(user_id)
+    g.current_user = (user_id, user)
+    return user
+
+
+# Initialize global identity cache
+identity_cache = IdentityCache()
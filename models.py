@@ -1,6 +1,6 @@
 from database import db
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Date, Numeric, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Date, Numeric, ForeignKey, Text, Index, UniqueConstraint, inspect, text
 from sqlalchemy.orm import relationship
 
 class Company(db.Model):
@@ -19,6 +19,10 @@ class Company(db.Model):
 
 class User(db.Model):
     __tablename__ = 'users'
+    __table_args__ = (
+        Index('ix_users_company_role', 'company_id', 'role'),
+        Index('ix_users_manager_id', 'manager_id'),
+    )
     
     id = Column(Integer, primary_key=True)
     name = Column(String(255), nullable=False)  # Added name field
@@ -38,8 +42,27 @@ class User(db.Model):
     def __repr__(self):
         return f'<User {self.email}>'
 
+class Receipt(db.Model):
+    __tablename__ = 'receipts'
+    
+    id = Column(Integer, primary_key=True)
+    sha256 = Column(String(64), unique=True, nullable=False)  # Content hash; identical uploads share a row
+    size_bytes = Column(Integer, nullable=False)
+    content_type = Column(String(100), nullable=False)
+    original_filename = Column(String(255), nullable=True)
+    storage_key = Column(String(255), nullable=False)  # Backend-specific location
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<Receipt {self.id}: {self.sha256[:12]}>'
+
 class Expense(db.Model):
     __tablename__ = 'expenses'
+    __table_args__ = (
+        Index('ix_expenses_user_created', 'user_id', 'created_at'),  # Employee listings/dashboard
+        Index('ix_expenses_status_created', 'status', 'created_at'),  # Manager pending queue
+        Index('ix_expenses_date_id', 'date', 'id'),  # Report ordering and date-range filters
+    )
     
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
@@ -50,17 +73,29 @@ class Expense(db.Model):
     currency_spent = Column(String(3), nullable=False)  # Currency code
     status = Column(String(50), nullable=False, default='Draft')  # Draft, Submitted, Approved, Rejected
     final_amount_base_currency = Column(Numeric(10, 2), nullable=True)
+    receipt_id = Column(Integer, ForeignKey('receipts.id'), nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
     approvals = relationship('ExpenseApproval', back_populates='expense', lazy=True, cascade='all, delete-orphan')
+    receipt = relationship('Receipt', lazy=True)
+    approval_steps = relationship('ExpenseApprovalStep', lazy=True, cascade='all, delete-orphan',
+                                  order_by='ExpenseApprovalStep.step_order')
+    workflow = relationship('ExpenseWorkflow', uselist=False, lazy=True, cascade='all, delete-orphan')
+    
+    @property
+    def receipt_url(self):
+        return f'/api/receipts/{self.receipt_id}' if self.receipt_id else None
     
     def __repr__(self):
         return f'<Expense {self.id}: {self.description}>'
 
 class ApprovalRule(db.Model):
     __tablename__ = 'approval_rules'
+    __table_args__ = (
+        Index('ix_approval_rules_category', 'applies_to_category'),
+    )
     
     id = Column(Integer, primary_key=True)
     name = Column(String(255), nullable=False)
@@ -78,6 +113,9 @@ class ApprovalRule(db.Model):
 
 class RuleStep(db.Model):
     __tablename__ = 'rule_steps'
+    __table_args__ = (
+        Index('ix_rule_steps_rule_sequence', 'rule_id', 'sequence_order'),
+    )
     
     id = Column(Integer, primary_key=True)
     rule_id = Column(Integer, ForeignKey('approval_rules.id'), nullable=False)
@@ -92,6 +130,12 @@ class RuleStep(db.Model):
 
 class ExpenseApproval(db.Model):
     __tablename__ = 'expense_approvals'
+    __table_args__ = (
+        Index('ix_expense_approvals_expense_created', 'expense_id', 'created_at'),
+        Index('ix_expense_approvals_approver_created', 'approver_user_id', 'created_at'),
+        Index('ix_expense_approvals_action_created', 'action', 'created_at'),  # Monthly approve/reject counts
+        Index('ix_expense_approvals_created', 'created_at'),  # Recent activity
+    )
     
     id = Column(Integer, primary_key=True)
     expense_id = Column(Integer, ForeignKey('expenses.id'), nullable=False)
@@ -108,11 +152,219 @@ class ExpenseApproval(db.Model):
     def __repr__(self):
         return f'<ExpenseApproval {self.id}: {self.action}>'
 
+class ExpenseApprovalStep(db.Model):
+    __tablename__ = 'expense_approval_steps'
+    __table_args__ = (
+        Index('ix_expense_approval_steps_expense_order', 'expense_id', 'step_order'),
+        Index('ix_expense_approval_steps_approver_status', 'approver_user_id', 'status'),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    expense_id = Column(Integer, ForeignKey('expenses.id', ondelete='CASCADE'), nullable=False)
+    approver_user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    rule_id = Column(Integer, ForeignKey('approval_rules.id', ondelete='SET NULL'), nullable=True)  # Null for manager/default steps
+    step_order = Column(Integer, nullable=False, default=1)  # 0 = manager-first step
+    is_required = Column(Boolean, default=False)
+    status = Column(String(20), nullable=False, default='Pending')  # Pending, Approved, Rejected, Skipped
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<ExpenseApprovalStep {self.expense_id}/{self.approver_user_id}: {self.status}>'
+
+class ExpenseWorkflow(db.Model):
+    """Running approval state for one submitted expense, updated under a row lock"""
+    __tablename__ = 'expense_workflows'
+    
+    expense_id = Column(Integer, ForeignKey('expenses.id', ondelete='CASCADE'), primary_key=True)
+    status = Column(String(20), nullable=False, default='Pending')  # Pending, Approved, Rejected
+    is_sequential = Column(Boolean, default=False)
+    min_approval_percentage = Column(Numeric(5, 2), default=100.00)
+    current_step = Column(Integer, nullable=True)  # Lowest step_order still waiting
+    current_step_pending = Column(Integer, nullable=False, default=0)
+    total_approvers = Column(Integer, nullable=False, default=0)
+    approved_count = Column(Integer, nullable=False, default=0)
+    rejected_count = Column(Integer, nullable=False, default=0)
+    required_total = Column(Integer, nullable=False, default=0)
+    required_approved = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<ExpenseWorkflow {self.expense_id}: {self.status}>'
+
+class ApprovalInboxItem(db.Model):
+    """Denormalized copy of an expense waiting on one approver, maintained by the workflow"""
+    __tablename__ = 'approval_inbox'
+    __table_args__ = (
+        UniqueConstraint('approver_user_id', 'expense_id', name='uq_approval_inbox_approver_expense'),
+        Index('ix_approval_inbox_approver_status_created', 'approver_user_id', 'status', 'created_at', 'id'),
+        Index('ix_approval_inbox_approver_updated', 'approver_user_id', 'updated_at', 'id'),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    approver_user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    expense_id = Column(Integer, ForeignKey('expenses.id', ondelete='CASCADE'), nullable=False)
+    submitter_user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    submitter_name = Column(String(255), nullable=True)
+    submitter_email = Column(String(255), nullable=False)
+    category = Column(String(100), nullable=True)
+    description = Column(Text, nullable=True)
+    expense_date = Column(Date, nullable=True)
+    amount = Column(Numeric(10, 2), nullable=True)  # In the company's base currency
+    currency = Column(String(3), nullable=True)
+    amount_spent = Column(Numeric(10, 2), nullable=True)
+    currency_spent = Column(String(3), nullable=True)
+    step_order = Column(Integer, nullable=True)
+    status = Column(String(20), nullable=False, default='Pending')  # Pending, Closed
+    submitted_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)  # When it reached this approver
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<ApprovalInboxItem {self.approver_user_id}/{self.expense_id}: {self.status}>'
+
+class OrgHierarchy(db.Model):
+    """Closure table of the manager tree: one row per (ancestor, descendant) pair, including depth 0 self rows"""
+    __tablename__ = 'org_hierarchy'
+    __table_args__ = (
+        Index('ix_org_hierarchy_descendant', 'descendant_id', 'ancestor_id'),
+    )
+    
+    ancestor_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    descendant_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    depth = Column(Integer, nullable=False)  # 0 = self, 1 = direct report, ...
+    company_id = Column(Integer, ForeignKey('companies.id'), nullable=False)
+    
+    def __repr__(self):
+        return f'<OrgHierarchy {self.ancestor_id} -> {self.descendant_id} ({self.depth})>'
+
+class SpendRollup(db.Model):
+    """Expense totals per company, user, category, currency, day and status, maintained on every expense write"""
+    __tablename__ = 'spend_rollups'
+    __table_args__ = (
+        Index('ix_spend_rollups_company_day', 'company_id', 'day'),
+    )
+    
+    company_id = Column(Integer, ForeignKey('companies.id'), primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    category = Column(String(100), primary_key=True)
+    currency_spent = Column(String(3), primary_key=True)
+    day = Column(Date, primary_key=True)  # Expense.date
+    status = Column(String(50), primary_key=True)
+    expense_count = Column(Integer, nullable=False, default=0)
+    amount_spent = Column(Numeric(16, 2), nullable=False, default=0)  # In currency_spent
+    amount_base = Column(Numeric(16, 2), nullable=False, default=0)  # In the company's base currency
+    
+    def __repr__(self):
+        return f'<SpendRollup {self.company_id}/{self.user_id}/{self.category}/{self.day}/{self.status}: {self.expense_count}>'
+
+class Budget(db.Model):
+    """Spend limit for a company, optionally narrowed to one user and/or category"""
+    __tablename__ = 'budgets'
+    __table_args__ = (
+        Index('ix_budgets_company', 'company_id'),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    company_id = Column(Integer, ForeignKey('companies.id'), nullable=False)
+    name = Column(String(255), nullable=False)
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), nullable=True)  # Null means all users
+    category = Column(String(100), nullable=True)  # Null means all categories
+    period = Column(String(20), nullable=False, default='monthly')  # monthly, quarterly, yearly
+    limit_amount = Column(Numeric(12, 2), nullable=False)  # In the company's base currency
+    action = Column(String(20), nullable=False, default='block')  # block, require_approval
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<Budget {self.name}: {self.limit_amount} {self.period}>'
+
+class FxRate(db.Model):
+    """Historical exchange rate: 1 ``base_currency`` = ``rate`` ``quote_currency`` on ``rate_date``"""
+    __tablename__ = 'fx_rates'
+    __table_args__ = (
+        Index('ix_fx_rates_pair_date', 'base_currency', 'quote_currency', 'rate_date'),
+    )
+    
+    rate_date = Column(Date, primary_key=True)
+    base_currency = Column(String(3), primary_key=True)
+    quote_currency = Column(String(3), primary_key=True)
+    rate = Column(Numeric(18, 8), nullable=False)
+    source = Column(String(50), nullable=True)
+    fetched_at = Column(DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<FxRate {self.rate_date} {self.base_currency}/{self.quote_currency}: {self.rate}>'
+
+class EmailOutbox(db.Model):
+    __tablename__ = 'email_outbox'
+    __table_args__ = (
+        Index('ix_email_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    recipient = Column(String(255), nullable=False)
+    subject = Column(String(255), nullable=False)
+    text_body = Column(Text, nullable=True)  # Cleared once sent or failed so temporary passwords don't linger
+    html_body = Column(Text, nullable=True)
+    status = Column(String(20), nullable=False, default='Queued')  # Queued, Sending, Sent, Failed
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text, nullable=True)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
+    
+    def __repr__(self):
+        return f'<EmailOutbox {self.id}: {self.status}>'
+
 # Create database tables
 def create_tables():
     """Create all database tables"""
     db.create_all()
 
+def add_missing_columns():
+    """Add nullable columns declared on the models but missing from existing tables
+
+    Only nullable columns without server defaults can be added this way; that
+    covers every column added to an existing table so far.
+    """
+    inspector = inspect(db.engine)
+    added = []
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {c['name'] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing or not column.nullable:
+                    continue
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+                added.append(f'{table.name}.{column.name}')
+    return added
+
+def upgrade_schema():
+    """Bring an existing database up to the current models: new tables, columns, then indexes"""
+    db.create_all()
+    columns = add_missing_columns()
+    indexes = create_indexes()
+    return columns, indexes
+
+def create_indexes():
+    """Create any declared indexes missing from an existing database
+
+    ``db.create_all()`` skips tables that already exist, so databases created
+    before an index was declared need this to pick it up. Safe to re-run.
+    """
+    inspector = inspect(db.engine)
+    created = []
+    for table in db.metadata.sorted_tables:
+        existing = {ix['name'] for ix in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(db.engine)
+                created.append(index.name)
+    return created
+
 # Sample data creation functions
 def create_sample_data():
     """Create sample data for testing"""
@@ -185,6 +437,8 @@ def create_sample_data():
     )
     db.session.add(step2)
     
+    from org_hierarchy import org_hierarchy  # Imports models
+    org_hierarchy.rebuild(company.id)
     db.session.commit()
     
     print("Sample data created successfully!")
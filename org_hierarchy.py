@@ -0,0 +1,134 @@
+"""
+Org Hierarchy for Expense Management System
+Maintains the manager-tree closure table so "everyone under a manager" is one indexed lookup
+"""
+
+from sqlalchemy import select, insert, delete, func, literal, or_, exists
+from sqlalchemy.orm import aliased
+
+from database import db
+from models import User, OrgHierarchy
+
+# Guards the rebuild against manager_id cycles in existing data
+MAX_DEPTH = 64
+
+
+class HierarchyError(Exception):
+    """Raised when a manager change would create a cycle; ``status_code`` is the HTTP status to return"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class OrgHierarchyIndex:
+    """Writes and queries the ``org_hierarchy`` closure table
+
+    Every user has a depth-0 row for themselves plus one row per manager
+    above them, so the users under a manager at any depth are the rows with
+    that ``ancestor_id``. The table is rebuilt in one recursive-CTE
+    statement (``flask rebuild-org-hierarchy``) and kept current
+    incrementally when users are created, deleted or change manager. All
+    methods leave the commit to the caller.
+    """
+
+    def descendant_ids(self, manager_id, include_self=True):
+        """Subquery of the user ids under ``manager_id`` at any depth, for ``IN`` conditions"""
+        query = select(OrgHierarchy.descendant_id).where(OrgHierarchy.ancestor_id == manager_id)
+        if not include_self:
+            query = query.where(OrgHierarchy.depth > 0)
+        return query
+
+    def is_under(self, user_id, manager_id):
+        return db.session.execute(select(exists().where(
+            OrgHierarchy.ancestor_id == manager_id,
+            OrgHierarchy.descendant_id == user_id
+        ))).scalar()
+
+    def rebuild(self, company_id=None):
+        """Recompute the table (or one company's rows) from ``users.manager_id``; returns the row count"""
+        anchor = select(
+            User.id.label('ancestor_id'), User.id.label('descendant_id'),
+            literal(0).label('depth'), User.company_id.label('company_id')
+        )
+        if company_id is not None:
+            anchor = anchor.where(User.company_id == company_id)
+        tree = anchor.cte('tree', recursive=True)
+        report = aliased(User)
+        tree = tree.union_all(
+            select(tree.c.ancestor_id, report.id, tree.c.depth + 1, tree.c.company_id)
+            .join(report, report.manager_id == tree.c.descendant_id)
+            .where(tree.c.depth < MAX_DEPTH)
+        )
+
+        cleanup = delete(OrgHierarchy)
+        if company_id is not None:
+            cleanup = cleanup.where(OrgHierarchy.company_id == company_id)
+        db.session.execute(cleanup, execution_options={'synchronize_session': False})
+        db.session.execute(insert(OrgHierarchy).from_select(
+            ['ancestor_id', 'descendant_id', 'depth', 'company_id'],
+            select(tree.c.ancestor_id, tree.c.descendant_id, tree.c.depth, tree.c.company_id)
+        ))
+        count = select(func.count()).select_from(OrgHierarchy)
+        if company_id is not None:
+            count = count.where(OrgHierarchy.company_id == company_id)
+        return db.session.execute(count).scalar()
+
+    def add_users(self, user_ids):
+        """Insert rows for newly created users; their managers must already be indexed"""
+        if not user_ids:
+            return
+        db.session.execute(insert(OrgHierarchy).from_select(
+            ['ancestor_id', 'descendant_id', 'depth', 'company_id'],
+            select(User.id, User.id, literal(0), User.company_id).where(User.id.in_(user_ids))
+        ))
+        db.session.execute(insert(OrgHierarchy).from_select(
+            ['ancestor_id', 'descendant_id', 'depth', 'company_id'],
+            select(OrgHierarchy.ancestor_id, User.id, OrgHierarchy.depth + 1, User.company_id)
+            .join(User, User.manager_id == OrgHierarchy.descendant_id)
+            .where(User.id.in_(user_ids))
+        ))
+
+    def move(self, user_id, new_manager_id):
+        """Re-parent ``user_id`` (and everyone under them) below ``new_manager_id``
+
+        Call after setting ``manager_id``; raises ``HierarchyError`` if the new
+        manager is the user or someone under them.
+        """
+        if new_manager_id is not None and self.is_under(new_manager_id, user_id):
+            raise HierarchyError('A user cannot report to themselves or to someone who reports to them')
+
+        subtree = select(OrgHierarchy.descendant_id).where(OrgHierarchy.ancestor_id == user_id)
+        # Detach the subtree from its old ancestors
+        db.session.execute(
+            delete(OrgHierarchy).where(
+                OrgHierarchy.descendant_id.in_(subtree),
+                OrgHierarchy.ancestor_id.not_in(subtree)
+            ),
+            execution_options={'synchronize_session': False}
+        )
+        if new_manager_id is None:
+            return
+        # Attach it below every ancestor of the new manager
+        above = aliased(OrgHierarchy)
+        below = aliased(OrgHierarchy)
+        db.session.execute(insert(OrgHierarchy).from_select(
+            ['ancestor_id', 'descendant_id', 'depth', 'company_id'],
+            select(above.ancestor_id, below.descendant_id, above.depth + below.depth + 1, below.company_id)
+            .join(below, below.ancestor_id == user_id)
+            .where(above.descendant_id == new_manager_id)
+        ))
+
+    def remove(self, user_id):
+        """Drop a deleted user's rows"""
+        db.session.execute(
+            delete(OrgHierarchy).where(or_(
+                OrgHierarchy.ancestor_id == user_id,
+                OrgHierarchy.descendant_id == user_id
+            )),
+            execution_options={'synchronize_session': False}
+        )
+
+
+# Initialize global org hierarchy index
+org_hierarchy = OrgHierarchyIndex()
@@ -0,0 +1,60 @@
+"""
+Keyset pagination helpers for list endpoints
+"""
+
+import base64
+import json
+from datetime import date, datetime
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+class PaginationError(ValueError):
+    """Raised when a cursor or page size parameter is invalid"""
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    if isinstance(value, date):
+        return {'d': value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        if 'dt' in value:
+            return datetime.fromisoformat(value['dt'])
+        if 'd' in value:
+            return date.fromisoformat(value['d'])
+    return value
+
+
+def encode_cursor(*values):
+    """Encode the sort key of the last row on a page as an opaque cursor"""
+    raw = json.dumps([_encode_value(v) for v in values], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    """Decode a cursor produced by ``encode_cursor`` into a tuple of ``size`` values"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if not isinstance(values, list) or len(values) != size:
+            raise PaginationError('Invalid cursor')
+        return tuple(_decode_value(v) for v in values)
+    except (ValueError, TypeError) as e:
+        raise PaginationError(f'Invalid cursor: {e}')
+
+
+def parse_limit(value, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    """Parse a ``limit`` query parameter, clamped to ``1..maximum``"""
+    if value in (None, ''):
+        return default
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        raise PaginationError('limit must be an integer')
+    return max(1, min(limit, maximum))
@@ -0,0 +1,42 @@
+"""
+Password hashing helpers
+Hashes large batches of passwords across a process pool (the work is CPU-bound)
+"""
+
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from werkzeug.security import generate_password_hash
+
+# Batches smaller than this are hashed inline; the pool round trip isn't worth it
+PARALLEL_THRESHOLD = int(os.getenv('PASSWORD_HASH_PARALLEL_THRESHOLD', '8'))
+
+_executor = None
+_workers = 1
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor, _workers
+    with _executor_lock:
+        if _executor is None:
+            _workers = int(os.getenv('PASSWORD_HASH_WORKERS', '0')) or os.cpu_count() or 1
+            _executor = ProcessPoolExecutor(max_workers=_workers)
+        return _executor
+
+
+def hash_passwords(passwords):
+    """Return ``generate_password_hash`` of each password, in order"""
+    passwords = list(passwords)
+    if len(passwords) < PARALLEL_THRESHOLD:
+        return [generate_password_hash(p) for p in passwords]
+
+    try:
+        executor = _get_executor()
+        chunksize = max(1, len(passwords) // (_workers * 4))
+        return list(executor.map(generate_password_hash, passwords, chunksize=chunksize))
+    except (OSError, RuntimeError) as e:
+        # Process pools are unavailable in some sandboxes; fall back to hashing inline
+        print(f"Warning: password hashing pool unavailable ({e}), hashing inline")
+        return [generate_password_hash(p) for p in passwords]
@@ -0,0 +1,188 @@
+"""
+Performance Monitor for Expense Management System
+Per-request SQL query counting, slow-query capture and N+1 detection
+"""
+
+import heapq
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger('expense.perf')
+
+_IN_LIST = re.compile(r'\((?:\s*(?:\?|%\(\w+\)s|%s|:\w+)\s*,)+\s*(?:\?|%\(\w+\)s|%s|:\w+)\s*\)')
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_WHITESPACE = re.compile(r'\s+')
+
+
+def statement_shape(statement):
+    """Normalize a SQL statement so repeats with different parameters compare equal"""
+    shape = _STRING.sub('?', statement)
+    shape = _NUMBER.sub('?', shape)
+    shape = _IN_LIST.sub('(?)', shape)
+    return _WHITESPACE.sub(' ', shape).strip()
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values))) - 1))
+    return round(sorted_values[index], 3)
+
+
+class _RequestStats:
+    __slots__ = ('query_count', 'db_ms', 'statements', 'shapes')
+
+    def __init__(self):
+        self.query_count = 0
+        self.db_ms = 0.0
+        self.statements = []  # (ms, shape)
+        self.shapes = {}
+
+    def record(self, statement, ms):
+        shape = statement_shape(statement)
+        self.query_count += 1
+        self.db_ms += ms
+        self.statements.append((ms, shape))
+        self.shapes[shape] = self.shapes.get(shape, 0) + 1
+
+
+class _EndpointStats:
+    def __init__(self, window):
+        self.samples = deque(maxlen=window)  # (request_ms, query_count, db_ms)
+        self.total_requests = 0
+        self.n_plus_one = {}  # shape -> times flagged
+        self.slowest = []  # [(ms, shape)] kept sorted, longest first
+
+    def add(self, request_ms, stats, n_plus_one, slow_limit):
+        self.total_requests += 1
+        self.samples.append((request_ms, stats.query_count, stats.db_ms))
+        for shape in n_plus_one:
+            self.n_plus_one[shape] = self.n_plus_one.get(shape, 0) + 1
+        self.slowest = heapq.nlargest(slow_limit, self.slowest + stats.statements, key=lambda s: s[0])
+
+    def summary(self):
+        request_ms = sorted(s[0] for s in self.samples)
+        queries = sorted(s[1] for s in self.samples)
+        db_ms = sorted(s[2] for s in self.samples)
+        return {
+            'requests': self.total_requests,
+            'window': len(self.samples),
+            'request_ms': {'p50': _percentile(request_ms, 50), 'p95': _percentile(request_ms, 95),
+                           'p99': _percentile(request_ms, 99)},
+            'db_ms': {'p50': _percentile(db_ms, 50), 'p95': _percentile(db_ms, 95),
+                      'p99': _percentile(db_ms, 99)},
+            'queries': {'p50': _percentile(queries, 50), 'p95': _percentile(queries, 95),
+                        'max': queries[-1] if queries else None},
+            'n_plus_one': [{'statement': shape, 'requests': count}
+                           for shape, count in sorted(self.n_plus_one.items(), key=lambda i: -i[1])],
+            'slowest_statements': [{'ms': round(ms, 3), 'statement': shape} for ms, shape in self.slowest],
+        }
+
+
+class PerfMonitor:
+    """Collects per-request database statistics and rolls them up per endpoint"""
+
+    def __init__(self):
+        self.slow_query_ms = float(os.getenv('PERF_SLOW_QUERY_MS', '100'))
+        self.n_plus_one_threshold = int(os.getenv('PERF_N_PLUS_ONE_THRESHOLD', '5'))
+        self.window = int(os.getenv('PERF_WINDOW', '500'))
+        self.slowest_kept = 5
+        self.headers_enabled = None  # Defaults to app.debug
+        self._endpoints = {}
+        self._lock = threading.Lock()
+        self._listening = False
+
+    def init_app(self, app):
+        if self.headers_enabled is None:
+            env = os.getenv('PERF_HEADERS')
+            self.headers_enabled = app.debug if env is None else env.lower() in ('1', 'true', 'yes')
+        if not self._listening:
+            event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+            self._listening = True
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+
+    # SQLAlchemy engine events
+    # The start time lives on the per-statement execution context, so a
+    # statement that raises (no after_cursor_execute) leaves nothing behind
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._perf_start = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, '_perf_start', None)
+        if start is None:
+            return
+        ms = (time.perf_counter() - start) * 1000
+        if not has_request_context():
+            return
+        stats = g.get('perf_stats')
+        if stats is not None:
+            stats.record(statement, ms)
+
+    # Flask hooks
+    def _before_request(self):
+        g.perf_stats = _RequestStats()
+        g.perf_started = time.perf_counter()
+
+    def _after_request(self, response):
+        stats = g.pop('perf_stats', None)
+        started = g.pop('perf_started', None)
+        if stats is None or started is None:
+            return response
+
+        request_ms = (time.perf_counter() - started) * 1000
+        endpoint = request.endpoint or request.path
+        n_plus_one = [shape for shape, count in stats.shapes.items() if count >= self.n_plus_one_threshold]
+        slow = [(ms, shape) for ms, shape in stats.statements if ms >= self.slow_query_ms]
+
+        with self._lock:
+            endpoint_stats = self._endpoints.get(endpoint)
+            if endpoint_stats is None:
+                endpoint_stats = self._endpoints[endpoint] = _EndpointStats(self.window)
+            endpoint_stats.add(request_ms, stats, n_plus_one, self.slowest_kept)
+
+        record = {
+            'endpoint': endpoint,
+            'method': request.method,
+            'status': response.status_code,
+            'request_ms': round(request_ms, 3),
+            'query_count': stats.query_count,
+            'db_ms': round(stats.db_ms, 3),
+        }
+        if slow:
+            record['slow_queries'] = [{'ms': round(ms, 3), 'statement': shape} for ms, shape in slow]
+        if n_plus_one:
+            record['n_plus_one'] = [{'statement': shape, 'count': stats.shapes[shape]} for shape in n_plus_one]
+        logger.log(logging.WARNING if slow or n_plus_one else logging.INFO, json.dumps(record))
+
+        if self.headers_enabled:
+            response.headers['X-Query-Count'] = str(stats.query_count)
+            response.headers['X-DB-Time-Ms'] = f'{stats.db_ms:.3f}'
+            response.headers['X-Request-Time-Ms'] = f'{request_ms:.3f}'
+            if n_plus_one:
+                response.headers['X-N-Plus-One'] = str(len(n_plus_one))
+        return response
+
+    def summary(self):
+        with self._lock:
+            return {endpoint: stats.summary() for endpoint, stats in sorted(self._endpoints.items())}
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+
+
+# Initialize global performance monitor
+perf_monitor = PerfMonitor()
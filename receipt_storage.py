@@ -0,0 +1,180 @@
+"""
+Receipt Storage for Expense Management System
+Streams uploads to a pluggable backend, deduplicating by SHA-256 content hash,
+and generates thumbnails lazily on first view
+"""
+
+import hashlib
+import os
+import tempfile
+from abc import ABC, abstractmethod
+
+try:
+    from PIL import Image
+except ImportError:  # Thumbnails are optional
+    Image = None
+
+CHUNK_SIZE = 64 * 1024
+
+# Leading bytes of each accepted file type
+SIGNATURES = [
+    (b'%PDF', 'application/pdf'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+]
+EXTENSIONS = {'application/pdf': 'pdf', 'image/jpeg': 'jpg', 'image/png': 'png',
+              'image/gif': 'gif', 'image/webp': 'webp'}
+
+
+class ReceiptStorageError(Exception):
+    """Raised when an upload is rejected; ``status_code`` is the HTTP status to return"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def sniff_content_type(head):
+    """Detect the file type from its first bytes; None if it isn't an accepted type"""
+    for signature, content_type in SIGNATURES:
+        if head.startswith(signature):
+            return content_type
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    return None
+
+
+class StoredFile:
+    """Result of storing an upload"""
+
+    def __init__(self, sha256, size_bytes, content_type, storage_key, is_new):
+        self.sha256 = sha256
+        self.size_bytes = size_bytes
+        self.content_type = content_type
+        self.storage_key = storage_key
+        self.is_new = is_new
+
+
+class ReceiptBackend(ABC):
+    """Interface for receipt storage backends"""
+
+    @abstractmethod
+    def save_stream(self, stream, max_bytes):
+        """Consume ``stream`` in chunks and store it; returns a ``StoredFile``"""
+
+    @abstractmethod
+    def open(self, storage_key):
+        """Return a binary file object for reading"""
+
+    def local_path(self, storage_key):
+        """Filesystem path for ``send_file``/X-Sendfile, or None if the backend isn't local"""
+        return None
+
+    def thumbnail(self, storage_key, content_type, size):
+        """Return a local path to a cached thumbnail, or None if one can't be made"""
+        return None
+
+
+class LocalReceiptBackend(ReceiptBackend):
+    """Stores receipts on the local filesystem under ``root/<aa>/<sha256>.<ext>``"""
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, storage_key):
+        path = os.path.normpath(os.path.join(self.root, storage_key))
+        if not path.startswith(os.path.normpath(self.root) + os.sep):
+            raise ReceiptStorageError('Invalid storage key', 404)
+        return path
+
+    def save_stream(self, stream, max_bytes):
+        tmp_dir = os.path.join(self.root, 'tmp')
+        os.makedirs(tmp_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        head = b''
+
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise ReceiptStorageError(f'Receipt exceeds {max_bytes // (1024 * 1024)}MB limit', 413)
+                    if len(head) < 16:
+                        head += chunk[:16 - len(head)]
+                    digest.update(chunk)
+                    out.write(chunk)
+
+            if size == 0:
+                raise ReceiptStorageError('Empty file')
+            content_type = sniff_content_type(head)
+            if content_type is None:
+                raise ReceiptStorageError('Receipts must be PDF, JPEG, PNG, GIF or WebP files', 415)
+
+            sha256 = digest.hexdigest()
+            storage_key = f'{sha256[:2]}/{sha256}.{EXTENSIONS[content_type]}'
+            final_path = self._path(storage_key)
+            if os.path.exists(final_path):
+                os.remove(tmp_path)  # Same content already stored
+                return StoredFile(sha256, size, content_type, storage_key, False)
+
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            os.replace(tmp_path, final_path)
+            return StoredFile(sha256, size, content_type, storage_key, True)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def open(self, storage_key):
+        return open(self._path(storage_key), 'rb')
+
+    def local_path(self, storage_key):
+        return self._path(storage_key)
+
+    def thumbnail(self, storage_key, content_type, size):
+        if Image is None or not content_type.startswith('image/'):
+            return None
+        name = os.path.basename(storage_key).split('.')[0]
+        thumb_path = os.path.join(self.root, 'thumbs', f'{name}_{size}.jpg')
+        if os.path.exists(thumb_path):
+            return thumb_path
+
+        os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
+        tmp_path = f'{thumb_path}.{os.getpid()}.tmp'
+        try:
+            with Image.open(self._path(storage_key)) as image:
+                image.thumbnail((size, size))
+                image.convert('RGB').save(tmp_path, 'JPEG', quality=80)
+        except (OSError, ValueError, Image.DecompressionBombError) as e:
+            # Corrupt or truncated upload (UnidentifiedImageError is an OSError)
+            print(f"Warning: cannot thumbnail receipt {storage_key}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return None
+        os.replace(tmp_path, thumb_path)
+        return thumb_path
+
+
+class ReceiptStore:
+    """Front for the configured backend plus upload limits"""
+
+    def __init__(self, backend=None, max_bytes=None):
+        self.backend = backend or LocalReceiptBackend(
+            os.getenv('RECEIPT_STORAGE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'receipts'))
+        )
+        self.max_bytes = max_bytes or int(os.getenv('RECEIPT_MAX_BYTES', str(5 * 1024 * 1024)))
+        self.thumbnail_sizes = (128, 256, 512)
+
+    def save(self, stream):
+        return self.backend.save_stream(stream, self.max_bytes)
+
+
+# Initialize global receipt store
+receipt_store = ReceiptStore()
@@ -0,0 +1,173 @@
+"""
+Reference Data for Expense Management System
+Country and currency lookups served from prebuilt in-memory indexes
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+import requests
+from flask import Response
+
+from http_client import http_client
+
+SNAPSHOT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'countries.json')
+REST_COUNTRIES_URL = 'https://restcountries.com/v3.1/all?fields=name,currencies'
+
+# Used only when neither the bundled snapshot nor the upstream API is available
+FALLBACK_CURRENCIES = [
+    {'code': 'USD', 'name': 'United States Dollar', 'symbol': '$', 'country_example': 'United States'},
+    {'code': 'EUR', 'name': 'Euro', 'symbol': '€', 'country_example': 'European Union'},
+    {'code': 'GBP', 'name': 'British Pound Sterling', 'symbol': '£', 'country_example': 'United Kingdom'},
+    {'code': 'JPY', 'name': 'Japanese Yen', 'symbol': '¥', 'country_example': 'Japan'},
+    {'code': 'AUD', 'name': 'Australian Dollar', 'symbol': 'A$', 'country_example': 'Australia'},
+    {'code': 'CAD', 'name': 'Canadian Dollar', 'symbol': 'C$', 'country_example': 'Canada'},
+    {'code': 'CHF', 'name': 'Swiss Franc', 'symbol': 'Fr', 'country_example': 'Switzerland'},
+    {'code': 'CNY', 'name': 'Chinese Yuan', 'symbol': '¥', 'country_example': 'China'},
+    {'code': 'INR', 'name': 'Indian Rupee', 'symbol': '₹', 'country_example': 'India'},
+    {'code': 'SGD', 'name': 'Singapore Dollar', 'symbol': 'S$', 'country_example': 'Singapore'}
+]
+
+
+class _Index:
+    """Immutable set of lookups built from one restcountries payload"""
+
+    def __init__(self, payload, source):
+        self.source = source
+        self.loaded_at = time.time()
+
+        countries = []
+        currencies = {}
+        country_currencies = {}
+
+        for country in payload:
+            country_name = country.get('name', {}).get('common', '')
+            country_data = country.get('currencies', {}) or {}
+
+            currency_list = []
+            for currency_code, currency_data in country_data.items():
+                currency_list.append({
+                    'code': currency_code,
+                    'name': currency_data.get('name', ''),
+                    'symbol': currency_data.get('symbol', '')
+                })
+                if currency_code not in currencies:
+                    currencies[currency_code] = {
+                        'code': currency_code,
+                        'name': currency_data.get('name', ''),
+                        'symbol': currency_data.get('symbol', ''),
+                        'country_example': country_name
+                    }
+
+            if country_name and currency_list:
+                countries.append({'name': country_name, 'currencies': currency_list})
+                country_currencies.setdefault(country_name.lower(), [c['code'] for c in currency_list])
+
+        if not currencies:
+            currencies = {c['code']: c for c in FALLBACK_CURRENCIES}
+
+        countries.sort(key=lambda x: x['name'])
+
+        self.country_currencies = country_currencies
+        self.currencies = currencies
+        self.valid_codes = frozenset(currencies)
+        self.countries_json = self._serialize(countries)
+        self.currencies_json = self._serialize(sorted(currencies.values(), key=lambda x: x['code']))
+
+    @staticmethod
+    def _serialize(value):
+        body = json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        return body, hashlib.sha1(body).hexdigest()
+
+
+class ReferenceData:
+    """Country/currency dataset loaded once and swapped atomically on refresh"""
+
+    def __init__(self, snapshot_path=SNAPSHOT_PATH, source_url=REST_COUNTRIES_URL,
+                 refresh_interval=None, timeout=None):
+        self.snapshot_path = snapshot_path
+        self.source_url = source_url
+        self.refresh_interval = refresh_interval if refresh_interval is not None else float(
+            os.getenv('REFERENCE_DATA_REFRESH_INTERVAL', '86400'))
+        self.timeout = timeout or float(os.getenv('REFERENCE_DATA_TIMEOUT', '10'))
+        self._index = None
+        self._lock = threading.Lock()
+        self._refresher = None
+
+    @property
+    def index(self):
+        index = self._index
+        if index is None:
+            with self._lock:
+                if self._index is None:
+                    self._index = _Index(self._read_snapshot(), 'snapshot')
+                    self._start_refresher()
+                index = self._index
+        return index
+
+    def _read_snapshot(self):
+        try:
+            with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Warning: could not read reference data snapshot: {e}")
+            return []
+
+    def refresh(self):
+        """Reload the dataset from the REST Countries API; keeps the current index on failure"""
+        try:
+            response = http_client.get(self.source_url, timeout=self.timeout)
+            response.raise_for_status()
+            payload = response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"Error refreshing reference data: {e}")
+            return False
+        if not payload:
+            return False
+        self._index = _Index(payload, 'remote')
+        return True
+
+    def _start_refresher(self):
+        if self.refresh_interval <= 0 or self._refresher is not None:
+            return
+
+        def run():
+            while True:
+                self.refresh()
+                time.sleep(self.refresh_interval)
+
+        self._refresher = threading.Thread(target=run, daemon=True)
+        self._refresher.start()
+
+    # Lookups
+    def country_currency(self, country_name, default='USD'):
+        """Primary currency code for a country name (case-insensitive)"""
+        codes = self.index.country_currencies.get((country_name or '').lower())
+        return codes[0] if codes else default
+
+    def is_valid_currency(self, currency_code):
+        return currency_code in self.index.valid_codes
+
+    def currency(self, currency_code):
+        return self.index.currencies.get(currency_code)
+
+    # Pre-serialized responses
+    def _json_response(self, body_and_etag, request):
+        body, etag = body_and_etag
+        response = Response(body, mimetype='application/json')
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'public, max-age=3600'
+        return response.make_conditional(request)
+
+    def countries_response(self, request):
+        return self._json_response(self.index.countries_json, request)
+
+    def currencies_response(self, request):
+        return self._json_response(self.index.currencies_json, request)
+
+
+# Initialize global reference data
+reference_data = ReferenceData()
@@ -0,0 +1,220 @@
+"""
+Approval Rule Engine for Expense Management System
+Compiles approval rules into an in-memory index and resolves approver chains
+"""
+
+import os
+import threading
+import time
+from decimal import Decimal
+
+from database import db
+from models import User, ApprovalRule, RuleStep
+
+DEFAULT_MIN_APPROVAL_PERCENTAGE = Decimal('100')
+
+
+class CompiledStep:
+    __slots__ = ('sequence_order', 'user_id', 'role_type', 'is_required')
+
+    def __init__(self, step):
+        self.sequence_order = step.sequence_order or 1
+        self.user_id = step.user_id
+        self.role_type = step.role_type.strip().lower() if step.role_type else None
+        self.is_required = bool(step.is_required_approver)
+
+
+class CompiledRule:
+    __slots__ = ('id', 'name', 'category', 'is_manager_first', 'is_sequential',
+                 'min_approval_percentage', 'steps')
+
+    def __init__(self, rule, steps):
+        self.id = rule.id
+        self.name = rule.name
+        self.category = rule.applies_to_category
+        self.is_manager_first = bool(rule.is_manager_first)
+        self.is_sequential = bool(rule.is_sequential)
+        self.min_approval_percentage = Decimal(str(
+            rule.min_approval_percentage if rule.min_approval_percentage is not None
+            else DEFAULT_MIN_APPROVAL_PERCENTAGE
+        ))
+        self.steps = tuple(sorted(steps, key=lambda s: s.sequence_order))
+
+
+class ApproverSlot:
+    """One approver in a resolved chain"""
+    __slots__ = ('user_id', 'step_order', 'is_required', 'rule_id')
+
+    def __init__(self, user_id, step_order, is_required, rule_id):
+        self.user_id = user_id
+        self.step_order = step_order
+        self.is_required = is_required
+        self.rule_id = rule_id
+
+    def to_dict(self):
+        return {'user_id': self.user_id, 'step_order': self.step_order,
+                'is_required': self.is_required, 'rule_id': self.rule_id}
+
+
+class ApprovalPlan:
+    """Approver chain for one expense, ordered by step"""
+
+    def __init__(self, rules, slots):
+        self.rule_ids = [rule.id for rule in rules]
+        self.slots = sorted(slots, key=lambda s: (s.step_order, s.user_id))
+        self.is_sequential = any(rule.is_sequential for rule in rules)
+        # With several matching rules the strictest quorum wins
+        self.min_approval_percentage = max(
+            (rule.min_approval_percentage for rule in rules), default=DEFAULT_MIN_APPROVAL_PERCENTAGE
+        )
+
+    def add_final_step(self, user_ids):
+        """Append a required step after the last one for ``user_ids`` not already in the chain"""
+        present = {slot.user_id for slot in self.slots}
+        step_order = max((slot.step_order for slot in self.slots), default=0) + 1
+        self.slots.extend(ApproverSlot(user_id, step_order, True, None) for user_id in user_ids
+                          if user_id not in present)
+
+    def to_dict(self):
+        return {
+            'rule_ids': self.rule_ids,
+            'is_sequential': self.is_sequential,
+            'min_approval_percentage': str(self.min_approval_percentage),
+            'approvers': [slot.to_dict() for slot in self.slots]
+        }
+
+
+class _RuleIndex:
+    def __init__(self, rules):
+        self.by_category = {}
+        self.has_role_steps = False
+        for rule in rules:
+            self.by_category.setdefault(rule.category, []).append(rule)
+            self.has_role_steps = self.has_role_steps or any(s.role_type for s in rule.steps)
+
+    def rules_for(self, category):
+        # Category-specific rules take precedence; NULL-category rules apply otherwise
+        return self.by_category.get(category) or self.by_category.get(None, [])
+
+
+class RuleEngine:
+    """Resolves approver chains from a compiled copy of the approval rules
+
+    The rule index is built with two queries and reused until a rule is
+    created, changed or deleted (``invalidate``). Role-based steps resolve
+    against a per-company role directory that is cached the same way and
+    dropped with ``invalidate_roles`` when users change. The TTL bounds
+    staleness when several worker processes each hold their own copy.
+    """
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl if ttl is not None else float(os.getenv('RULE_ENGINE_TTL', '300'))
+        self._index = None
+        self._loaded_at = 0.0
+        self._generation = 0
+        self._roles = {}
+        self._role_generations = {}
+        self._role_epoch = 0
+        self._lock = threading.Lock()
+
+    # Compiled rules
+    def _compile(self):
+        steps_by_rule = {}
+        for step in RuleStep.query.all():
+            steps_by_rule.setdefault(step.rule_id, []).append(CompiledStep(step))
+        rules = [CompiledRule(rule, steps_by_rule.get(rule.id, [])) for rule in ApprovalRule.query.all()]
+        return _RuleIndex(rules)
+
+    def index(self):
+        now = time.time()
+        with self._lock:
+            index, loaded_at, generation = self._index, self._loaded_at, self._generation
+        if index is not None and now - loaded_at < self.ttl:
+            return index
+
+        index = self._compile()
+        with self._lock:
+            # Don't keep an index built from rows read before an invalidation
+            if self._generation == generation:
+                self._index, self._loaded_at = index, now
+        return index
+
+    def invalidate(self):
+        """Drop the compiled rules; call after committing any rule change"""
+        with self._lock:
+            self._index = None
+            self._generation += 1
+
+    # Role directory
+    def _role_directory(self, company_id):
+        now = time.time()
+        with self._lock:
+            entry = self._roles.get(company_id)
+            generation = (self._role_epoch, self._role_generations.get(company_id, 0))
+        if entry is not None and now - entry[0] < self.ttl:
+            return entry[1]
+
+        directory = {}
+        rows = db.session.query(User.id, User.role).filter(User.company_id == company_id).order_by(User.id)
+        for user_id, role in rows:
+            directory.setdefault((role or '').lower(), []).append(user_id)
+        with self._lock:
+            if (self._role_epoch, self._role_generations.get(company_id, 0)) == generation:
+                self._roles[company_id] = (now, directory)
+        return directory
+
+    def users_with_role(self, company_id, role):
+        """Ids of the company's users with ``role``, from the cached role directory"""
+        return list(self._role_directory(company_id).get(role.lower(), ()))
+
+    def invalidate_roles(self, company_id=None):
+        """Drop cached role lookups for one company, or for all companies"""
+        with self._lock:
+            if company_id is None:
+                self._roles.clear()
+                self._role_epoch += 1
+            else:
+                self._roles.pop(company_id, None)
+                self._role_generations[company_id] = self._role_generations.get(company_id, 0) + 1
+
+    # Resolution
+    def resolve(self, expense, submitter):
+        """Build the approver chain for ``expense`` submitted by ``submitter``
+
+        Uses only the compiled index, the cached role directory and the
+        submitter's ``manager_id``; no queries once the caches are warm.
+        """
+        index = self.index()
+        rules = index.rules_for(expense.category)
+        slots = {}
+
+        def add(user_id, step_order, is_required, rule_id):
+            if not user_id or user_id == submitter.id:
+                return  # Nobody approves their own expense
+            slot = slots.get(user_id)
+            if slot is None:
+                slots[user_id] = ApproverSlot(user_id, step_order, is_required, rule_id)
+            else:
+                slot.step_order = min(slot.step_order, step_order)
+                slot.is_required = slot.is_required or is_required
+
+        if not rules:
+            # No applicable rules: the submitter's manager approves
+            add(submitter.manager_id, 1, True, None)
+            return ApprovalPlan([], slots.values())
+
+        directory = self._role_directory(submitter.company_id) if index.has_role_steps else {}
+        for rule in rules:
+            if rule.is_manager_first:
+                add(submitter.manager_id, 0, True, rule.id)
+            for step in rule.steps:
+                if step.user_id:
+                    add(step.user_id, step.sequence_order, step.is_required, rule.id)
+                elif step.role_type:
+                    for user_id in directory.get(step.role_type, ()):
+                        add(user_id, step.sequence_order, step.is_required, rule.id)
+        return ApprovalPlan(rules, slots.values())
+
+
+# Initialize global rule engine
+rule_engine = RuleEngine()
@@ -0,0 +1,202 @@
+"""
+Serializers for Expense Management System
+Declared per-model serializers over column-only selects, with a fast JSON backend
+"""
+
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from operator import attrgetter
+
+from flask import current_app
+from sqlalchemy import Numeric, Date, DateTime
+
+from models import User, Expense, ExpenseApproval, ApprovalRule, RuleStep, Budget
+
+try:
+    import orjson
+except ImportError:  # Optional; the stdlib encoder is used without it
+    orjson = None
+
+# Field subsets compiled by ``Serializer.only`` kept per serializer
+MAX_SUBSETS = 64
+
+
+def _decimal(value):
+    return str(value)
+
+
+def _isoformat(value):
+    return value.isoformat()
+
+
+def _receipt_url(receipt_id):
+    return f'/api/receipts/{receipt_id}'
+
+
+def _converter_for(column):
+    column_type = getattr(column, 'type', None)
+    if isinstance(column_type, Numeric):
+        return _decimal
+    if isinstance(column_type, (Date, DateTime)):
+        return _isoformat
+    return None
+
+
+def _compile(names, converters):
+    """Build ``dump(row)`` returning a dict literal with one expression per field
+
+    Converters are resolved when the serializer is declared, so dumping a
+    row does no per-value type checks: plain fields are copied by index and
+    converted fields are only called for non-None values.
+    """
+    namespace = {}
+    items = []
+    for index, (name, converter) in enumerate(zip(names, converters)):
+        if converter is None:
+            items.append(f'{name!r}: row[{index}]')
+        else:
+            namespace[f'c{index}'] = converter
+            items.append(f'{name!r}: None if row[{index}] is None else c{index}(row[{index}])')
+    exec(f'def dump(row):\n    return {{{", ".join(items)}}}\n', namespace)
+    return namespace['dump']
+
+
+class Serializer:
+    """Turns rows of ``select(*serializer.columns)`` into JSON-ready dicts
+
+    Fields map a name to a column, or to ``(column, converter)`` for a
+    derived value. Decimals become exact strings and dates ISO 8601
+    strings; ``None`` passes through. ``dump_object`` serializes ORM
+    instances with the same declarations.
+    """
+
+    def __init__(self, fields):
+        self.fields = {}
+        for name, spec in fields.items():
+            column, converter = spec if isinstance(spec, tuple) else (spec, _converter_for(spec))
+            self.fields[name] = (column, converter)
+        self.names = tuple(self.fields)
+        self.columns = tuple(column.label(name) for name, (column, _) in self.fields.items())
+        self.dump = _compile(self.names, [converter for _, converter in self.fields.values()])
+        keys = [column.key for column, _ in self.fields.values()]
+        getter = attrgetter(*keys)
+        self._getter = getter if len(keys) > 1 else (lambda obj: (getter(obj),))
+        self._subsets = {}
+
+    def only(self, names):
+        """Serializer for a subset of the fields, in declaration order; raises ValueError for unknown names
+
+        Requested names are deduplicated and put in declaration order before
+        the cache lookup, and at most ``MAX_SUBSETS`` subsets are kept, so
+        client-supplied field lists cannot grow the cache without bound.
+        """
+        wanted = set(names)
+        unknown = sorted(wanted.difference(self.fields))
+        if unknown:
+            raise ValueError(f'unknown field(s) {", ".join(unknown)}')
+        names = tuple(name for name in self.names if name in wanted)
+        subset = self._subsets.get(names)
+        if subset is None:
+            subset = Serializer({name: self.fields[name] for name in names})
+            if len(self._subsets) >= MAX_SUBSETS:
+                # Evict the oldest entry; dicts keep insertion order
+                self._subsets.pop(next(iter(self._subsets), None), None)
+            self._subsets[names] = subset
+        return subset
+
+    def extend(self, **fields):
+        """Serializer with extra fields, e.g. columns from a joined table"""
+        return Serializer({**self.fields, **fields})
+
+    def dump_all(self, rows):
+        dump = self.dump
+        return [dump(row) for row in rows]
+
+    def dump_object(self, obj):
+        return self.dump(self._getter(obj))
+
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+def dumps(payload):
+    """Encode ``payload`` as JSON bytes, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(payload, default=_default)
+    return json.dumps(payload, default=_default, separators=(',', ':')).encode('utf-8')
+
+
+def json_response(payload, status=200):
+    """Drop-in for ``jsonify`` on the list and report endpoints"""
+    return current_app.response_class(dumps(payload), status=status, mimetype='application/json')
+
+
+expense_serializer = Serializer({
+    'id': Expense.id,
+    'category': Expense.category,
+    'description': Expense.description,
+    'amount_spent': Expense.amount_spent,
+    'currency_spent': Expense.currency_spent,
+    'final_amount_base_currency': Expense.final_amount_base_currency,
+    'date': Expense.date,
+    'status': Expense.status,
+    'receipt_url': (Expense.receipt_id, _receipt_url),
+    'created_at': Expense.created_at,
+    'updated_at': Expense.updated_at
+})
+
+user_serializer = Serializer({
+    'id': User.id,
+    'name': User.name,
+    'email': User.email,
+    'role': User.role,
+    'company_id': User.company_id,
+    'manager_id': User.manager_id,
+    'created_at': User.created_at
+})
+
+approval_serializer = Serializer({
+    'id': ExpenseApproval.id,
+    'expense_id': ExpenseApproval.expense_id,
+    'approver_user_id': ExpenseApproval.approver_user_id,
+    'action': ExpenseApproval.action,
+    'comments': ExpenseApproval.comments,
+    'approval_date': ExpenseApproval.approval_date,
+    'created_at': ExpenseApproval.created_at
+})
+
+rule_serializer = Serializer({
+    'id': ApprovalRule.id,
+    'name': ApprovalRule.name,
+    'applies_to_category': ApprovalRule.applies_to_category,
+    'is_manager_first': ApprovalRule.is_manager_first,
+    'is_sequential': ApprovalRule.is_sequential,
+    'min_approval_percentage': ApprovalRule.min_approval_percentage,
+    'created_at': ApprovalRule.created_at
+})
+
+rule_step_serializer = Serializer({
+    'id': RuleStep.id,
+    'rule_id': RuleStep.rule_id,
+    'user_id': RuleStep.user_id,
+    'role_type': RuleStep.role_type,
+    'is_required_approver': RuleStep.is_required_approver,
+    'sequence_order': RuleStep.sequence_order
+})
+
+budget_serializer = Serializer({
+    'id': Budget.id,
+    'name': Budget.name,
+    'user_id': Budget.user_id,
+    'category': Budget.category,
+    'period': Budget.period,
+    'limit_amount': Budget.limit_amount,
+    'action': Budget.action,
+    'created_at': Budget.created_at
+})
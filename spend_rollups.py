@@ -0,0 +1,352 @@
+"""
+Spend Rollups for Expense Management System
+Pre-aggregated expense totals per company, user, category, currency, day and status for analytics queries
+"""
+
+from collections import defaultdict
+from decimal import Decimal
+
+from sqlalchemy import select, insert, delete, update, event, func, cast, inspect, String
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from database import db
+from models import User, Expense, SpendRollup
+
+# Expense attributes that place an expense in a rollup row or add to its totals
+TRACKED_ATTRIBUTES = ('user_id', 'category', 'currency_spent', 'date', 'status',
+                      'amount_spent', 'final_amount_base_currency')
+
+# Dimensions accepted by ``SpendRollupIndex.query`` ``group_by``
+GROUP_BY_DIMENSIONS = ('user', 'category', 'currency', 'status', 'day', 'month', 'year')
+
+MAX_GROUPS = 5000
+
+_KEY_COLUMNS = ('company_id', 'user_id', 'category', 'currency_spent', 'day', 'status')
+_CENT = Decimal('0.01')
+
+
+def _money(value):
+    """Round a stored or assigned amount the way ``Numeric(10, 2)`` stores it"""
+    if value is None:
+        return Decimal('0')
+    return Decimal(str(value)).quantize(_CENT)
+
+
+class SpendRollupIndex:
+    """Maintains and queries the ``spend_rollups`` table
+
+    One row per (company, user, category, currency, day, status) holds the
+    expense count and the summed amounts, so analytics over any date range
+    read a few thousand pre-aggregated rows instead of scanning expenses.
+
+    Rows are kept current by a ``before_flush`` hook that turns every ORM
+    insert, update and delete of an ``Expense`` into count/amount deltas and
+    applies them as upserts in the same transaction; the hook reads the
+    pre-change values from the database, so it does not depend on which
+    attributes happen to be loaded. Bulk Core writes call ``add_rows``
+    (import) or ``rebuild`` (FX revaluation) themselves. ``flask
+    rebuild-spend-rollups`` recomputes the table in one statement. All
+    methods leave the commit to the caller.
+
+    Other in-process aggregates (the budget counters) ``subscribe`` to the
+    same deltas, delivered only once the transaction that wrote them commits.
+    """
+
+    def __init__(self):
+        self._subscribers = []
+
+    # Change notifications
+    def subscribe(self, callback):
+        """Call ``callback(deltas, rebuilt)`` after every commit that changed the rollups
+
+        ``deltas`` is a list of ``{key: [count, amount_spent, amount_base]}``
+        dicts keyed like the rollup rows; ``rebuilt`` is the set of company
+        ids re-aggregated wholesale, containing None when every company was.
+        """
+        self._subscribers.append(callback)
+
+    def _record(self, session, deltas=None, rebuilt=()):
+        if not self._subscribers:
+            return
+        if deltas:
+            session.info.setdefault('spend_rollup_deltas', []).append(dict(deltas))
+        for company_id in rebuilt:
+            session.info.setdefault('spend_rollup_rebuilt', set()).add(company_id)
+
+    def _publish(self, session, committed):
+        deltas = session.info.pop('spend_rollup_deltas', [])
+        rebuilt = session.info.pop('spend_rollup_rebuilt', set())
+        if not committed or not (deltas or rebuilt):
+            return
+        for callback in self._subscribers:
+            try:
+                callback(deltas, rebuilt)
+            except Exception as e:
+                print(f"❌ Spend rollup subscriber error: {e}")
+
+    # Maintenance
+    def _dialect_insert(self, connection):
+        name = connection.dialect.name
+        if name == 'postgresql':
+            return postgresql.insert(SpendRollup)
+        if name == 'sqlite':
+            return sqlite.insert(SpendRollup)
+        return None
+
+    def apply(self, connection, deltas):
+        """Add ``{key: [count, amount_spent, amount_base]}`` deltas to their rollup rows"""
+        deltas = {key: delta for key, delta in deltas.items() if any(delta)}
+        if not deltas:
+            return
+        rows = [
+            dict(zip(_KEY_COLUMNS, key), expense_count=count, amount_spent=spent, amount_base=base)
+            for key, (count, spent, base) in deltas.items()
+        ]
+
+        stmt = self._dialect_insert(connection)
+        if stmt is not None:
+            stmt = stmt.values(rows)
+            connection.execute(stmt.on_conflict_do_update(
+                index_elements=list(_KEY_COLUMNS),
+                set_={
+                    'expense_count': SpendRollup.expense_count + stmt.excluded.expense_count,
+                    'amount_spent': SpendRollup.amount_spent + stmt.excluded.amount_spent,
+                    'amount_base': SpendRollup.amount_base + stmt.excluded.amount_base
+                }
+            ))
+        else:
+            for row in rows:
+                result = connection.execute(
+                    update(SpendRollup)
+                    .where(*[getattr(SpendRollup, column) == row[column] for column in _KEY_COLUMNS])
+                    .values(
+                        expense_count=SpendRollup.expense_count + row['expense_count'],
+                        amount_spent=SpendRollup.amount_spent + row['amount_spent'],
+                        amount_base=SpendRollup.amount_base + row['amount_base']
+                    )
+                )
+                if result.rowcount == 0:
+                    connection.execute(insert(SpendRollup).values(row))
+
+        # Drop rows whose last expense moved out, using the (company_id, day) index
+        emptied = {(row['company_id'], row['day']) for row in rows if row['expense_count'] < 0}
+        if emptied:
+            connection.execute(delete(SpendRollup).where(
+                SpendRollup.expense_count <= 0,
+                SpendRollup.company_id.in_({company_id for company_id, _ in emptied}),
+                SpendRollup.day.in_({day for _, day in emptied})
+            ))
+
+    def add_rows(self, company_id, rows):
+        """Count freshly bulk-inserted expense value dicts (as passed to ``insert(Expense)``)"""
+        deltas = defaultdict(lambda: [0, Decimal('0'), Decimal('0')])
+        for row in rows:
+            delta = deltas[(company_id, row['user_id'], row['category'], row['currency_spent'],
+                            row['date'], row.get('status') or 'Draft')]
+            delta[0] += 1
+            delta[1] += _money(row['amount_spent'])
+            delta[2] += _money(row.get('final_amount_base_currency'))
+        self.apply(db.session.connection(), deltas)
+        self._record(db.session, deltas)
+
+    def rebuild(self, company_id=None):
+        """Recompute the table (or one company's rows) from ``expenses``; returns the row count"""
+        source = (
+            select(
+                User.company_id, Expense.user_id, Expense.category, Expense.currency_spent,
+                Expense.date, Expense.status, func.count(Expense.id),
+                func.sum(Expense.amount_spent),
+                func.coalesce(func.sum(Expense.final_amount_base_currency), 0)
+            )
+            .join(User, Expense.user_id == User.id)
+            .group_by(User.company_id, Expense.user_id, Expense.category, Expense.currency_spent,
+                      Expense.date, Expense.status)
+        )
+        cleanup = delete(SpendRollup)
+        count = select(func.count()).select_from(SpendRollup)
+        if company_id is not None:
+            source = source.where(User.company_id == company_id)
+            cleanup = cleanup.where(SpendRollup.company_id == company_id)
+            count = count.where(SpendRollup.company_id == company_id)
+
+        db.session.execute(cleanup, execution_options={'synchronize_session': False})
+        db.session.execute(insert(SpendRollup).from_select(
+            [*_KEY_COLUMNS, 'expense_count', 'amount_spent', 'amount_base'], source
+        ))
+        self._record(db.session, rebuilt=[company_id])
+        return db.session.execute(count).scalar()
+
+    def _flush_deltas(self, session):
+        """Deltas for the pending ORM changes to expenses, read before they are written"""
+        new = [obj for obj in session.new if isinstance(obj, Expense)]
+        deleted = [obj for obj in session.deleted if isinstance(obj, Expense)]
+        changed = []
+        for obj in session.dirty:
+            if isinstance(obj, Expense) and obj not in session.deleted:
+                state = inspect(obj)
+                if any(state.attrs[key].history.has_changes() for key in TRACKED_ATTRIBUTES):
+                    changed.append(obj)
+        if not (new or deleted or changed):
+            return None
+
+        connection = session.connection()
+        deltas = defaultdict(lambda: [0, Decimal('0'), Decimal('0')])
+
+        def add(values, sign):
+            delta = deltas[(values['company_id'], values['user_id'], values['category'],
+                            values['currency_spent'], values['date'], values['status'] or 'Draft')]
+            delta[0] += sign
+            delta[1] += sign * _money(values['amount_spent'])
+            delta[2] += sign * _money(values['final_amount_base_currency'])
+
+        # Current database values of the updated and deleted rows, with their company
+        stored = {}
+        persisted = [inspect(obj).identity[0] for obj in changed + deleted if inspect(obj).identity]
+        if persisted:
+            columns = [getattr(Expense, key) for key in TRACKED_ATTRIBUTES]
+            for row in connection.execute(
+                select(Expense.id, User.company_id, *columns)
+                .join(User, Expense.user_id == User.id)
+                .where(Expense.id.in_(persisted))
+            ):
+                stored[row.id] = row._asdict()
+
+        # Values the flush is about to write
+        pending = []
+        for obj in new:
+            state = inspect(obj)
+            pending.append({key: state.dict.get(key) for key in TRACKED_ATTRIBUTES})
+        for obj in changed:
+            old = stored.get(inspect(obj).identity[0])
+            if old is None:
+                continue
+            values = dict(old)
+            state = inspect(obj)
+            for key in TRACKED_ATTRIBUTES:
+                added = state.attrs[key].history.added
+                if added:
+                    values[key] = added[0]
+            if values['user_id'] != old['user_id']:
+                values['company_id'] = None
+            pending.append(values)
+            add(old, -1)
+        for obj in deleted:
+            old = stored.get(inspect(obj).identity[0])
+            if old is not None:
+                add(old, -1)
+
+        unresolved = {values['user_id'] for values in pending if values.get('company_id') is None}
+        companies = {}
+        if unresolved:
+            companies = dict(connection.execute(
+                select(User.id, User.company_id).where(User.id.in_(unresolved))
+            ).all())
+        for values in pending:
+            if values.get('company_id') is None:
+                values['company_id'] = companies.get(values['user_id'])
+            add(values, 1)
+        return connection, deltas
+
+    # Queries
+    def period_label(self, grain):
+        """Label expression truncating ``day`` to 'YYYY-MM' or 'YYYY'"""
+        dialect = db.session.get_bind().dialect.name
+        if dialect == 'postgresql':
+            return func.to_char(SpendRollup.day, 'YYYY-MM' if grain == 'month' else 'YYYY')
+        if dialect == 'sqlite':
+            return func.strftime('%Y-%m' if grain == 'month' else '%Y', SpendRollup.day)
+        return func.substr(cast(SpendRollup.day, String), 1, 7 if grain == 'month' else 4)
+
+    def query(self, company_id, group_by, start_date=None, end_date=None, user_ids=None,
+              statuses=None, categories=None):
+        """Totals grouped by ``group_by`` dimensions, read from the rollup rows
+
+        ``user_ids`` is a list or a subquery limiting whose expenses count.
+        ``amount_spent`` is only returned when grouping by currency, since it
+        cannot be summed across currencies. Raises ValueError for unknown
+        dimensions. Returns ``(groups, totals, truncated)``.
+        """
+        unknown = [name for name in group_by if name not in GROUP_BY_DIMENSIONS]
+        if unknown:
+            raise ValueError(f'unknown group_by dimension(s) {", ".join(unknown)}')
+
+        dimensions = {
+            'user': [SpendRollup.user_id.label('user_id'), User.name.label('user_name')],
+            'category': [SpendRollup.category.label('category')],
+            'currency': [SpendRollup.currency_spent.label('currency')],
+            'status': [SpendRollup.status.label('status')],
+            'day': [SpendRollup.day.label('day')],
+            'month': [self.period_label('month').label('month')],
+            'year': [self.period_label('year').label('year')]
+        }
+        keys = [column for name in group_by for column in dimensions[name]]
+
+        conditions = [SpendRollup.company_id == company_id]
+        if start_date:
+            conditions.append(SpendRollup.day >= start_date)
+        if end_date:
+            conditions.append(SpendRollup.day <= end_date)
+        if user_ids is not None:
+            conditions.append(SpendRollup.user_id.in_(user_ids))
+        if statuses:
+            conditions.append(SpendRollup.status.in_(statuses))
+        if categories:
+            conditions.append(SpendRollup.category.in_(categories))
+
+        measures = [
+            func.sum(SpendRollup.expense_count).label('count'),
+            func.sum(SpendRollup.amount_base).label('amount')
+        ]
+        if 'currency' in group_by:
+            measures.append(func.sum(SpendRollup.amount_spent).label('amount_spent'))
+
+        query = select(*keys, *measures).where(*conditions)
+        if 'user' in group_by:
+            query = query.join(User, SpendRollup.user_id == User.id)
+        if keys:
+            query = query.group_by(*keys).order_by(*keys)
+        query = query.having(func.sum(SpendRollup.expense_count) > 0)
+
+        groups = []
+        totals = {'count': 0, 'amount': Decimal('0')}
+        truncated = False
+        for row in db.session.execute(query.limit(MAX_GROUPS + 1)):
+            if len(groups) == MAX_GROUPS:
+                truncated = True
+                break
+            group = row._asdict()
+            group['amount'] = _money(group['amount'])
+            if 'amount_spent' in group:
+                group['amount_spent'] = _money(group['amount_spent'])
+            groups.append(group)
+            totals['count'] += group['count']
+            totals['amount'] += group['amount']
+
+        if truncated:
+            row = db.session.execute(select(*measures[:2]).where(*conditions)).one()
+            totals = {'count': row.count or 0, 'amount': _money(row.amount)}
+        return groups, totals, truncated
+
+
+# Initialize global spend rollup index
+spend_rollups = SpendRollupIndex()
+
+
+@event.listens_for(Session, 'before_flush')
+def _apply_expense_changes(session, flush_context, instances):
+    result = spend_rollups._flush_deltas(session)
+    if result is not None:
+        connection, deltas = result
+        spend_rollups.apply(connection, deltas)
+        spend_rollups._record(session, deltas)
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_committed(session):
+    spend_rollups._publish(session, committed=True)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_rolled_back(session):
+    spend_rollups._publish(session, committed=False)